@@ -1,29 +1,48 @@
 from flask import Flask, render_template, redirect, url_for, flash, request, abort, session,send_file, make_response, jsonify
 from flask_login import LoginManager, login_user, login_required, current_user, logout_user
 from flask_wtf import CSRFProtect 
+from flask_wtf.csrf import CSRFError, generate_csrf
 from functools import wraps
 import bcrypt, os
-import uuid, traceback
+import uuid, traceback, gzip
+import re, shutil
+import click
 from forms import LoginForm 
 
 from datetime import date, datetime,timedelta
 from config import Config
-from models import db, Product, Sale, User, PriceChange, LogEntry, Shift
+from models import db, Product, Sale, User, PriceChange, Shift, DailySalesRollup, ProductBarcode, StockMovement, StockSnapshot
+import sales_rollup
+import catalog_cache
+import duplicate_detection
+import csv_export
+import sales_history
+import query_profiler
+import shift_state
+import startup
+import barcodes
+import checkout
+import product_search
+import stock
 from forms import AddStockForm, RecordSaleForm, NewUserForm, ResetPwdForm, EditProductForm, EditSaleForm, BatchInventoryForm
-from rapidfuzz import fuzz
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import subprocess
 
-from sqlalchemy import func, cast, Date, inspect, text
+from sqlalchemy import cast, Date, text
 from sqlalchemy.exc import SQLAlchemyError
-import pandas as pd
 from io import StringIO
 from io import BytesIO
 from flask_migrate import Migrate
+from werkzeug.utils import secure_filename
 from batch_inventory_routes import batch_inventory_bp
-
-# import weasyprint
+import jobs
+import audit
+import audit_history
+import inventory_valuation
+import pdf_reports
+import schema_caps
+import sale_sync
+import stock_ledger
 
 
 app = Flask(__name__)
@@ -38,36 +57,25 @@ limiter.init_app(app)
 
 # Register blueprints
 app.register_blueprint(batch_inventory_bp)
+app.register_blueprint(jobs.jobs_bp)
 
 db.init_app(app)
 migrate = Migrate(app, db)
+query_profiler.init_app(app)
 
 def log(action, details):
-    db.session.add(
-        LogEntry(user=current_user.username,
-                 action=action,
-                 details=details))
-    db.session.commit()
+    # durable actions join the caller's transaction; the rest are queued (audit.py)
+    audit.record(action, details)
 
 # --- database setup -------------------------------------------------------
-# Flask 3.0 removed the before_first_request decorator. We now create the
-# tables once at startup, inside an application context.
+# Flask 3.0 removed the before_first_request decorator. Tables (when
+# migrations haven't created them) and the first manager are set up once
+# at startup, inside an application context; see startup.py.
 with app.app_context():
-    db.create_all()
-
-
+    startup.init_database(app, db)
 
-    # --- one-time bootstrap ------------------------------------------------
-    if not User.query.filter_by(role='manager').first():
-        default_user = os.getenv('DEFAULT_ADMIN_USER', 'admin')
-        default_pass = os.getenv('DEFAULT_ADMIN_PASS', 'changeme123')
-
-        User.create(default_user, default_pass, 'manager')
-        app.logger.warning(
-            f'*** Created default manager '
-            f'username={default_user} password={default_pass} ***'
-        )
-    # ----------------------------------------------------------------------
+# Commit / environment shown in the footer, resolved once per worker
+BUILD_META = startup.build_metadata()
 
 @app.route('/')
 @login_required
@@ -85,11 +93,9 @@ def dashboard():
     low_stock = []
     top_sales = []
 
-    # 1) Products and valuation
+    # 1) Valuation from the worker's catalog cache
     try:
-        products = Product.query.all()
-        total_cost = sum(p.qty_at_hand * p.cost_price for p in products)
-        total_value = sum(p.qty_at_hand * p.selling_price for p in products)
+        total_cost, total_value = catalog_cache.get_catalog().valuation()
         total_profit = total_value - total_cost
     except Exception:
         try:
@@ -97,63 +103,25 @@ def dashboard():
         except Exception:
             pass
 
-    # 2) Store totals today
+    # 2) Store totals today (from the daily rollup, not raw sales)
     today = date.today()
     try:
-        today_row = (
-            db.session.query(
-                db.func.coalesce(
-                    db.func.sum(
-                        Sale.qty_sold * db.func.coalesce(Sale.unit_price, Product.selling_price)
-                    ),
-                    0.0,
-                ).label('rev'),
-                db.func.coalesce(db.func.sum(Sale.qty_sold), 0).label('units'),
-            )
-            .join(Product)
-            .filter(Sale.date == today)
-            .first()
-        )
-        today_rev = float(today_row[0] or 0.0)
-        today_units = int(today_row[1] or 0)
+        today_rev, today_units = sales_rollup.totals_for_day(today)
     except Exception:
         try:
             db.session.rollback()
         except Exception:
             pass
 
-    # 3) Cashier personal totals today (only if column exists)
+    # 3) Cashier personal totals today
     if current_user.is_authenticated and current_user.role == 'cashier':
-        has_cashier_col = False
         try:
-            cols = [c['name'] for c in inspect(db.engine).get_columns('sale')]
-            has_cashier_col = 'cashier_id' in cols
+            my_today_rev, my_today_units = sales_rollup.totals_for_day(today, cashier_id=current_user.id)
         except Exception:
-            has_cashier_col = False
-        if has_cashier_col:
             try:
-                my_row = (
-                    db.session.query(
-                        db.func.coalesce(
-                            db.func.sum(
-                                Sale.qty_sold * db.func.coalesce(Sale.unit_price, Product.selling_price)
-                            ),
-                            0.0,
-                        ).label('rev'),
-                        db.func.coalesce(db.func.sum(Sale.qty_sold), 0).label('units'),
-                    )
-                    .join(Product)
-                    .filter(Sale.date == today)
-                    .filter(Sale.cashier_id == current_user.id)
-                    .first()
-                )
-                my_today_rev = float((my_row[0] or 0.0))
-                my_today_units = int((my_row[1] or 0))
+                db.session.rollback()
             except Exception:
-                try:
-                    db.session.rollback()
-                except Exception:
-                    pass
+                pass
 
     # 4) Low stock list
     try:
@@ -172,14 +140,7 @@ def dashboard():
 
     # 5) Top sellers
     try:
-        top_sales = (
-            db.session.query(Product.name, db.func.sum(Sale.qty_sold).label('units'))
-            .join(Sale)
-            .group_by(Product.name)
-            .order_by(db.desc('units'))
-            .limit(5)
-            .all()
-        )
+        top_sales = sales_rollup.top_sellers(limit=5)
     except Exception:
         try:
             db.session.rollback()
@@ -195,6 +156,12 @@ def ping():
     # keepalive endpoint to prevent session timeouts during rapid entry
     return ('', 204)
 
+@app.route('/csrf-token')
+@login_required
+def csrf_token():
+    # the till's offline queue outlives the page's token (static/sale_queue.js)
+    return jsonify(csrf_token=generate_csrf())
+
 @app.route('/favicon.ico')
 def favicon_redirect():
     # serve svg favicon when browser requests .ico path
@@ -220,17 +187,13 @@ def add_stock():
 
     # 2️⃣  ***GET branch*** — needed for the Select2 dropdown
     if request.method == 'GET':                         # ← add this block
-        all_names = [p.name for p in Product.query.order_by(Product.name)]
+        all_names = catalog_cache.get_catalog().names()
         return render_template('add_stock.html', form=form, all_names=all_names)
 
     # 3️⃣  POST branch (your current code) -------------------------------
     if form.validate_on_submit():
-        similar = None
-        for prod in Product.query.all():
-            score = fuzz.token_set_ratio(form.name.data.lower(), prod.name.lower())
-            if score > 85:
-                similar = prod.name
-                break
+        matches = duplicate_detection.find_similar(form.name.data, limit=3)
+        similar = matches[0].name if matches else None
 
         if similar:
             clean_data = form.data.copy()
@@ -238,9 +201,11 @@ def add_stock():
                 clean_data['expiry_date'] = clean_data['expiry_date'].isoformat()  # Convert to string
             session['pending_product'] = clean_data  # Stash cleaned form data
 
+            others = ', '.join(f'“{m.name}”' for m in matches[1:])
             flash(
-                f'Product “{similar}” looks similar. '
-                'Click Confirm to restock it or Cancel to go back.',
+                f'Product “{similar}” looks similar ({matches[0].score:.0f}%). '
+                + (f'Also similar: {others}. ' if others else '')
+                + 'Click Confirm to restock it or Cancel to go back.',
                 'warning'
             )
             return redirect(url_for('confirm_add'))
@@ -248,8 +213,7 @@ def add_stock():
         # → no similar found or user confirmed duplication
         p = Product.query.filter_by(name=form.name.data).first()
         if p:  # restock existing
-            p.qty_at_hand += form.quantity.data
-            p.initial_qty += form.quantity.data
+            stock.restock(p.id, form.quantity.data)
             p.cost_price = form.cost_price.data
             p.selling_price = form.selling_price.data
             p.expiry_date = form.expiry_date.data
@@ -266,6 +230,7 @@ def add_stock():
                 safety_stock=form.safety_stock.data
             )
             db.session.add(p)
+            stock.opening(p, form.quantity.data)
         db.session.commit()
         flash('Stock updated!', 'success')
         return redirect(url_for('dashboard'))
@@ -279,23 +244,10 @@ def add_stock():
 def search_products():
     search_term = request.args.get('q', '').lower()
     in_stock = request.args.get('in_stock', 'true') == 'true'
-    
-    # Base query
-    query = Product.query
-    
-    # Filter in-stock items if requested
-    if in_stock:
-        query = query.filter(Product.qty_at_hand > 0)
-    
-    # Search by name or category
-    if search_term:
-        query = query.filter(
-            (func.lower(Product.name).contains(search_term)) | 
-            (func.lower(Product.category).contains(search_term)))
-    
-    # Limit results and format for Select2
-    products = query.order_by(Product.name).limit(20).all()
-    
+
+    # Indexed name/category search with prefix, typo tolerance and ranking (Select2 fires per keystroke)
+    products = product_search.search(search_term, in_stock=in_stock, limit=20)
+
     results = [{
         'id': p.id,
         'text': f"{p.name} ({p.category}) - Stock: {p.qty_at_hand}",
@@ -313,7 +265,7 @@ def product_stock(pid):
     """Return current stock, list price, and cost for a single product.
     Used by Record Sale UI for hints and below-cost warnings (Story 1).
     """
-    p = Product.query.get(pid)
+    p = catalog_cache.get_catalog().get(pid)
     if not p:
         return jsonify(success=False, error='not_found'), 404
     return jsonify(success=True,
@@ -321,6 +273,51 @@ def product_stock(pid):
                    price=float(p.selling_price or 0.0),
                    cost=float(p.cost_price or 0.0))
 
+@app.route('/catalog-snapshot')
+@login_required
+def catalog_snapshot():
+    """Columnar catalog for the till to search locally (static/catalog.js).
+
+    ``?since=<version>`` returns only products changed after that version;
+    a full snapshot comes back whenever a delta cannot be trusted.
+    """
+    since = request.args.get('since', type=int)
+    body = catalog_cache.changes_since(since) if since is not None else None
+    gzipped = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if body is None:
+        snap = catalog_cache.get_catalog()
+        etag = f'catalog-{snap.version}'
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
+        body = snap.payload(compressed=gzipped)
+    else:
+        etag = None
+        if gzipped:
+            body = gzip.compress(body, compresslevel=6)
+    resp = make_response(body)
+    resp.mimetype = 'application/json'
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    if gzipped:
+        resp.headers['Content-Encoding'] = 'gzip'
+    if etag:
+        resp.set_etag(etag)
+    return resp
+
+@app.route('/scan/<path:code>')
+@login_required
+def scan_barcode(code):
+    """Resolve a scanned barcode/SKU to the product (one indexed lookup)."""
+    row = barcodes.lookup(code)
+    if row is None:
+        return jsonify(success=False, error='not_found', code=barcodes.normalize(code)), 404
+    return jsonify(success=True,
+                   id=row.id,
+                   name=row.name,
+                   price=float(row.selling_price or 0.0),
+                   cost=float(row.cost_price or 0.0),
+                   stock=row.qty_at_hand)
+
 @app.route('/record-sale', methods=['GET', 'POST'])
 @login_required
 def record_sale():
@@ -337,6 +334,11 @@ def record_sale():
                 pass
 
     if form.validate_on_submit():
+        client_key = form.client_key.data if sale_sync.valid_key(form.client_key.data) else None
+        if client_key and sale_sync.recorded([client_key]):
+            flash('Sale already recorded.', 'info')
+            return redirect(url_for('record_sale', date=form.sale_date.data.isoformat() if form.sale_date.data else None))
+
         # Get product from ID instead of form choices
         product = Product.query.get(form.product_id.data)
         
@@ -354,48 +356,58 @@ def record_sale():
             if effective < float(product.cost_price or 0):
                 if current_user.role != 'manager':
                     # Block for cashiers; audit attempt
-                    db.session.add(LogEntry(
-                        user=current_user.username,
-                        action='below_cost_attempt_blocked',
-                        details=f"Attempted {form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{effective:.2f} (< cost {app.config['CURRENCY_SYMBOL']}{product.cost_price:.2f})"
-                    ))
+                    audit.record(
+                        'below_cost_attempt_blocked',
+                        f"Attempted {form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{effective:.2f} (< cost {app.config['CURRENCY_SYMBOL']}{product.cost_price:.2f})",
+                        product_id=product.id, amount=effective
+                    )
                     db.session.commit()
                     flash('Price below cost is not allowed. Please ask a manager.', 'danger')
                     return redirect(url_for('record_sale', date=form.sale_date.data.isoformat() if form.sale_date.data else None))
                 else:
                     # Allow for managers but audit override
-                    db.session.add(LogEntry(
-                        user=current_user.username,
-                        action='below_cost_override',
-                        details=f"Manager approved {form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{effective:.2f} (< cost {app.config['CURRENCY_SYMBOL']}{product.cost_price:.2f})"
-                    ))
-
-            # Proceed to record sale
-            product.qty_at_hand -= form.quantity.data
+                    audit.record(
+                        'below_cost_override',
+                        f"Manager approved {form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{effective:.2f} (< cost {app.config['CURRENCY_SYMBOL']}{product.cost_price:.2f})",
+                        product_id=product.id, amount=effective
+                    )
+
             sale = Sale(
                 product_id=product.id,
                 qty_sold=form.quantity.data,
                 date=form.sale_date.data,
                 unit_price=alt_price if alt_price else None,
+                client_key=client_key,
             )
-            # Set cashier only if DB has the column (handles rolling migrations safely)
+            # Proceed to record sale; the conditional decrement is the real stock check
             try:
-                cols = [c['name'] for c in inspect(db.engine).get_columns('sale')]
-                if 'cashier_id' in cols:
-                    sale.cashier_id = current_user.id
-            except Exception:
-                pass
+                stock.take(product.id, form.quantity.data, ref=sale)
+            except stock.OutOfStock:
+                db.session.rollback()
+                flash('Not enough stock!', 'danger')
+                return redirect(url_for('record_sale', date=form.sale_date.data.isoformat() if form.sale_date.data else None))
+            # Set cashier only if DB has the column (handles rolling migrations safely)
+            if schema_caps.has_column('sale', 'cashier_id'):
+                sale.cashier_id = current_user.id
+            shift = shift_state.current().shift
+            if shift is not None:
+                sale.shift_id = shift.id
             db.session.add(sale)
+            sales_rollup.add_sale(sale)
+            shift_state.add_sale(sale, product)
 
-            # Audit if an alternate price was used
+            # Audit if an alternate price was used (queued, so recorded once the sale is committed)
+            alt_audit = None
             if alt_price and float(alt_price) != float(product.selling_price or 0):
-                db.session.add(LogEntry(
-                    user=current_user.username,
-                    action='sale_alt_price',
-                    details=f"{form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{alt_price:.2f} (list {app.config['CURRENCY_SYMBOL']}{product.selling_price:.2f})"
-                ))
+                db.session.flush()          # assigns sale.id
+                alt_audit = dict(
+                    details=f"{form.quantity.data} × {product.name} at {app.config['CURRENCY_SYMBOL']}{alt_price:.2f} (list {app.config['CURRENCY_SYMBOL']}{product.selling_price:.2f})",
+                    product_id=product.id, sale_id=sale.id, amount=float(alt_price)
+                )
 
             db.session.commit()
+            if alt_audit:
+                audit.record('sale_alt_price', **alt_audit)
             if alt_price:
                 flash('Sale recorded with alternate price.', 'success')
             else:
@@ -406,6 +418,37 @@ def record_sale():
     return render_template('record_sale.html', form=form, currency=app.config['CURRENCY_SYMBOL'], today=date.today().isoformat())
 
 
+@app.route('/record-sale/checkout', methods=['POST'])
+@login_required
+def checkout_basket():
+    """Record a whole basket: JSON ``{sale_date, lines: [{product_id, quantity, unit_price, key}]}``."""
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = checkout.checkout(data.get('lines'), data.get('sale_date'))
+    except checkout.CheckoutError as e:
+        return jsonify(success=False, errors=e.errors, message=str(e)), 400
+    cur = app.config['CURRENCY_SYMBOL']
+    return jsonify(success=True,
+                   message=f"Sold {summary['total_qty']} item(s) in {summary['lines']} line(s) "
+                           f"for {cur}{summary['total']:.2f}.",
+                   **summary)
+
+
+@app.route('/record-sale/sync', methods=['POST'])
+@login_required
+def sync_sales():
+    """Record sales queued offline: JSON ``{sales: [{key, product_id, quantity, unit_price, sale_date, user_id}]}``.
+
+    Safe to resend; each result says ``recorded``, ``duplicate`` or ``rejected``.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        summary = sale_sync.sync(data.get('sales'))
+    except sale_sync.SyncError as e:
+        return jsonify(success=False, message=str(e)), 400
+    return jsonify(success=True, **summary)
+
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -489,8 +532,7 @@ def confirm_add():
 
             p = Product.query.filter_by(name=form_data['name']).first()
             if p:
-                p.qty_at_hand += int(form_data['quantity'])
-                p.initial_qty += int(form_data['quantity'])
+                stock.restock(p.id, int(form_data['quantity']))
                 if expiry_val:
                     p.expiry_date = expiry_val
             else:
@@ -504,6 +546,7 @@ def confirm_add():
                     qty_at_hand=int(form_data['quantity']),
                 )
                 db.session.add(p)
+                stock.opening(p, int(form_data['quantity']))
 
             db.session.commit()
             flash('Stock updated!', 'success')
@@ -584,7 +627,7 @@ def products():
     
     # Apply search filter
     if search_query:
-        query = query.filter(Product.name.ilike(f'%{search_query}%'))
+        query = query.filter(product_search.filter_clause(search_query))
     
     # Apply sorting
     sort_field = {
@@ -626,15 +669,25 @@ def edit_product(pid):
                 new_price=form.selling_price.data,
                 changed_by=current_user.username
             ))
-            log('price-change', f'{p.name}: {p.selling_price} ➜ {form.selling_price.data}')
+            audit.record('price-change', f'{p.name}: {p.selling_price} ➜ {form.selling_price.data}',
+                         product_id=p.id, amount=float(form.selling_price.data))
 
-        # ② apply the edits
+        # ② apply the edits (codes live in their own table)
+        try:
+            barcodes.set_codes(p, barcodes.split_codes(form.barcodes.data))
+        except barcodes.BarcodeError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return render_template('edit_product.html', form=form)
+        del form.barcodes
         form.populate_obj(p)
         db.session.commit()
 
         flash('Product updated', 'success')
         return redirect(url_for('products'))
 
+    if request.method == 'GET':
+        form.barcodes.data = ', '.join(bc.code for bc in p.codes)
     return render_template('edit_product.html', form=form)
 
 
@@ -684,18 +737,18 @@ def update_product_qty(pid):
         flash('No change applied.', 'info')
         return redirect(url_for('products', sort=sort, order=order, search=search, page=page))
 
-    old_qty = int(p.qty_at_hand or 0)
-    new_qty = old_qty + delta
-    if new_qty < 0:
+    try:
+        new_qty = stock.adjust(p.id, delta)
+    except stock.OutOfStock:
+        db.session.rollback()
         flash('Resulting quantity cannot be negative.', 'danger')
         return redirect(url_for('products', sort=sort, order=order, search=search, page=page))
-
-    p.qty_at_hand = new_qty
-    db.session.add(LogEntry(
-        user=current_user.username,
-        action='adjust_stock',
-        details=f"{p.name}: {old_qty} {'+' if delta >= 0 else ''}{delta} → {new_qty}"
-    ))
+    old_qty = new_qty - delta
+    audit.record(
+        'adjust_stock',
+        f"{p.name}: {old_qty} {'+' if delta >= 0 else ''}{delta} → {new_qty}",
+        product_id=p.id
+    )
     db.session.commit()
     flash('Inventory updated', 'success')
     return redirect(url_for('products', sort=sort, order=order, search=search, page=page))
@@ -704,39 +757,45 @@ def update_product_qty(pid):
 @login_required          # add @manager_required if only managers may browse
 def sales_list():
     #
-    # ── 1. read ?date=YYYY-MM-DD, default = today ───────────────────────
+    # ── 1. filters: ?date= (single day, default today) or ?start=&end=,
+    #       plus cashier / product / category; keyset-paged on (date, id)
     #
-    sel = request.args.get('date') or date.today().isoformat()
-    order = (request.args.get('order') or 'asc').lower()
-    if order not in ('asc','desc'):
-        order = 'asc'
     try:
-        sel_date = datetime.strptime(sel, "%Y-%m-%d").date()
-    except ValueError:
+        filters = sales_history.SalesFilter.from_args(request.args, default_order='asc')
+        sales, next_cursor = sales_history.page(filters, request.args.get('cursor'))
+    except sales_history.BadFilter:
         abort(400)   # bad format
 
-    #
-    # ── 2. fetch that day’s sales + product info ────────────────────────
-    #
-    sale_id_order = Sale.id.asc() if order == 'asc' else Sale.id.desc()
-    day_sales = (
-        db.session.query(Sale, Product)
-        .join(Product)
-        .filter(func.date(Sale.date) == sel_date)   # cast to DATE if Sale.date is DateTime
-        .order_by(sale_id_order)
-        .all()
-    )
-
-
+    snap = catalog_cache.get_catalog()
+    product = snap.get(filters.product_id) if filters.product_id else None
     return render_template(
         "sales.html",
-        sales=day_sales,
-        sel_date=sel_date,
+        sales=sales,
+        filters=filters,
+        filter_args=filters.as_args(),
+        next_cursor=next_cursor,
+        paged=bool(request.args.get('cursor')),
+        cashiers=User.query.order_by(User.username).all(),
+        categories=sorted({it.category for it in snap.items.values() if it.category}),
+        product=product,
         today=date.today(),        # now Jinja can call today.isoformat()
-        order=order
     )
 
 
+@app.route('/sales/data')
+@login_required
+def sales_data():
+    """JSON page of sales; same filters as /sales, follow ``next_cursor``."""
+    try:
+        filters = sales_history.SalesFilter.from_args(request.args)
+        rows, next_cursor = sales_history.page(filters, request.args.get('cursor'))
+    except sales_history.BadFilter as e:
+        return jsonify(success=False, error=str(e)), 400
+    return jsonify(success=True,
+                   items=[sales_history.row_payload(r) for r in rows],
+                   next_cursor=next_cursor)
+
+
 @app.route('/sale/<int:sid>/edit', methods=['GET','POST'])
 @login_required
 def edit_sale(sid):
@@ -752,45 +811,59 @@ def edit_sale(sid):
         # Below-cost guard (still enforced for cashiers)
         if float(new_effective or 0) < float(sale.product.cost_price or 0):
             if current_user.role != 'manager':
-                db.session.add(LogEntry(
-                    user=current_user.username,
-                    action='below_cost_attempt_blocked',
-                    details=f"Attempted edit sale #{sale.id} {sale.product.name} @ {app.config['CURRENCY_SYMBOL']}{float(new_effective):.2f} (< cost {app.config['CURRENCY_SYMBOL']}{sale.product.cost_price:.2f})"
-                ))
+                audit.record(
+                    'below_cost_attempt_blocked',
+                    f"Attempted edit sale #{sale.id} {sale.product.name} @ {app.config['CURRENCY_SYMBOL']}{float(new_effective):.2f} (< cost {app.config['CURRENCY_SYMBOL']}{sale.product.cost_price:.2f})",
+                    product_id=sale.product_id, sale_id=sale.id, amount=float(new_effective)
+                )
                 db.session.commit()
                 flash('Below-cost price is not allowed. Ask a manager.', 'danger')
                 return render_template('edit_sale.html', form=form, sale=sale, currency=app.config['CURRENCY_SYMBOL'])
             else:
-                db.session.add(LogEntry(
-                    user=current_user.username,
-                    action='below_cost_override',
-                    details=f"Manager approved edit sale #{sale.id} {sale.product.name} @ {app.config['CURRENCY_SYMBOL']}{float(new_effective):.2f} (< cost {app.config['CURRENCY_SYMBOL']}{sale.product.cost_price:.2f})"
-                ))
+                audit.record(
+                    'below_cost_override',
+                    f"Manager approved edit sale #{sale.id} {sale.product.name} @ {app.config['CURRENCY_SYMBOL']}{float(new_effective):.2f} (< cost {app.config['CURRENCY_SYMBOL']}{sale.product.cost_price:.2f})",
+                    product_id=sale.product_id, sale_id=sale.id, amount=float(new_effective)
+                )
+
+        # Take the old figures out of the daily rollup and shift totals; re-added below
+        sales_rollup.remove_sale(sale)
+        shift_state.remove_sale(sale)
 
         # Adjust inventory based on quantity diff
         diff = new_qty - sale.qty_sold
         if diff != 0:
-            db.session.add(LogEntry(
-                user=current_user.username,
-                action='edit_sale_qty',
-                details=f"Sale #{sale.id} {sale.product.name}: qty {sale.qty_sold} → {new_qty}"
-            ))
+            audit.record(
+                'edit_sale_qty',
+                f"Sale #{sale.id} {sale.product.name}: qty {sale.qty_sold} → {new_qty}",
+                product_id=sale.product_id, sale_id=sale.id
+            )
+        if diff > 0:
+            try:
+                stock.take(sale.product_id, diff, reason='sale_edit', ref=sale.id)
+            except stock.OutOfStock:
+                db.session.rollback()
+                flash('Not enough stock!', 'danger')
+                return render_template('edit_sale.html', form=form, sale=sale, currency=app.config['CURRENCY_SYMBOL'])
+        elif diff < 0:
+            stock.give_back(sale.product_id, -diff, reason='sale_edit', ref=sale.id)
         sale.qty_sold = new_qty
-        sale.product.qty_at_hand -= diff
 
         # Determine old effective unit price
         old_effective = sale.unit_price if sale.unit_price is not None else sale.product.selling_price
 
         # Apply price change
         sale.unit_price = new_unit_price
+        sales_rollup.add_sale(sale)
+        shift_state.add_sale(sale, sale.product)
 
         # Audit if price changed
         if float(new_effective or 0) != float(old_effective or 0):
-            db.session.add(LogEntry(
-                user=current_user.username,
-                action='edit_sale_price',
-                details=f"Sale #{sale.id} {sale.product.name}: {app.config['CURRENCY_SYMBOL']}{old_effective:.2f} → {app.config['CURRENCY_SYMBOL']}{float(new_effective or 0):.2f}"
-            ))
+            audit.record(
+                'edit_sale_price',
+                f"Sale #{sale.id} {sale.product.name}: {app.config['CURRENCY_SYMBOL']}{old_effective:.2f} → {app.config['CURRENCY_SYMBOL']}{float(new_effective or 0):.2f}",
+                product_id=sale.product_id, sale_id=sale.id, amount=float(new_effective or 0)
+            )
 
         db.session.commit()
         # Role-specific success message
@@ -811,17 +884,19 @@ def void_sale(sid):
     sale = Sale.query.get_or_404(sid)
     
     # 1. Return stock to inventory
-    sale.product.qty_at_hand += sale.qty_sold
+    stock.give_back(sale.product_id, sale.qty_sold, ref=sale.id)
     
     # 2. Create audit log entry
-    db.session.add(LogEntry(
-        user=current_user.username,
-        action='void_sale',
-        details=f'{sale.qty_sold} × {sale.product.name} (sale #{sale.id})'
-    ))
+    audit.record(
+        'void_sale',
+        f'{sale.qty_sold} × {sale.product.name} (sale #{sale.id})',
+        product_id=sale.product_id, sale_id=sale.id, amount=round(shift_state.sale_revenue(sale), 2)
+    )
     
     sale_date = sale.date  # save before deleting
-    # 3. Delete sale record
+    # 3. Delete sale record and its rollup / shift-total contribution
+    sales_rollup.remove_sale(sale)
+    shift_state.remove_sale(sale)
     db.session.delete(sale)
     db.session.commit()
     
@@ -837,7 +912,7 @@ def void_sale(sid):
 @app.route('/shift/open')
 @login_required
 def open_shift():
-    if Shift.query.filter_by(cashier_id=current_user.id, closed_at=None).first():
+    if shift_state.current().shift:
         flash('Shift already open', 'warning')
     else:
         db.session.add(Shift(cashier_id=current_user.id))
@@ -850,16 +925,12 @@ def open_shift():
 @app.route('/shift/close', methods=['POST'])
 @login_required
 def close_shift():
-    shift = Shift.query.filter_by(cashier_id=current_user.id, closed_at=None).first()
+    shift = shift_state.current().shift
     if not shift:
         abort(400)
-    qty, rev = (db.session.query(db.func.sum(Sale.qty_sold),
-                                 db.func.sum(Sale.qty_sold*Product.selling_price))
-                .join(Product)
-                .filter(Sale.date >= shift.opened_at.date())
-                .first())
-    shift.total_qty = qty or 0
-    shift.total_rev = rev or 0.0
+    db.session.refresh(shift)       # pick up counters bumped by other workers
+    shift.total_qty = shift.sales_qty or 0
+    shift.total_rev = round(shift.sales_rev or 0.0, 2)
     shift.closed_at = datetime.utcnow()
     db.session.commit()
     log('shift-close', f"{current_user.username} qty={shift.total_qty} rev={shift.total_rev}")
@@ -872,25 +943,60 @@ def close_shift():
 @login_required
 @manager_required
 def logs():
-    logs = LogEntry.query.order_by(LogEntry.timestamp.desc()).limit(200).all()
-    return render_template('logs.html', logs=logs)
+    #
+    # filters: ?action= ?user= ?product_id= ?sale_id= ?start=&end=,
+    # keyset-paged newest first on (timestamp, id); see audit_history.py
+    #
+    try:
+        filters = audit_history.LogFilter.from_args(request.args)
+        audit.flush()               # include this worker's queued entries
+        entries, next_cursor = audit_history.page(filters, request.args.get('cursor'))
+    except audit_history.BadFilter:
+        abort(400)
+    noise = None
+    if filters.action in audit.NOISE_ACTIONS or filters.action is None:
+        noise = audit.noise_counts(filters.start, filters.end,
+                                   (filters.action,) if filters.action else audit.NOISE_ACTIONS)
+    return render_template(
+        'logs.html',
+        logs=entries,
+        filters=filters,
+        filter_args=filters.as_args(),
+        next_cursor=next_cursor,
+        paged=bool(request.args.get('cursor')),
+        actions=audit.ACTIONS,
+        users=[u.username for u in User.query.order_by(User.username)],
+        product=catalog_cache.get_catalog().get(filters.product_id) if filters.product_id else None,
+        noise=noise,
+        noise_days=app.config['AUDIT_NOISE_DAYS'],
+        today=date.today(),
+        currency=app.config['CURRENCY_SYMBOL'],
+    )
+
+
+@app.route('/admin/queries')
+@login_required
+@manager_required
+def query_stats():
+    hours = request.args.get('hours', 24, type=int)
+    order = request.args.get('order', 'sql_ms')
+    if order not in query_profiler.REPORT_ORDERS:
+        order = 'sql_ms'
+    query_profiler.flush()          # include this worker's unflushed requests
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return render_template('query_stats.html',
+                           endpoints=query_profiler.endpoint_summary(since, order),
+                           slow=query_profiler.recent_slow(since),
+                           hours=hours, order=order,
+                           orders=query_profiler.REPORT_ORDERS,
+                           slow_ms=app.config['SLOW_QUERY_MS'],
+                           enabled=app.config['SQL_PROFILER'])
 
 
 # Version metadata injected to templates (Story 3)
 @app.context_processor
 def inject_app_meta():
-    def _git_sha_short():
-        try:
-            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).decode().strip()
-        except Exception:
-            return None
-    sha_env = os.getenv('RENDER_GIT_COMMIT') or os.getenv('GIT_COMMIT')
-    sha = sha_env or _git_sha_short()
-    version_short = (sha[:7] if sha else 'dev')
-    env = os.getenv('APP_ENV', 'Development')
-    env_title = (env.title() if env else 'Development')
-    owner_email = app.config.get('ERROR_REPORT_EMAIL_TO')
-    return dict(app_version=version_short, app_env=env_title, owner_email=owner_email)
+    return dict(BUILD_META, owner_email=app.config.get('ERROR_REPORT_EMAIL_TO'))
 
 
 @app.errorhandler(429)
@@ -898,39 +1004,38 @@ def ratelimit_exceeded(e):
     # Friendly rate-limit page; applies mainly to login route
     retry_after = getattr(e, 'retry_after', None)
     err_id = uuid.uuid4().hex[:8].upper()
+    # queued, not committed: a client hammering the limiter must not turn into DB writes
     try:
-        db.session.add(LogEntry(
-            user=(current_user.username if current_user.is_authenticated else 'anon'),
-            action='http_429',
-            details=f"id={err_id} path={request.path} ip={request.remote_addr} ua={request.user_agent.string}"
-        ))
-        db.session.commit()
+        audit.record('http_429',
+                     f"id={err_id} path={request.path} ip={request.remote_addr} ua={request.user_agent.string}")
     except Exception:
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
+        pass
     return render_template('429.html', retry_after=retry_after, error_id=err_id), 429
 
 
+@app.errorhandler(CSRFError)
+def csrf_error(e):
+    # JSON callers are told the token is stale so they can fetch a new one and retry
+    if request.is_json:
+        return jsonify(success=False, csrf_expired=True, message=e.description), 400
+    return e
+
 @app.errorhandler(500)
 def internal_error(e):
     err_id = uuid.uuid4().hex[:8].upper()
     tb = ''.join(traceback.format_exception(None, e, e.__traceback__))
     # Sanitize/truncate traceback
     tb_short = (tb[:2000] + '…') if len(tb) > 2000 else tb
+    # the failed request's session may be unusable; the queued entry is written separately
     try:
-        db.session.add(LogEntry(
-            user=(current_user.username if current_user.is_authenticated else 'anon'),
-            action='server_error',
-            details=f"id={err_id} path={request.path} method={request.method} ua={request.user_agent.string}\n{tb_short}"
-        ))
-        db.session.commit()
+        db.session.rollback()
     except Exception:
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
+        pass
+    try:
+        audit.record('server_error',
+                     f"id={err_id} path={request.path} method={request.method} ua={request.user_agent.string}\n{tb_short}")
+    except Exception:
+        pass
     return render_template('500.html', error_id=err_id), 500
 
 
@@ -951,74 +1056,52 @@ def logout():
     return redirect(url_for('login'))
 
 @app.context_processor
-def inject_open_shift():
+def inject_shift_state():
+    # Navbar badge for cashiers: one cached lookup, totals read from the shift row
     if current_user.is_authenticated and current_user.role == 'cashier':
-        open_shift = Shift.query.filter_by(cashier_id=current_user.id,
-                                           closed_at=None).first()
+        shift, qty, rev = shift_state.current()
     else:
-        open_shift = None
-    return dict(open_shift=open_shift)
-
-
-@app.context_processor
-def inject_shift_totals():
-    if current_user.is_authenticated and current_user.role == 'cashier':
-        shift = Shift.query.filter_by(cashier_id=current_user.id, closed_at=None).first()
-        if shift:
-            qty, rev = (
-                db.session.query(db.func.sum(Sale.qty_sold),
-                                 db.func.sum(Sale.qty_sold * Product.selling_price))
-                .join(Product)
-                .filter(Sale.date >= shift.opened_at.date())
-                .first()
-            )
-        else:
-            qty = rev = None
-    else:
-        shift = qty = rev = None
-    return dict(open_shift=shift, shift_qty=qty or 0, shift_rev=rev or 0.0)
+        shift, qty, rev = None, 0, 0.0
+    return dict(open_shift=shift, shift_qty=qty, shift_rev=rev)
 
 DATE_FMT = "%Y-%m-%d"
 def _aggregate_sales_range(start: date, end: date):
     """Return list[dict] bucketed by *day* between start and end (inclusive)."""
-    rows = (
-        db.session.query(
-            Sale.date.label("bucket"),
-            func.sum(Sale.qty_sold).label("qty"),
-            func.sum(
-                Sale.qty_sold *
-                func.coalesce(Sale.unit_price, Product.selling_price)
-            ).label("rev"),
-            func.sum(Sale.qty_sold * Product.cost_price).label("cost")
-        )
-        .join(Product)
-        .filter(Sale.date.between(start, end))
-        .group_by(Sale.date)
-        .order_by(Sale.date)
-        .all()
-    )
+    rows = sales_rollup.daily_range(start, end)
     return [dict(bucket=r.bucket, qty=r.qty, rev=float(r.rev), cost=float(r.cost))
             for r in rows]
 
 def _sales_between(start: date, end: date):
     """Return list[dict] bucketed by day within [start, end]."""
-    rows = (
-        db.session.query(
-            Sale.date.label("bucket"),
-            func.sum(Sale.qty_sold).label("qty"),
-            func.sum(
-                Sale.qty_sold *
-                func.coalesce(Sale.unit_price, Product.selling_price)
-            ).label("rev"),
-            func.sum(Sale.qty_sold * Product.cost_price).label("cost"))
-        .join(Product)
-        .filter(Sale.date.between(start, end))
-        .group_by("bucket")
-        .order_by("bucket")
-        .all()
-    )
-    return [dict(bucket=r.bucket, qty=r.qty,
-                 rev=float(r.rev), cost=float(r.cost)) for r in rows]
+    return _aggregate_sales_range(start, end)
+
+
+def _sales_summary_view(start: date, end: date, breakdown: str):
+    """Return (gp_data, view_rows, chart_labels, chart_values) for the report."""
+    # Aggregate once per day inside the range
+    rows = _aggregate_sales_range(start, end)                # list of dicts
+    gp_data = [{
+        **r,
+        "gp": r["rev"] - r["cost"]
+    } for r in rows]
+
+    # Derive view-specific tables / charts
+    if breakdown == "category":
+        view_rows = sales_rollup.by_category(start, end)
+        chart_labels = [c or 'Uncategorized' for c, _ in view_rows]
+        chart_values = [float(r or 0) for _, r in view_rows]
+
+    elif breakdown == "product":
+        view_rows = sales_rollup.by_product(start, end, limit=50)
+        chart_labels = [n for n, _, _ in view_rows][:10]
+        chart_values = [float(r or 0) for _, _, r in view_rows][:10]
+
+    else:                                          # summary
+        view_rows    = gp_data
+        chart_labels = [r["bucket"] for r in gp_data]
+        chart_values = [r["rev"]   for r in gp_data]
+
+    return gp_data, view_rows, chart_labels, chart_values
 
 
 @app.route("/reports/sales-summary")
@@ -1041,69 +1124,40 @@ def sales_summary():
 
     # ── 2. Other query-string controls  ────────────────────────────────
     breakdown = request.args.get("breakdown", "summary")     # summary|category|product
-    export    = request.args.get("export")                   # csv|xlsx
-
-    # ── 3. Aggregate once per day inside the range  ────────────────────
-    rows = _aggregate_sales_range(start, end)                # list of dicts
-    gp_data = [{
-        **r,
-        "gp": r["rev"] - r["cost"]
-    } for r in rows]
-
-    # ── 4. Derive view-specific tables / charts  ───────────────────────
-    if breakdown == "category":
-        view_rows = (
-            db.session.query(
-                Product.category,
-                func.sum(
-                    Sale.qty_sold * func.coalesce(Sale.unit_price, Product.selling_price)
-                ).label("rev")
-            )
-            .join(Product)
-            .filter(Sale.date.between(start, end))
-            .group_by(Product.category)
-            .all()
-        )
-        chart_labels = [c or 'Uncategorized' for c, _ in view_rows]
-        chart_values = [float(r or 0) for _, r in view_rows]
-
-    elif breakdown == "product":
-        view_rows = (
-            db.session.query(
-                Product.name,
-                func.sum(Sale.qty_sold).label("qty"),
-                func.sum(
-                    Sale.qty_sold * func.coalesce(Sale.unit_price, Product.selling_price)
-                ).label("rev"),
-            )
-            .join(Product)
-            .filter(Sale.date.between(start, end))
-            .group_by(Product.name)
-            .order_by(
-                func.sum(
-                    Sale.qty_sold * func.coalesce(Sale.unit_price, Product.selling_price)
-                ).desc()
-            )
-            .limit(50)
-            .all()
-        )
-        chart_labels = [n for n, _, _ in view_rows][:10]
-        chart_values = [float(r or 0) for _, _, r in view_rows][:10]
+    export    = request.args.get("export")                   # csv|xlsx|pdf
+
+    # PDFs are always rendered by a background job (pdf_reports.py); an
+    # unchanged report is served from the cache without queueing anything
+    if export == "pdf":
+        key = _sales_summary_pdf_key(start, end, breakdown)
+        if pdf_reports.cached(key):
+            return jsonify(status="done", download_url=url_for(
+                "sales_summary_pdf", key=key, start=start.isoformat(), end=end.isoformat(),
+                breakdown=breakdown))
+        job = jobs.submit("sales_summary_pdf", {
+            "start": start.isoformat(), "end": end.isoformat(), "breakdown": breakdown,
+        }, user_id=current_user.id)
+        return jsonify(jobs.status_payload(job)), 202
+
+    # Large exports: hand off to a background job, the page polls for the file
+    if export in ("csv", "xlsx") and request.args.get("background"):
+        job = jobs.submit("sales_summary_export", {
+            "start": start.isoformat(), "end": end.isoformat(),
+            "breakdown": breakdown, "format": export,
+        }, user_id=current_user.id)
+        return jsonify(jobs.status_payload(job)), 202
+
+    # ── 3. CSV export streams straight from the rollup  ───────────────
+    if export == "csv":
+        header, rows = csv_export.sales_summary(start, end, breakdown)
+        return csv_export.csv_response(f"sales_{breakdown}_{start}_{end}.csv", header, rows)
 
-    else:                                          # summary
-        view_rows    = gp_data
-        chart_labels = [r["bucket"] for r in gp_data]
-        chart_values = [r["rev"]   for r in gp_data]
+    # ── 4. Daily rows plus the view-specific table / chart  ────────────
+    gp_data, view_rows, chart_labels, chart_values = _sales_summary_view(start, end, breakdown)
 
-    # ── 5. CSV/XLSX export (same range & breakdown)  ───────────────────
-    if export == "csv":
-        df = pd.DataFrame(view_rows)
-        filename = f"sales_{breakdown}_{start}_{end}.csv"
-        return send_file(BytesIO(df.to_csv(index=False).encode()),
-                         "text/csv",
-                         download_name=filename,
-                         as_attachment=True)
+    # ── 5. XLSX export (same range & breakdown)  ───────────────────────
     if export == "xlsx":
+        import pandas as pd          # deferred: only XLSX exports need it
         df = pd.DataFrame(view_rows)
         xbuf = BytesIO()
         df.to_excel(xbuf, index=False)
@@ -1127,24 +1181,151 @@ def sales_summary():
     )
 
 
+@jobs.handler("sales_summary_export")
+def _run_sales_summary_export(ctx, params):
+    start = date.fromisoformat(params["start"])
+    end = date.fromisoformat(params["end"])
+    breakdown, fmt = params["breakdown"], params["format"]
+    ctx.progress(0, 1, "Aggregating sales")
+    filename = f"sales_{breakdown}_{start}_{end}.{fmt}"
+    if fmt == "xlsx":
+        _, view_rows, _, _ = _sales_summary_view(start, end, breakdown)
+        import pandas as pd          # deferred: only XLSX exports need it
+        df = pd.DataFrame(view_rows)
+        df.to_excel(ctx.artifact(filename,
+                                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+                    index=False)
+        count = len(df)
+    else:
+        header, rows = csv_export.sales_summary(start, end, breakdown)
+        count = csv_export.write_csv(ctx.artifact(filename, "text/csv"), header, rows)
+    ctx.progress(1, 1)
+    return {"rows": count}
+
+
+def _sales_summary_pdf_context(start, end, breakdown):
+    gp_data, view_rows, _, _ = _sales_summary_view(start, end, breakdown)
+    rows = [list(r) for r in view_rows] if breakdown in ("category", "product") else []
+    return dict(start=start, end=end, breakdown=breakdown, data=gp_data, rows=rows,
+                period="daily", currency=app.config["CURRENCY_SYMBOL"])
+
+
+def _sales_summary_pdf_key(start, end, breakdown, context=None):
+    """Cache key: the range, the breakdown and every figure the PDF shows."""
+    context = context or _sales_summary_pdf_context(start, end, breakdown)
+    return pdf_reports.cache_key("sales_summary", start, end, breakdown, context["currency"],
+                                 context["data"], context["rows"])
+
+
+def _sales_summary_pdf_name(start, end, breakdown):
+    return f"sales_{breakdown}_{start}_{end}.pdf"
+
+
+@jobs.handler("sales_summary_pdf")
+def _run_sales_summary_pdf(ctx, params):
+    start = date.fromisoformat(params["start"])
+    end = date.fromisoformat(params["end"])
+    breakdown = params["breakdown"]
+    ctx.progress(0, 2, "Aggregating sales")
+    context = _sales_summary_pdf_context(start, end, breakdown)
+    key = _sales_summary_pdf_key(start, end, breakdown, context)
+    if not pdf_reports.cached(key):
+        # standalone template; the page context processors need a logged-in request
+        html = app.jinja_env.get_template("sales_summary_pdf.html").render(**context)
+        ctx.progress(1, 2, "Rendering PDF")
+        pdf_reports.render(html, key)
+    target = ctx.artifact(_sales_summary_pdf_name(start, end, breakdown), "application/pdf")
+    try:
+        os.link(pdf_reports.cache_path(key), target)
+    except OSError:
+        shutil.copyfile(pdf_reports.cache_path(key), target)
+    ctx.progress(2, 2)
+    return {"key": key, "bytes": os.path.getsize(target)}
+
+
+@app.route("/reports/sales-summary/pdf/<key>")
+@login_required
+@manager_required
+def sales_summary_pdf(key):
+    """Download an already-rendered sales summary PDF from the cache."""
+    path = pdf_reports.cached(key) if re.fullmatch(r"[0-9a-f]{32}", key) else None
+    if not path:
+        abort(404)
+    name = _sales_summary_pdf_name(request.args.get("start", ""), request.args.get("end", ""),
+                                   request.args.get("breakdown", "summary"))
+    return send_file(path, "application/pdf", download_name=secure_filename(name), as_attachment=True)
+
+
 @app.route('/reports/inventory')
 @login_required 
 @manager_required
 def inventory_report():
-    items = (
-        db.session.query(Product,
-                         (Product.qty_at_hand*Product.cost_price).label('cost_val'),
-                         (Product.qty_at_hand*Product.selling_price).label('sell_val'))
-        .order_by(Product.name)
-        .all())
-    totals = {
-        'cost':  sum(r.cost_val  for r in items),
-        'sell':  sum(r.sell_val for r in items),
-    }
+    # totals are one grouped SQL aggregate; rows are keyset-paged (inventory_valuation.py)
+    try:
+        filters = inventory_valuation.ReportFilter.from_args(request.args)
+        view = inventory_valuation.view_for(filters.as_of)
+        rows, next_cursor = inventory_valuation.page(filters, request.args.get('cursor'), view)
+    except inventory_valuation.BadFilter:
+        abort(400)
+    snap = catalog_cache.get_catalog()
     return render_template('inventory_report.html',
-                           items=items, totals=totals,
+                           items=rows,
+                           totals=inventory_valuation.totals(filters.category, view),
+                           by_category=inventory_valuation.by_category(view),
+                           closed_on=view.closed_on,
+                           today=date.today(),
+                           filters=filters,
+                           filter_args=filters.as_args(),
+                           next_cursor=next_cursor,
+                           paged=bool(request.args.get('cursor')),
+                           categories=sorted({it.category for it in snap.items.values() if it.category}),
                            currency=app.config['CURRENCY_SYMBOL'])
 
+
+@app.route('/reports/inventory/data')
+@login_required
+@manager_required
+def inventory_report_data():
+    """JSON page of the valuation report; same args as the page, follow ``next_cursor``."""
+    try:
+        filters = inventory_valuation.ReportFilter.from_args(request.args)
+        view = inventory_valuation.view_for(filters.as_of)
+        rows, next_cursor = inventory_valuation.page(filters, request.args.get('cursor'), view)
+    except inventory_valuation.BadFilter as e:
+        return jsonify(success=False, error=str(e)), 400
+    return jsonify(success=True,
+                   as_of=filters.as_of.isoformat() if filters.as_of else None,
+                   totals=inventory_valuation.totals(filters.category, view),
+                   categories=inventory_valuation.by_category(view),
+                   items=[inventory_valuation.row_payload(r) for r in rows],
+                   next_cursor=next_cursor)
+
+@app.route('/reports/stock-movements')
+@login_required
+@manager_required
+def stock_movements():
+    # ledger rows oldest first, keyset-paged on (timestamp, id); see stock_ledger.py
+    try:
+        filters = stock_ledger.MovementFilter.from_args(request.args)
+        rows, next_cursor = stock_ledger.page(filters, request.args.get('cursor'))
+    except stock_ledger.BadFilter:
+        abort(400)
+    snap = catalog_cache.get_catalog()
+    user_ids = {m.user_id for m in rows if m.user_id}
+    return render_template('stock_movements.html',
+                           movements=rows,
+                           balances=stock_ledger.balances(filters),
+                           filters=filters,
+                           filter_args=filters.as_args(),
+                           next_cursor=next_cursor,
+                           paged=bool(request.args.get('cursor')),
+                           reasons=stock.REASONS,
+                           catalog=snap,
+                           product=snap.get(filters.product_id) if filters.product_id else None,
+                           usernames=dict(db.session.query(User.id, User.username)
+                                          .filter(User.id.in_(user_ids))) if user_ids else {},
+                           today=date.today())
+
 # ────────────────────────────────────────────────────────────────
 # Settings – admin only
 # ────────────────────────────────────────────────────────────────
@@ -1156,39 +1337,6 @@ class ResetAllForm(FlaskForm):
     submit = SubmitField('RESET ALL')
 
 
-def _inventory_dataframe():
-    data = [{
-        'id': p.id,
-        'name': p.name,
-        'category': p.category,
-        'expiry_date': p.expiry_date,
-        'cost_price': p.cost_price,
-        'selling_price': p.selling_price,
-        'initial_qty': p.initial_qty,
-        'qty_at_hand': p.qty_at_hand,
-        'safety_stock': p.safety_stock,
-    } for p in Product.query.order_by(Product.name)]
-    return pd.DataFrame(data)
-
-
-def _sales_dataframe():
-    rows = (
-        db.session.query(Sale, Product.name)
-        .join(Product)
-        .order_by(Sale.date.desc())
-        .all()
-    )
-    data = [{
-        'id': s.id,
-        'product_id': s.product_id,
-        'product_name': name,
-        'date': s.date,
-        'qty_sold': s.qty_sold,
-        'unit_price': s.unit_price or s.product.selling_price,
-    } for s, name in rows]
-    return pd.DataFrame(data)
-
-
 @app.route('/settings')
 @login_required
 @manager_required
@@ -1202,21 +1350,24 @@ def settings():
 @manager_required
 
 def download_data(kind):
-    if kind == 'inventory':
-        df = _inventory_dataframe()
-        filename = 'inventory_backup.csv'
-    elif kind == 'sales':
-        df = _sales_dataframe()
-        filename = 'sales_backup.csv'
-    else:
+    if kind not in ('inventory', 'sales'):
         abort(404)
+    if request.args.get('background'):
+        job = jobs.submit('data_backup', {'kind': kind}, user_id=current_user.id)
+        return jsonify(jobs.status_payload(job)), 202
+
+    header, rows = csv_export.backup(kind)
+    return csv_export.csv_response(f'{kind}_backup.csv', header, rows)
 
-    return send_file(
-        BytesIO(df.to_csv(index=False).encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=filename,
-    )
+
+@jobs.handler('data_backup')
+def _run_data_backup(ctx, params):
+    kind = params['kind']
+    ctx.progress(0, 1, f'Exporting {kind}')
+    header, rows = csv_export.backup(kind)
+    count = csv_export.write_csv(ctx.artifact(f'{kind}_backup.csv', 'text/csv'), header, rows)
+    ctx.progress(1, 1)
+    return {'rows': count}
 
 
 @app.route('/settings/reset', methods=['POST'])
@@ -1233,16 +1384,21 @@ def reset_all():
 
     # perform destructive wipe inside transaction
     try:
+        DailySalesRollup.query.delete()
         n_sales = Sale.query.delete()
         PriceChange.query.delete()
         Shift.query.delete()
+        shift_state.invalidate()
+        ProductBarcode.query.delete()
+        StockSnapshot.query.delete()
+        StockMovement.query.delete()
         n_products = Product.query.delete()
+        catalog_cache.touch(reset=True)
 
-        db.session.add(LogEntry(
-            user=current_user.username,
-            action='reset_all',
-            details=f'removed {n_products} products and {n_sales} sales'
-        ))
+        audit.record(
+            'reset_all',
+            f'removed {n_products} products and {n_sales} sales'
+        )
         db.session.commit()
         flash('All sales and inventory data have been cleared.', 'warning')
     except Exception as e:
@@ -1251,7 +1407,60 @@ def reset_all():
         flash('Reset failed: ' + str(e), 'danger')
     return redirect(url_for('dashboard'))
 
- 
+
+# ────────────────────────────────────────────────────────────────
+# CLI – maintenance commands
+# ────────────────────────────────────────────────────────────────
+
+@app.cli.command('rebuild-sales-rollup')
+@click.option('--start', help='First day to rebuild (YYYY-MM-DD); default: all history')
+@click.option('--end', help='Last day to rebuild (YYYY-MM-DD); default: all history')
+def rebuild_sales_rollup(start, end):
+    """Backfill/repair the daily sales rollup from raw sales."""
+    try:
+        start_d = datetime.strptime(start, DATE_FMT).date() if start else None
+        end_d = datetime.strptime(end, DATE_FMT).date() if end else None
+    except ValueError:
+        raise click.BadParameter('dates must be YYYY-MM-DD')
+    n = sales_rollup.rebuild(start_d, end_d)
+    db.session.commit()
+    click.echo(f'Rebuilt {n} daily sales rollup rows.')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create the product search index if missing and re-index all products."""
+    product_search.install(db.engine)
+    kind = product_search.rebuild()
+    db.session.commit()
+    click.echo(f'Product search backend: {kind}.')
+
+
+@app.cli.command('compact-audit-log')
+@click.option('--days', type=int, help='Keep full entries this many days (default AUDIT_NOISE_DAYS)')
+def compact_audit_log(days):
+    """Fold old 429 / server-error audit entries into daily counters."""
+    n = audit.compact(days)
+    click.echo(f'Compacted {n} audit entries into daily counters.')
+
+
+@app.cli.command('snapshot-stock')
+@click.option('--date', 'day', help='Also (re)take a snapshot for this day (YYYY-MM-DD)')
+def snapshot_stock(day):
+    """Take missing month-end stock snapshots (run daily or monthly from cron)."""
+    for taken in stock_ledger.ensure_snapshots():
+        click.echo(f'Snapshot for {taken.isoformat()}')
+    if day:
+        n = stock_ledger.take_snapshot(date.fromisoformat(day))
+        click.echo(f'Snapshot for {day}: {n} products')
+
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help='Drain the queue once and exit')
+def run_jobs(once):
+    """Run queued background jobs (use with JOB_RUNNER=external)."""
+    jobs.run_pending(app, once=once)
+
  
 if __name__ == '__main__':
     # Ensure tables exist when running via `python app.py` as well
@@ -0,0 +1,254 @@
+"""Audit-log sink.
+
+``record(action, details)`` decides how an entry reaches ``log_entry``:
+
+* **durable** actions (``DURABLE_ACTIONS`` – below-cost guards, voids,
+  stock and price edits, resets) are added to the caller's session, so they
+  commit atomically with the change they describe and cost no commit of
+  their own;
+* everything else (alternate-price notes, shift open/close, 429 and 500
+  notices) goes into an in-process queue that a daemon thread writes with
+  one bulk INSERT every ``AUDIT_FLUSH_SECONDS``, or as soon as
+  ``AUDIT_BATCH_SIZE`` entries are waiting.
+
+The queue is bounded by ``AUDIT_MAX_PENDING``. When a flood (a client
+hammering the rate limiter, say) fills it, further entries are only counted
+and a single ``audit_dropped`` summary is written with the next batch, so
+abuse cannot turn into database load. Entries keep the time they were
+recorded, a failed write is put back for the next attempt, and the queue is
+flushed at interpreter exit; a hard kill loses at most one interval of
+non-durable entries.
+
+Entries carry optional structured fields (``product_id``, ``sale_id``,
+``amount``) next to the human-readable ``details``, so the audit trail can
+be filtered on indexes (see audit_history.py). :func:`compact` keeps the
+table small by folding old ``NOISE_ACTIONS`` rows into daily
+``audit_counter`` totals; the flush thread runs it every
+``AUDIT_COMPACT_HOURS``.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app, g, has_request_context
+from flask_login import current_user
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, LogEntry, AuditCounter
+
+logger = logging.getLogger(__name__)
+
+# every action written to log_entry, with the label the audit trail filter shows
+ACTIONS = {
+    'sale_alt_price': 'Alternate-price sale',
+    'below_cost_attempt_blocked': 'Below-cost attempt blocked',
+    'below_cost_override': 'Below-cost override',
+    'edit_sale_qty': 'Sale quantity edited',
+    'edit_sale_price': 'Sale price edited',
+    'void_sale': 'Sale voided',
+    'adjust_stock': 'Stock adjusted',
+    'price-change': 'Selling price changed',
+    'batch_create_product': 'Batch: product created',
+    'batch_update_product': 'Batch: product updated',
+    'shift-open': 'Shift opened',
+    'shift-close': 'Shift closed',
+    'reset_all': 'All data reset',
+    'http_429': 'Rate limited (429)',
+    'server_error': 'Server error (500)',
+    'audit_dropped': 'Audit entries dropped',
+}
+
+# high-volume, low-value actions that compact() folds into daily counters
+NOISE_ACTIONS = ('http_429', 'server_error')
+COMPACT_BATCH = 5000
+
+DURABLE_ACTIONS = frozenset({
+    'below_cost_attempt_blocked',
+    'below_cost_override',
+    'void_sale',
+    'edit_sale_qty',
+    'edit_sale_price',
+    'adjust_stock',
+    'price-change',
+    'reset_all',
+})
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_pending = []                   # LogEntry rows (dicts) since the last flush
+_dropped = Counter()            # action -> entries refused because the queue was full
+_flusher_pid = None
+
+
+def current_username():
+    if not has_request_context():
+        return 'system'
+    try:
+        # loading the user can fail when the database is the reason we are logging
+        return current_user.username if current_user.is_authenticated else 'anon'
+    except Exception:
+        return 'anon'
+
+
+def record(action, details, user=None, durable=None, product_id=None, sale_id=None, amount=None):
+    """Write one audit entry; see the module docstring for when it lands.
+
+    ``durable`` defaults to ``action in DURABLE_ACTIONS``; a durable entry
+    is part of the current transaction, so the caller commits it. Queued
+    entries are written whatever happens to that transaction, so record
+    them once the change they describe is committed.
+    """
+    if user is None:
+        user = current_username()
+    if durable is None:
+        durable = action in DURABLE_ACTIONS
+    if durable:
+        db.session.add(LogEntry(user=user, action=action, details=details,
+                                product_id=product_id, sale_id=sale_id, amount=amount))
+        return
+    row = _row(user, action, details, product_id, sale_id, amount)
+    app = current_app._get_current_object()
+    with _lock:
+        if len(_pending) < app.config.get('AUDIT_MAX_PENDING', 10000):
+            _pending.append(row)
+        else:
+            _dropped[action] += 1
+        full = len(_pending) >= app.config.get('AUDIT_BATCH_SIZE', 200)
+    _ensure_flusher(app)
+    if full:
+        _wake.set()
+
+
+def _row(user, action, details, product_id=None, sale_id=None, amount=None):
+    # every queued row has every column: flush() inserts them as one executemany
+    return dict(user=user, action=action, details=details, timestamp=datetime.utcnow(),
+                product_id=product_id, sale_id=sale_id, amount=amount)
+
+
+def _ensure_flusher(app):
+    """Start this worker's flush thread (once per process, after any fork)."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    interval = app.config.get('AUDIT_FLUSH_SECONDS', 5)
+    compact_every = app.config.get('AUDIT_COMPACT_HOURS', 24) * 3600
+
+    def loop():
+        last_compact = None         # first tick after start-up, then every compact_every
+        while True:
+            _wake.wait(interval)
+            _wake.clear()
+            try:
+                with app.app_context():
+                    flush()
+                    if compact_every and (last_compact is None
+                                          or time.monotonic() - last_compact >= compact_every):
+                        last_compact = time.monotonic()
+                        compact()
+            except Exception:
+                logger.exception('audit log flush failed')
+
+    threading.Thread(target=loop, name='audit-log', daemon=True).start()
+    atexit.register(_flush_at_exit, app)
+
+
+def _flush_at_exit(app):
+    if os.getpid() != _flusher_pid:
+        return
+    try:
+        with app.app_context():
+            flush()
+    except Exception:
+        logger.exception('audit log flush at exit failed')
+
+
+def flush():
+    """Write queued entries now; returns how many rows were inserted."""
+    global _pending, _dropped
+    with _lock:
+        rows, _pending = _pending, []
+        dropped, _dropped = _dropped, Counter()
+    if dropped:
+        rows.append(_row('system', 'audit_dropped',
+                         'queue full; not recorded: ' + ', '.join(f'{a}×{n}' for a, n in dropped.most_common())))
+    if not rows:
+        return 0
+    # the audit writer's own statements are not part of the request being profiled
+    prof = g.pop('sql_profile', None) if has_request_context() else None
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(LogEntry.__table__), rows)
+    except Exception:
+        with _lock:
+            room = current_app.config.get('AUDIT_MAX_PENDING', 10000) - len(_pending)
+            _pending[:0] = rows[:max(room, 0)]
+        raise
+    finally:
+        if prof is not None:
+            g.sql_profile = prof
+    return len(rows)
+
+
+# ── retention ────────────────────────────────────────────────────────
+def compact(older_than_days=None):
+    """Fold ``NOISE_ACTIONS`` entries older than the cutoff into ``audit_counter``.
+
+    Rows are deleted with ``RETURNING`` and counted from what was actually
+    deleted, in the same transaction as the counter update, so workers
+    compacting at the same time never count a row twice. Returns the
+    number of entries removed.
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config.get('AUDIT_NOISE_DAYS', 14)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    t = LogEntry.__table__
+    removed = 0
+    while True:
+        batch = (select(t.c.id)
+                 .where(t.c.action.in_(NOISE_ACTIONS), t.c.timestamp < cutoff)
+                 .order_by(t.c.action, t.c.timestamp)
+                 .limit(COMPACT_BATCH))
+        with db.engine.begin() as conn:
+            gone = conn.execute(
+                delete(t).where(t.c.id.in_(batch.scalar_subquery()))
+                .returning(t.c.action, t.c.timestamp)).all()
+            counts = Counter((ts.date(), action) for action, ts in gone)
+            for (day, action), n in counts.items():
+                _add_count(conn, day, action, n)
+        removed += len(gone)
+        if len(gone) < COMPACT_BATCH:
+            return removed
+
+
+def _add_count(conn, day, action, n):
+    c = AuditCounter.__table__
+    bump = (update(c).where(c.c.day == day, c.c.action == action)
+            .values(count=c.c.count + n))
+    if conn.execute(bump).rowcount:
+        return
+    try:
+        with conn.begin_nested():
+            conn.execute(insert(c).values(day=day, action=action, count=n))
+    except IntegrityError:
+        # another worker created the day's counter first
+        conn.execute(bump)
+
+
+def noise_counts(start=None, end=None, actions=NOISE_ACTIONS):
+    """``[(day, action, count)]`` compacted so far, newest day first."""
+    stmt = (select(AuditCounter.day, AuditCounter.action, AuditCounter.count)
+            .where(AuditCounter.action.in_(actions)))
+    if start is not None:
+        stmt = stmt.where(AuditCounter.day >= start)
+    if end is not None:
+        stmt = stmt.where(AuditCounter.day <= end)
+    return db.session.execute(stmt.order_by(AuditCounter.day.desc(), AuditCounter.action)).all()
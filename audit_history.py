@@ -0,0 +1,108 @@
+"""Filtered, keyset-paginated browsing of the audit trail (``log_entry``).
+
+Pages are ordered newest first on ``(timestamp, id)`` and continue from an
+opaque cursor, as in sales_history.py. Each filter column leads a
+composite ``(column, timestamp, id)`` index, so "below-cost overrides for
+product X last month" is a range scan on one index whatever the table
+size.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+
+import audit
+from filters import BadFilter, parse_date, parse_int
+from models import db, LogEntry
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+@dataclass
+class LogFilter:
+    action: Optional[str] = None
+    user: Optional[str] = None
+    product_id: Optional[int] = None
+    sale_id: Optional[int] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    limit: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args):
+        try:
+            start = parse_date(args.get('start'))
+            end = parse_date(args.get('end'))
+            product_id = parse_int(args.get('product_id'))
+            sale_id = parse_int(args.get('sale_id'))
+            limit = parse_int(args.get('limit')) or DEFAULT_PAGE_SIZE
+        except ValueError as e:
+            raise BadFilter(str(e))
+        if start and end and start > end:
+            start, end = end, start
+        action = args.get('action') or None
+        if action is not None and action not in audit.ACTIONS:
+            raise BadFilter(f'unknown action {action!r}')
+        return cls(action=action, user=(args.get('user') or '').strip() or None,
+                   product_id=product_id, sale_id=sale_id, start=start, end=end,
+                   limit=max(1, min(limit, MAX_PAGE_SIZE)))
+
+    def as_args(self):
+        """Query-string args that reproduce this filter (for pager links)."""
+        args = {}
+        for key in ('action', 'user', 'product_id', 'sale_id'):
+            value = getattr(self, key)
+            if value is not None:
+                args[key] = value
+        if self.start:
+            args['start'] = self.start.isoformat()
+        if self.end:
+            args['end'] = self.end.isoformat()
+        if self.limit != DEFAULT_PAGE_SIZE:
+            args['limit'] = self.limit
+        return args
+
+
+def encode_cursor(timestamp, entry_id):
+    raw = f'{timestamp.isoformat()}|{entry_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, entry_id = raw.split('|')
+        return datetime.fromisoformat(ts), int(entry_id)
+    except (ValueError, UnicodeDecodeError):
+        raise BadFilter('invalid cursor')
+
+
+def page(filters, cursor=None):
+    """Return ``(entries, next_cursor)``, newest first."""
+    stmt = select(LogEntry)
+    if filters.action is not None:
+        stmt = stmt.where(LogEntry.action == filters.action)
+    if filters.user is not None:
+        stmt = stmt.where(LogEntry.user == filters.user)
+    if filters.product_id is not None:
+        stmt = stmt.where(LogEntry.product_id == filters.product_id)
+    if filters.sale_id is not None:
+        stmt = stmt.where(LogEntry.sale_id == filters.sale_id)
+    if filters.start:
+        stmt = stmt.where(LogEntry.timestamp >= datetime.combine(filters.start, datetime.min.time()))
+    if filters.end:
+        stmt = stmt.where(LogEntry.timestamp < datetime.combine(filters.end + timedelta(days=1),
+                                                                datetime.min.time()))
+    if cursor:
+        stmt = stmt.where(tuple_(LogEntry.timestamp, LogEntry.id) < decode_cursor(cursor))
+    stmt = stmt.order_by(LogEntry.timestamp.desc(), LogEntry.id.desc())
+
+    entries = db.session.execute(stmt.limit(filters.limit + 1)).scalars().all()
+    next_cursor = None
+    if len(entries) > filters.limit:
+        entries = entries[:filters.limit]
+        next_cursor = encode_cursor(entries[-1].timestamp, entries[-1].id)
+    return entries, next_cursor
@@ -0,0 +1,118 @@
+"""Barcode / SKU codes for products.
+
+Codes live in ``product_barcode`` behind the unique ``ix_product_barcode_code``
+index, so a scan resolves with a single indexed lookup joined to its
+product instead of a text search. Codes are normalised (whitespace removed,
+upper-cased) on the way in and on lookup, so ``"5012 3456"`` and
+``"50123456"`` are the same code.
+"""
+import re
+
+from sqlalchemy import select
+
+from models import db, Product, ProductBarcode
+
+MAX_CODE_LENGTH = 64
+LOOKUP_CHUNK = 900              # stay under SQLite's bound-parameter limit
+
+_SPLIT_RE = re.compile(r'[,;|\n]+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+class BarcodeError(ValueError):
+    pass
+
+
+def normalize(code):
+    """Canonical form of one code; spreadsheet numbers lose their ``.0``."""
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    return _SPACE_RE.sub('', str(code if code is not None else '')).upper()
+
+
+def split_codes(value):
+    """Codes in a form field or spreadsheet cell (``,``/``;``/``|`` separated).
+
+    Raises :class:`BarcodeError` for codes that are too long.
+    """
+    if value is None or (isinstance(value, float) and value != value):     # NaN
+        return []
+    if isinstance(value, (int, float)):
+        parts = [value]
+    else:
+        parts = _SPLIT_RE.split(str(value))
+    codes = []
+    for part in parts:
+        code = normalize(part)
+        if not code:
+            continue
+        if len(code) > MAX_CODE_LENGTH:
+            raise BarcodeError(f'barcode {code[:20]}… is longer than {MAX_CODE_LENGTH} characters')
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+
+def lookup(code):
+    """``(id, name, selling_price, cost_price, qty_at_hand)`` for a code, or None."""
+    return db.session.execute(
+        select(Product.id, Product.name, Product.selling_price, Product.cost_price, Product.qty_at_hand)
+        .join(ProductBarcode, ProductBarcode.product_id == Product.id)
+        .where(ProductBarcode.code == normalize(code))
+    ).first()
+
+
+def owners(codes):
+    """``{code: (product_id, product_name)}`` for the codes already assigned."""
+    codes = sorted(set(codes))
+    found = {}
+    for i in range(0, len(codes), LOOKUP_CHUNK):
+        found.update(
+            (code, (pid, name)) for code, pid, name in db.session.execute(
+                select(ProductBarcode.code, Product.id, Product.name)
+                .join(Product, Product.id == ProductBarcode.product_id)
+                .where(ProductBarcode.code.in_(codes[i:i + LOOKUP_CHUNK]))
+            )
+        )
+    return found
+
+
+def set_codes(product, codes):
+    """Make ``codes`` exactly the product's codes; the caller commits.
+
+    Raises :class:`BarcodeError` if a code already belongs to another product.
+    """
+    taken = {c: name for c, (pid, name) in owners(codes).items() if pid != product.id}
+    if taken:
+        code, name = next(iter(taken.items()))
+        raise BarcodeError(f'barcode {code} is already used by {name}')
+    current = {bc.code: bc for bc in product.codes}
+    for code, bc in current.items():
+        if code not in codes:
+            product.codes.remove(bc)
+    for code in codes:
+        if code not in current:
+            product.codes.append(ProductBarcode(code=code))
+
+
+def add_codes(product_codes):
+    """Attach ``{product_id: [codes]}`` in bulk (batch import); the caller commits.
+
+    Codes the product already has are skipped; a code owned by a different
+    product raises :class:`BarcodeError`.
+    """
+    wanted = {}
+    for pid, codes in product_codes.items():
+        for code in codes:
+            if wanted.setdefault(code, pid) != pid:
+                raise BarcodeError(f'barcode {code} is listed for two different products')
+    if not wanted:
+        return 0
+    existing = owners(wanted)
+    for code, (pid, name) in existing.items():
+        if pid != wanted[code]:
+            raise BarcodeError(f'barcode {code} is already used by {name}')
+    rows = [{'product_id': pid, 'code': code} for code, pid in wanted.items() if code not in existing]
+    if rows:
+        db.session.execute(ProductBarcode.__table__.insert(), rows)
+    return len(rows)
@@ -0,0 +1,327 @@
+"""Bulk apply engine for confirmed batch-inventory uploads.
+
+Rows are written in chunks with a single ``INSERT ... ON CONFLICT (lower(name))
+DO UPDATE`` per chunk on PostgreSQL and SQLite, and audit entries are
+inserted with one executemany per chunk, as are the stock ledger movements
+(stock.py). Each chunk commits on its own; if
+a chunk fails it is replayed one row per transaction so a bad row is
+reported instead of sinking the whole upload.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import func, insert, update, bindparam
+
+import barcodes
+import catalog_cache
+import stock
+from models import db, Product, LogEntry, User
+
+CHUNK_SIZE = 500
+UPDATE_MODES = ('add_stock', 'replace_stock', 'update_prices', 'full_update')
+
+_product_t = Product.__table__
+
+
+class RowError(ValueError):
+    pass
+
+
+def _parse_expiry(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, date):
+        return value
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f'invalid expiry date {value!r}')
+
+
+def _clean_row(update_row):
+    """Coerce one preview row into insert values; raises RowError."""
+    name = str(update_row.get('name') or '').strip()
+    if not name:
+        raise RowError('name is required')
+    try:
+        cost = float(update_row['cost_price'])
+        selling = float(update_row['selling_price'])
+        qty = int(update_row['quantity'])
+        safety = int(update_row.get('safety_stock') if update_row.get('safety_stock') is not None else 5)
+    except (KeyError, TypeError, ValueError) as e:
+        raise RowError(f'invalid number ({e})')
+    return {
+        'name': name,
+        'category': (update_row.get('category') or 'General'),
+        'cost_price': cost,
+        'selling_price': selling,
+        'initial_qty': qty,
+        'qty_at_hand': qty,
+        'safety_stock': safety,
+        'expiry_date': _parse_expiry(update_row.get('expiry_date')),
+    }
+
+
+def _changed_columns(update_mode):
+    """Columns overwritten when the product already exists, per update mode."""
+    cols = ['catalog_version']
+    if update_mode in ('add_stock', 'replace_stock'):
+        cols.append('qty_at_hand')
+    if update_mode in ('update_prices', 'full_update'):
+        cols += ['cost_price', 'selling_price']
+    if update_mode == 'full_update':
+        cols += ['category', 'expiry_date', 'safety_stock']
+    return cols
+
+
+def _set_clause(update_mode, incoming):
+    """SET values for existing rows; ``incoming(col)`` is the uploaded value."""
+    values = {c: incoming(c) for c in _changed_columns(update_mode)}
+    if update_mode == 'add_stock':
+        values['qty_at_hand'] = _product_t.c.qty_at_hand + incoming('qty_at_hand')
+    return values
+
+
+def _write_rows(rows, existing, update_mode):
+    """Upsert ``rows`` on the current transaction; ``existing`` is keyed by lower(name)."""
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(_product_t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[func.lower(_product_t.c.name)],
+            set_=_set_clause(update_mode, lambda c: stmt.excluded[c]),
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    # Other backends: split on the prefetch and use plain executemany
+    new = [r for r in rows if r['name'].lower() not in existing]
+    old = [r for r in rows if r['name'].lower() in existing]
+    if new:
+        db.session.execute(insert(_product_t), new)
+    if old:
+        db.session.execute(
+            update(_product_t)
+            .where(func.lower(_product_t.c.name) == bindparam('b_key'))
+            .values(**_set_clause(update_mode, lambda c: bindparam('b_' + c))),
+            [{'b_key': r['name'].lower(), **{'b_' + k: v for k, v in r.items()}} for r in old],
+        )
+
+
+def _row_codes(update_row):
+    """Barcodes carried by a preview row (a list, or a raw cell if hand-built)."""
+    value = update_row.get('barcodes')
+    if isinstance(value, (list, tuple)):
+        return [c for c in (barcodes.normalize(v) for v in value) if c]
+    try:
+        return barcodes.split_codes(value)
+    except barcodes.BarcodeError as e:
+        raise RowError(str(e))
+
+
+def _write_barcodes(rows, codes):
+    """Attach each row's codes to its (now existing) product."""
+    rows = [r for r in rows if codes.get(r['name'].lower())]
+    if not rows:
+        return
+    keys = [r['name'].lower() for r in rows]
+    ids = dict(db.session.execute(
+        db.select(func.lower(Product.name), Product.id).where(func.lower(Product.name).in_(keys))
+    ).all())
+    barcodes.add_codes({ids[k]: codes[k] for k in keys})
+
+
+def _log_entries(rows, existing, after, update_mode, username):
+    entries = []
+    for r in rows:
+        key = r['name'].lower()
+        old = existing.get(key)
+        if old is None:
+            entries.append({
+                'user': username,
+                'action': 'batch_create_product',
+                'details': f"Created product: {r['name']} with quantity {r['qty_at_hand']}",
+                'timestamp': datetime.utcnow(),
+                'product_id': after[key][0],
+            })
+            continue
+        old_cost, old_selling, old_qty = old
+        changes = []
+        if update_mode in ('update_prices', 'full_update'):
+            if old_cost != r['cost_price']:
+                changes.append(f"cost: GH₵{old_cost} → GH₵{r['cost_price']}")
+            if old_selling != r['selling_price']:
+                changes.append(f"selling: GH₵{old_selling} → GH₵{r['selling_price']}")
+        if update_mode == 'add_stock':
+            changes.append(f"quantity: {old_qty} + {r['qty_at_hand']}")
+        elif update_mode == 'replace_stock' and old_qty != r['qty_at_hand']:
+            changes.append(f"quantity: {old_qty} → {r['qty_at_hand']}")
+        entries.append({
+            'user': username,
+            'action': 'batch_update_product',
+            'details': f"Updated {r['name']}: {', '.join(changes)}",
+            'timestamp': datetime.utcnow(),
+            'product_id': after[key][0],
+        })
+    return entries
+
+
+def _lock_current(rows):
+    """lower(name) -> (id, qty) of the rows' existing products, locked until commit.
+
+    Read in the chunk's own transaction, so ledger deltas are measured
+    against the stock the upsert actually changes – not the upload-wide
+    prefetch, which a sale or an earlier wave may have moved since.
+    """
+    return {k: (pid, qty) for k, pid, qty in db.session.execute(
+        db.select(func.lower(Product.name), Product.id, Product.qty_at_hand)
+        .where(func.lower(Product.name).in_([r['name'].lower() for r in rows]))
+        .with_for_update()
+    )}
+
+
+def _written(rows):
+    """lower(name) -> (id, qty) of the rows' products once the upsert has run."""
+    return {k: (pid, qty) for k, pid, qty in db.session.execute(
+        db.select(func.lower(Product.name), Product.id, Product.qty_at_hand)
+        .where(func.lower(Product.name).in_([r['name'].lower() for r in rows]))
+    )}
+
+
+def _record_movements(rows, before, after, update_mode, user_id):
+    """Ledger movements for the rows just written, between :func:`_lock_current` and :func:`_written`."""
+    if update_mode not in ('add_stock', 'replace_stock'):
+        rows = [r for r in rows if r['name'].lower() not in before]
+    for r in rows:
+        key = r['name'].lower()
+        pid, qty_after = after[key]
+        old = before.get(key)
+        if old is None:
+            stock.record(pid, qty_after, qty_after, 'new_product', user_id=user_id)
+        elif qty_after != old[1]:
+            reason = 'batch_add' if update_mode == 'add_stock' else 'batch_replace'
+            stock.record(pid, qty_after - old[1], qty_after, reason, user_id=user_id)
+
+
+def _prefetch(keys):
+    """lower(name) -> (cost, selling, qty) for every product named in the upload."""
+    found = {}
+    keys = list(keys)
+    for i in range(0, len(keys), 900):
+        rows = db.session.execute(
+            db.select(func.lower(Product.name), Product.cost_price,
+                      Product.selling_price, Product.qty_at_hand)
+            .where(func.lower(Product.name).in_(keys[i:i + 900]))
+        ).all()
+        found.update((k, (c, s, q)) for k, c, s, q in rows)
+    return found
+
+
+def _waves(items):
+    """Split so no chunk holds the same product twice (ON CONFLICT can't touch a row twice)."""
+    seen = {}
+    waves = []
+    for item in items:
+        key = item[1]['name'].lower()
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        if n == len(waves):
+            waves.append([])
+        waves[n].append(item)
+    return waves
+
+
+def apply_updates(updates, update_mode, username, chunk_size=CHUNK_SIZE, progress=None):
+    """Apply preview rows in bulk.
+
+    ``progress(done, total)`` is called after every chunk. Returns a summary
+    dict with counts, per-chunk stats and row-level ``failures``.
+    """
+    if update_mode not in UPDATE_MODES:
+        raise ValueError(f'unknown update mode {update_mode!r}')
+
+    total = len(updates)
+    failures = []
+    items = []
+    codes = {}              # lower(name) -> barcodes to attach
+    for pos, raw in enumerate(updates):
+        row_num = raw.get('row_num', pos + 1)
+        try:
+            row = _clean_row(raw)
+            row_codes = _row_codes(raw)
+            items.append((row_num, row))
+            if row_codes:
+                codes.setdefault(row['name'].lower(), []).extend(row_codes)
+        except RowError as e:
+            failures.append({'row_num': row_num, 'name': raw.get('name'), 'error': str(e)})
+
+    existing = _prefetch({r['name'].lower() for _, r in items})
+    user_id = db.session.execute(db.select(User.id).where(User.username == username)).scalar()
+    chunks = []
+    done = len(failures)
+    if progress:
+        progress(done, total)
+
+    waves = _waves(items)
+    for n, wave in enumerate(waves, 1):
+        for start in range(0, len(wave), chunk_size):
+            chunk = wave[start:start + chunk_size]
+            ok, bad = _apply_chunk(chunk, existing, update_mode, username, user_id, codes)
+            failures.extend(bad)
+            chunks.append({'chunk': len(chunks) + 1, 'rows': len(chunk), 'ok': ok, 'failed': len(bad)})
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+        if n < len(waves):
+            # later waves compare against what this wave wrote
+            existing.update(_prefetch({r['name'].lower() for _, r in wave}))
+
+    failures.sort(key=lambda f: f['row_num'])
+    return {
+        'success_count': total - len(failures),
+        'error_count': len(failures),
+        'failures': failures,
+        'chunks': chunks,
+    }
+
+
+def _apply_chunk(chunk, existing, update_mode, username, user_id, codes):
+    rows = [r for _, r in chunk]
+    try:
+        version = catalog_cache.stamp()
+        for r in rows:
+            r['catalog_version'] = version
+        before = _lock_current(rows)
+        _write_rows(rows, before, update_mode)
+        _write_barcodes(rows, codes)
+        after = _written(rows)
+        _record_movements(rows, before, after, update_mode, user_id)
+        db.session.execute(insert(LogEntry.__table__),
+                           _log_entries(rows, existing, after, update_mode, username))
+        db.session.commit()
+        return len(rows), []
+    except Exception:
+        db.session.rollback()
+
+    # Replay one row per transaction to isolate the failures
+    bad = []
+    for row_num, r in chunk:
+        try:
+            r['catalog_version'] = catalog_cache.stamp()
+            before = _lock_current([r])
+            _write_rows([r], before, update_mode)
+            _write_barcodes([r], codes)
+            after = _written([r])
+            _record_movements([r], before, after, update_mode, user_id)
+            db.session.execute(insert(LogEntry.__table__),
+                               _log_entries([r], existing, after, update_mode, username))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            bad.append({'row_num': row_num, 'name': r['name'], 'error': str(getattr(e, 'orig', e))})
+    return len(chunk) - len(bad), bad
@@ -1,13 +1,20 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, send_file, current_app
 from werkzeug.utils import secure_filename
-import pandas as pd
 import os
-from datetime import datetime
-from models import db, Product, LogEntry
+from datetime import date, datetime
+import json
+from models import db, Product
 from forms import BatchInventoryForm
+import barcodes
+import duplicate_detection
+import batch_apply
+import jobs
 from flask_login import login_required, current_user
 import io
 
+# pandas is imported inside the functions that need it so web workers
+# don't pay for it until someone actually uploads or downloads a sheet.
+
 batch_inventory_bp = Blueprint('batch_inventory', __name__)
 
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
@@ -16,49 +23,161 @@ MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_row_data(row, row_num):
-    """Validate a single row of data"""
+REQUIRED_FIELDS = ['name', 'cost_price', 'selling_price', 'quantity']
+NUMERIC_FIELDS = ['cost_price', 'selling_price', 'quantity', 'safety_stock']
+LOOKUP_CHUNK = 900  # stay under SQLite's bound-parameter limit
+BARCODE_COLUMNS = ['barcode', 'barcodes', 'sku', 'upc', 'ean', 'code']
+
+
+def _blank(col):
+    """Mask of cells that are missing or whitespace-only."""
+    return col.isna() | (col.astype(str).str.strip() == '')
+
+
+def _to_number(col, strip_currency=True):
+    """Column-wise numeric coercion; unparseable cells become NaN."""
+    import pandas as pd
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype(float)
+    text = col.astype(str)
+    if strip_currency:
+        text = text.str.replace('GH₵', '', regex=False)
+    text = text.str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(text.where(col.notna()), errors='coerce')
+
+
+def validate_frame(df):
+    """Validate every row of a standardized sheet at once.
+
+    Returns ``(errors, valid_mask, numbers)`` where ``errors`` lists
+    "Row N: ..." messages in row order, ``valid_mask`` marks rows with no
+    errors and ``numbers`` holds the parsed numeric columns.
+    """
+    import pandas as pd
+    row_num = (df.index.to_series() + 2).astype(str)  # +1 for header, +1 for 1-based
+    found = []   # (mask, message suffix) in the order checks are reported per row
+
+    for field in REQUIRED_FIELDS:
+        if field in df.columns:
+            mask = _blank(df[field])
+        else:
+            mask = pd.Series(True, index=df.index)
+        found.append((mask, f'{field} is required'))
+
+    numbers = {}
+    for field in NUMERIC_FIELDS:
+        if field not in df.columns:
+            numbers[field] = pd.Series(float('nan'), index=df.index)
+            continue
+        present = df[field].notna()
+        parsed = _to_number(df[field])
+        numbers[field] = parsed
+        found.append((present & parsed.isna(), f'{field} must be a valid number'))
+        found.append((parsed < 0, f'{field} must be positive'))
+
+    if 'quantity' in df.columns:
+        qty = _to_number(df['quantity'], strip_currency=False)
+        present = df['quantity'].notna()
+        found.append((present & qty.isna(), 'quantity must be a whole number'))
+        found.append((qty < 0, 'quantity must be positive'))
+
+    parts = []
+    for order, (mask, suffix) in enumerate(found):
+        hit = mask.fillna(False).astype(bool)
+        if hit.any():
+            parts.append(pd.DataFrame({
+                'pos': df.index[hit],
+                'order': order,
+                'msg': 'Row ' + row_num[hit] + ': ' + suffix,
+            }))
+    if parts:
+        err = pd.concat(parts).sort_values(['pos', 'order'], kind='stable')
+        errors = err['msg'].tolist()
+        valid_mask = ~df.index.isin(err['pos'])
+    else:
+        errors = []
+        valid_mask = pd.Series(True, index=df.index).to_numpy()
+    return errors, valid_mask, numbers
+
+
+def check_barcodes(df):
+    """Parse the barcode column and find rows whose codes cannot be used.
+
+    A code is rejected if it is too long, listed for two different products
+    in the sheet, or already belongs to a product with another name.
+    Returns ``(codes, errors, bad_mask)``; ``codes`` holds a list per row.
+    """
+    import pandas as pd
+    row_num = df.index.to_series() + 2
+    codes = pd.Series([[] for _ in range(len(df))], index=df.index, dtype=object)
     errors = []
-    
-    # Check required fields
-    required_fields = ['name', 'cost_price', 'selling_price', 'quantity']
-    for field in required_fields:
-        if field not in row or pd.isna(row[field]) or str(row[field]).strip() == '':
-            errors.append(f"Row {row_num}: {field} is required")
-    
-    # Validate numeric fields
-    numeric_fields = ['cost_price', 'selling_price', 'quantity', 'safety_stock']
-    for field in numeric_fields:
-        if field in row and not pd.isna(row[field]):
-            try:
-                value = float(str(row[field]).replace('GH₵', '').replace(',', ''))
-                if value < 0:
-                    errors.append(f"Row {row_num}: {field} must be positive")
-            except ValueError:
-                errors.append(f"Row {row_num}: {field} must be a valid number")
-    
-    # Validate quantity is integer
-    if 'quantity' in row and not pd.isna(row['quantity']):
+    bad = pd.Series(False, index=df.index)
+    claimed = {}                                   # code -> lowercased product name in the sheet
+    rows_with = {}                                 # code -> row positions listing it
+    names = df['name'].astype(str).str.strip().str.lower() if 'name' in df.columns else None
+    for pos, cell in df['barcode'].items():
         try:
-            qty = int(float(str(row['quantity']).replace(',', '')))
-            if qty < 0:
-                errors.append(f"Row {row_num}: quantity must be positive")
-        except ValueError:
-            errors.append(f"Row {row_num}: quantity must be a whole number")
-    
-    return errors
+            row_codes = barcodes.split_codes(cell)
+        except barcodes.BarcodeError as e:
+            errors.append(f'Row {row_num[pos]}: {e}')
+            bad[pos] = True
+            continue
+        name = names[pos] if names is not None else ''
+        for code in row_codes:
+            rows_with.setdefault(code, []).append(pos)
+            if claimed.setdefault(code, name) != name:
+                errors.append(f'Row {row_num[pos]}: barcode {code} is listed for another product in this file')
+                bad[pos] = True
+        codes[pos] = row_codes
+
+    for code, (_, owner) in barcodes.owners(rows_with).items():
+        for pos in rows_with[code]:
+            if names is None or owner.lower() != names[pos]:
+                errors.append(f'Row {row_num[pos]}: barcode {code} is already used by {owner}')
+                bad[pos] = True
+    return codes, errors, bad.to_numpy()
 
-def process_spreadsheet(file, update_mode):
+
+def lookup_existing(names):
+    """One bulk lookup of products by lowercased name.
+
+    Returns a DataFrame indexed by lowercased name with id and current
+    stock/prices.
+    """
+    import pandas as pd
+    keys = sorted(set(names))
+    rows = []
+    for i in range(0, len(keys), LOOKUP_CHUNK):
+        rows.extend(
+            db.session.query(
+                db.func.lower(Product.name), Product.id, Product.qty_at_hand,
+                Product.cost_price, Product.selling_price,
+            )
+            .filter(db.func.lower(Product.name).in_(keys[i:i + LOOKUP_CHUNK]))
+            .all()
+        )
+    return pd.DataFrame(
+        rows, columns=['key', 'product_id', 'old_quantity', 'old_cost', 'old_selling']
+    ).set_index('key')
+
+
+def process_spreadsheet(file, update_mode, filename=None):
     """Process uploaded spreadsheet and return preview data"""
+    import pandas as pd
     try:
         # Read file based on extension
-        filename = file.filename.lower()
+        filename = (filename or file.filename).lower()
         if filename.endswith('.csv'):
-            df = pd.read_csv(file)
+            read = pd.read_csv
         elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
+            read = pd.read_excel
         else:
             return {'success': False, 'message': 'Invalid file format'}
+        # barcodes must stay text, or leading zeros are lost and EANs become floats
+        header = read(file, nrows=0).columns
+        file.seek(0)
+        code_cols = {c: str for c in header if str(c).lower().strip() in BARCODE_COLUMNS}
+        df = read(file, dtype=code_cols)
         
         # Standardize column names
         column_mapping = {
@@ -68,14 +187,15 @@ def process_spreadsheet(file, update_mode):
             'selling_price': ['selling_price', 'sell_price', 'price', 'retail_price'],
             'quantity': ['quantity', 'stock', 'qty', 'amount'],
             'safety_stock': ['safety_stock', 'reorder_level', 'minimum_stock'],
-            'expiry_date': ['expiry_date', 'expiry', 'expires']
+            'expiry_date': ['expiry_date', 'expiry', 'expires'],
+            'barcode': BARCODE_COLUMNS,
         }
         
         # Find matching columns
-        standardized_df = pd.DataFrame()
+        standardized_df = pd.DataFrame(index=df.index)
         for standard_name, possible_names in column_mapping.items():
             for col in df.columns:
-                if col.lower().strip() in [name.lower() for name in possible_names]:
+                if str(col).lower().strip() in [name.lower() for name in possible_names]:
                     standardized_df[standard_name] = df[col]
                     break
         
@@ -85,75 +205,66 @@ def process_spreadsheet(file, update_mode):
         if 'category' not in standardized_df.columns:
             standardized_df['category'] = 'General'
         
-        # Process each row
-        results = []
-        errors = []
-        
-        for idx, row in standardized_df.iterrows():
-            row_num = idx + 2  # +1 for header, +1 for 1-based indexing
-            
-            # Validate row
-            row_errors = validate_row_data(row, row_num)
-            if row_errors:
-                errors.extend(row_errors)
-                continue
-            
-            # Clean data
-            name = str(row['name']).strip()
-            category = str(row.get('category', 'General')).strip()
-            cost_price = float(str(row['cost_price']).replace('GH₵', '').replace(',', ''))
-            selling_price = float(str(row['selling_price']).replace('GH₵', '').replace(',', ''))
-            quantity = int(float(str(row['quantity']).replace(',', '')))
-            safety_stock = int(float(str(row.get('safety_stock', 5))))
-            
-            # Handle expiry date
-            expiry_date = None
-            if 'expiry_date' in row and not pd.isna(row['expiry_date']):
-                try:
-                    expiry_date = pd.to_datetime(row['expiry_date']).date()
-                except:
-                    pass
-            
-            # Check if product exists
-            existing_product = Product.query.filter(
-                db.func.lower(Product.name) == name.lower()
-            ).first()
-            
-            action_type = 'update' if existing_product else 'create'
-            
-            # Calculate changes based on update mode
-            if existing_product:
-                if update_mode == 'add_stock':
-                    new_quantity = existing_product.qty_at_hand + quantity
-                elif update_mode == 'replace_stock':
-                    new_quantity = quantity
-                else:
-                    new_quantity = existing_product.qty_at_hand
-                
-                old_cost = existing_product.cost_price
-                old_selling = existing_product.selling_price
-                old_quantity = existing_product.qty_at_hand
-            else:
-                new_quantity = quantity
-                old_cost = old_selling = old_quantity = None
-            
-            results.append({
-                'row_num': row_num,
-                'action_type': action_type,
-                'name': name,
-                'category': category,
-                'cost_price': cost_price,
-                'selling_price': selling_price,
-                'quantity': quantity,
-                'new_quantity': new_quantity,
-                'safety_stock': safety_stock,
-                'expiry_date': expiry_date,
-                'old_cost': old_cost,
-                'old_selling': old_selling,
-                'old_quantity': old_quantity,
-                'existing_product': existing_product
-            })
-        
+        # Validate all rows column-wise, then keep only the clean ones
+        errors, valid_mask, numbers = validate_frame(standardized_df)
+        if 'barcode' in standardized_df.columns:
+            codes, code_errors, bad = check_barcodes(standardized_df)
+            errors = sorted(errors + code_errors, key=lambda e: int(e.split(':')[0][4:]))
+            valid_mask = valid_mask & ~bad
+        else:
+            codes = None
+        valid = standardized_df[valid_mask]
+
+        out = pd.DataFrame(index=valid.index)
+        out['row_num'] = valid.index + 2
+        out['name'] = valid['name'].astype(str).str.strip()
+        out['category'] = valid['category'].fillna('General').astype(str).str.strip()
+        out['cost_price'] = numbers['cost_price'][valid_mask].astype(float)
+        out['selling_price'] = numbers['selling_price'][valid_mask].astype(float)
+        out['quantity'] = numbers['quantity'][valid_mask].astype(int)
+        out['safety_stock'] = numbers['safety_stock'][valid_mask].fillna(5).astype(int)
+        if 'expiry_date' in valid.columns:
+            expiry = pd.to_datetime(valid['expiry_date'], errors='coerce', format='mixed')
+            out['expiry_date'] = expiry.dt.date.astype(object).where(expiry.notna(), None)
+        else:
+            out['expiry_date'] = None
+        out['barcodes'] = codes[valid_mask] if codes is not None else [[] for _ in range(len(out))]
+
+        # Check which products exist with a single lookup
+        out['key'] = out['name'].str.lower()
+        existing = lookup_existing(out['key'].tolist())
+        out = out.join(existing, on='key')
+        is_update = out['product_id'].notna()
+        out['action_type'] = is_update.map({True: 'update', False: 'create'})
+
+        # Calculate changes based on update mode
+        if update_mode == 'add_stock':
+            out['new_quantity'] = out['old_quantity'] + out['quantity']
+        elif update_mode == 'replace_stock':
+            out['new_quantity'] = out['quantity']
+        else:
+            out['new_quantity'] = out['old_quantity']
+        out['new_quantity'] = out['new_quantity'].where(is_update, out['quantity']).astype(int)
+
+        columns = ['row_num', 'action_type', 'name', 'category', 'cost_price',
+                   'selling_price', 'quantity', 'new_quantity', 'safety_stock',
+                   'expiry_date', 'old_cost', 'old_selling', 'old_quantity', 'product_id', 'barcodes']
+        out['old_quantity'] = out['old_quantity'].astype('Int64')
+        out['product_id'] = out['product_id'].astype('Int64')
+        values = []
+        for col in columns:
+            series = out[col]
+            if series.isna().any():
+                series = series.astype(object).where(series.notna(), None)
+            values.append(series.tolist())
+        results = [dict(zip(columns, row)) for row in zip(*values)]
+
+        # Flag likely duplicates of existing products for new rows, scored in bulk
+        new_rows = [r for r in results if r['action_type'] == 'create']
+        matches = duplicate_detection.find_similar_bulk([r['name'] for r in new_rows], limit=3)
+        for r, found in zip(new_rows, matches):
+            r['similar'] = [{'name': m.name, 'score': round(m.score)} for m in found]
+
         return {
             'success': True,
             'results': results,
@@ -196,31 +307,70 @@ def preview_batch_upload():
         return jsonify({'success': False, 'message': 'No file selected'})
     
     if file and allowed_file(file.filename):
+        # Big sheets are validated by a background job; the page polls for the preview
+        if (request.content_length or 0) > current_app.config['BACKGROUND_PREVIEW_BYTES']:
+            job = jobs.submit('batch_preview', {
+                'upload_path': jobs.spool_upload(file),
+                'filename': file.filename,
+                'update_mode': update_mode,
+            }, user_id=current_user.id)
+            return jsonify({'success': True, 'job': jobs.status_payload(job)})
+
         result = process_spreadsheet(file, update_mode)
         
         if result['success']:
-            # Calculate total cost for display in preview
-            total_cost = sum(float(item['cost_price']) * int(item['quantity']) for item in result['results'])
-            from datetime import date
-            # Prepare JSON-serialisable copy of updates (convert dates to strings)
-            safe_updates = []
-            for item in result['results']:
-                copy_item = {k: v for k, v in item.items() if k != 'existing_product'}
-                if isinstance(copy_item.get('expiry_date'), date):
-                    copy_item['expiry_date'] = copy_item['expiry_date'].strftime('%Y-%m-%d')
-                safe_updates.append(copy_item)
-            result['updates'] = safe_updates
-            result['update_mode'] = update_mode
-            result['total_cost'] = total_cost
             return jsonify({
                 'success': True,
-                'html': render_template('batch_preview.html', **result)
+                'html': render_preview(result, update_mode)
             })
         else:
             return jsonify(result)
     
     return jsonify({'success': False, 'message': 'Invalid file type'})
 
+
+def render_preview(result, update_mode):
+    """Render the preview table for a successful process_spreadsheet() result."""
+    # Calculate total cost for display in preview
+    total_cost = sum(float(item['cost_price']) * int(item['quantity']) for item in result['results'])
+    # Prepare JSON-serialisable copy of updates (convert dates to strings)
+    safe_updates = []
+    rows = []
+    for item in result['results']:
+        copy_item = dict(item)
+        if isinstance(copy_item.get('expiry_date'), date):
+            copy_item['expiry_date'] = copy_item['expiry_date'].strftime('%Y-%m-%d')
+        elif isinstance(copy_item.get('expiry_date'), str):
+            # results that went through a job's JSON round trip
+            item = dict(item, expiry_date=date.fromisoformat(copy_item['expiry_date']))
+        safe_updates.append(copy_item)
+        rows.append(item)
+    context = dict(result, results=rows, updates=safe_updates, update_mode=update_mode,
+                   total_cost=total_cost)
+    return render_template('batch_preview.html', **context)
+
+
+@jobs.handler('batch_preview', render=lambda job, result: (
+    render_preview(result, json.loads(job.params)['update_mode']) if result.get('success') else None))
+def _run_batch_preview(ctx, params):
+    ctx.progress(0, 1, 'Validating spreadsheet')
+    try:
+        with open(params['upload_path'], 'rb') as fh:
+            result = process_spreadsheet(fh, params['update_mode'], filename=params['filename'])
+    finally:
+        try:
+            os.remove(params['upload_path'])
+        except OSError:
+            pass
+    ctx.progress(1, 1)
+    return result
+
+
+@jobs.handler('batch_confirm')
+def _run_batch_confirm(ctx, params):
+    return batch_apply.apply_updates(params['updates'], params['update_mode'], params['username'],
+                                     progress=ctx.progress)
+
 @batch_inventory_bp.route('/batch-inventory/confirm', methods=['POST'])
 @login_required
 def confirm_batch_upload():
@@ -230,90 +380,21 @@ def confirm_batch_upload():
         data = request.get_json()
         updates = data.get('updates', [])
         update_mode = data.get('update_mode', 'add_stock')
-        
-        success_count = 0
-        error_count = 0
-        
-        
-        
-        for update in updates:
-            try:
-                if update['action_type'] == 'create':
-                    # Create new product
-                    product = Product(
-                        name=update['name'],
-                        category=update['category'],
-                        cost_price=update['cost_price'],
-                        selling_price=update['selling_price'],
-                        initial_qty=update['quantity'],
-                        qty_at_hand=update['quantity'],
-                        safety_stock=update['safety_stock'],
-                        expiry_date=update['expiry_date']
-                    )
-                    db.session.add(product)
-                    
-                    # Log the creation
-                    log_entry = LogEntry(
-                        user=current_user.username,
-                        action='batch_create_product',
-                        details=f"Created product: {update['name']} with quantity {update['quantity']}"
-                    )
-                    db.session.add(log_entry)
-                    
-                elif update['action_type'] == 'update':
-                    # Update existing product
-                    product = Product.query.filter(
-                        db.func.lower(Product.name) == update['name'].lower()
-                    ).first()
-                    
-                    if product:
-                        # Store old values for logging
-                        old_cost = product.cost_price
-                        old_selling = product.selling_price
-                        old_quantity = product.qty_at_hand
-                        
-                        # Apply changes based on update mode
-                        if update_mode in ['add_stock', 'replace_stock', 'full_update']:
-                            product.qty_at_hand = update['new_quantity']
-                        
-                        if update_mode in ['update_prices', 'full_update']:
-                            product.cost_price = update['cost_price']
-                            product.selling_price = update['selling_price']
-                        
-                        if update_mode == 'full_update':
-                            product.category = update['category']
-                            product.expiry_date = update['expiry_date']
-                            product.safety_stock = update['safety_stock']
-                        
-                        # Log the update
-                        changes = []
-                        if old_cost != update['cost_price']:
-                            changes.append(f"cost: GH₵{old_cost} → GH₵{update['cost_price']}")
-                        if old_selling != update['selling_price']:
-                            changes.append(f"selling: GH₵{old_selling} → GH₵{update['selling_price']}")
-                        if old_quantity != update['new_quantity']:
-                            changes.append(f"quantity: {old_quantity} → {update['new_quantity']}")
-                        
-                        log_entry = LogEntry(
-                            user=current_user.username,
-                            action='batch_update_product',
-                            details=f"Updated {update['name']}: {', '.join(changes)}"
-                        )
-                        db.session.add(log_entry)
-                
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                continue
-        
-        db.session.commit()
-        
+
+        if len(updates) > current_app.config['BACKGROUND_CONFIRM_ROWS']:
+            job = jobs.submit('batch_confirm', {
+                'updates': updates,
+                'update_mode': update_mode,
+                'username': current_user.username,
+            }, user_id=current_user.id)
+            return jsonify({'success': True, 'job': jobs.status_payload(job)})
+
+        summary = batch_apply.apply_updates(updates, update_mode, current_user.username)
+
         return jsonify({
             'success': True,
-            'message': f'Successfully processed {success_count} products.',
-            'success_count': success_count,
-            'error_count': error_count
+            'message': f"Successfully processed {summary['success_count']} products.",
+            **summary
         })
         
     except Exception as e:
@@ -326,6 +407,7 @@ def confirm_batch_upload():
 @batch_inventory_bp.route('/batch-inventory/download-template/<format>')
 @login_required
 def download_batch_template(format):
+    import pandas as pd
     if current_user.role != 'manager':
         flash('Access denied. Manager privileges required.', 'error')
         return redirect(url_for('dashboard'))
@@ -398,6 +480,7 @@ def download_batch_template(format):
 @batch_inventory_bp.route('/batch-inventory/download-example')
 @login_required
 def download_example_data():
+    import pandas as pd
     if current_user.role != 'manager':
         flash('Access denied. Manager privileges required.', 'error')
         return redirect(url_for('dashboard'))
@@ -0,0 +1,317 @@
+"""Per-worker product catalog cache with write-through invalidation.
+
+Each gunicorn worker keeps a compact snapshot of the product table
+(id → name, category, prices, qty, safety stock, plus a lowercase-name
+index). Every write that touches a ``Product`` marks the row pending
+(``catalog_version = PENDING``) without touching anything shared, so
+sales on different products never wait for each other. Once the writer's
+transaction has committed, :func:`publish` bumps the single-row
+``catalog_version`` counter in a short transaction of its own and stamps
+the pending rows with it; other workers refresh with one tiny version read
+and, when something changed, a delta select of only the stamped rows.
+Because stamps are handed out under the counter's row lock and committed
+at once, a row can't commit with a version older than one a reader has
+already seen. Rows left pending by a crashed worker go out with the next
+publish (or at startup).
+
+The same versions drive the till's browser-side copy: :meth:`payload`
+is the whole catalog as columnar JSON (built and gzipped once per
+snapshot) and :func:`changes_since` returns only the rows stamped after
+the version a browser already holds.
+"""
+import gzip
+import json
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import db, Product, CatalogVersion
+
+PENDING = -1                    # catalog_version of a changed row not yet published
+
+_version_t = CatalogVersion.__table__
+_product_t = Product.__table__
+_PUBLISH = 'catalog_publish'    # session.info key: publish after commit (True = with reset)
+_COMMITTED = 'catalog_committed'  # ... moved here on commit, published once the connection is back
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogItem(NamedTuple):
+    id: int
+    name: str
+    category: Optional[str]
+    cost_price: float
+    selling_price: float
+    qty_at_hand: int
+    safety_stock: int
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog at one version; safe to share across threads."""
+
+    def __init__(self, version, items, valuation=None, reset_version=0):
+        self.version = version
+        self.reset_version = reset_version
+        self.items = items                                   # id -> CatalogItem
+        self.by_name = {it.name.lower(): it.id for it in items.values()}
+        self._sorted = None
+        self._valuation = valuation
+        self._payload = None
+
+    def get(self, pid):
+        return self.items.get(pid)
+
+    def find_by_name(self, name):
+        pid = self.by_name.get((name or '').strip().lower())
+        return self.items.get(pid) if pid is not None else None
+
+    def sorted_items(self):
+        if self._sorted is None:
+            self._sorted = sorted(self.items.values(), key=lambda it: it.name)
+        return self._sorted
+
+    def names(self):
+        return [it.name for it in self.sorted_items()]
+
+    def search(self, term='', in_stock=True, limit=20):
+        term = (term or '').lower()
+        out = []
+        for it in self.sorted_items():
+            if in_stock and it.qty_at_hand <= 0:
+                continue
+            if term and term not in it.name.lower() and term not in (it.category or '').lower():
+                continue
+            out.append(it)
+            if len(out) >= limit:
+                break
+        return out
+
+    def valuation(self):
+        """Return (total_cost, total_value) of stock on hand.
+
+        Summed once per snapshot; delta refreshes carry it forward adjusted
+        for the changed rows only (see :func:`get_catalog`).
+        """
+        if self._valuation is None:
+            cost = value = 0.0
+            for it in self.items.values():
+                cost += it.qty_at_hand * it.cost_price
+                value += it.qty_at_hand * it.selling_price
+            self._valuation = (cost, value)
+        return self._valuation
+
+    def payload(self, compressed=False):
+        """The whole catalog as columnar JSON bytes (optionally gzipped).
+
+        Serialised once per snapshot, so repeat downloads cost a memcpy.
+        """
+        if self._payload is None:
+            raw = _encode(self.version, True, self.sorted_items())
+            self._payload = (raw, gzip.compress(raw, compresslevel=6))
+        return self._payload[1] if compressed else self._payload[0]
+
+
+_lock = threading.Lock()
+_snapshot: Optional[CatalogSnapshot] = None
+
+
+def _row_to_item(r):
+    return CatalogItem(r.id, r.name, r.category, float(r.cost_price or 0.0),
+                       float(r.selling_price or 0.0), int(r.qty_at_hand or 0),
+                       int(r.safety_stock or 0))
+
+
+def _item_select():
+    return select(_product_t.c.id, _product_t.c.name, _product_t.c.category,
+                  _product_t.c.cost_price, _product_t.c.selling_price,
+                  _product_t.c.qty_at_hand, _product_t.c.safety_stock)
+
+
+def _read_version():
+    row = db.session.execute(
+        select(_version_t.c.version, _version_t.c.reset_version).where(_version_t.c.id == 1)
+    ).first()
+    return (row.version, row.reset_version) if row else (0, 0)
+
+
+def get_catalog() -> CatalogSnapshot:
+    """Return a snapshot no older than the committed catalog version."""
+    global _snapshot
+    version, reset_version = _read_version()
+    snap = _snapshot
+    if snap is not None and snap.version == version:
+        return snap
+
+    with _lock:
+        snap = _snapshot
+        if snap is not None and snap.version == version:
+            return snap
+        valuation = None
+        if snap is None or reset_version > snap.version or version < snap.version:
+            rows = db.session.execute(_item_select()).all()
+            items = {r.id: _row_to_item(r) for r in rows}
+        else:
+            rows = db.session.execute(
+                _item_select().where(_product_t.c.catalog_version > snap.version)
+            ).all()
+            items = dict(snap.items)
+            cost, value = snap._valuation if snap._valuation is not None else (None, None)
+            for r in rows:
+                new = items[r.id] = _row_to_item(r)
+                old = snap.items.get(r.id)
+                if cost is not None:
+                    if old is not None:
+                        cost -= old.qty_at_hand * old.cost_price
+                        value -= old.qty_at_hand * old.selling_price
+                    cost += new.qty_at_hand * new.cost_price
+                    value += new.qty_at_hand * new.selling_price
+            if cost is not None:
+                valuation = (cost, value)
+        _snapshot = CatalogSnapshot(version, items, valuation, reset_version)
+        return _snapshot
+
+
+SYNC_FIELDS = ('id', 'name', 'category', 'price', 'cost', 'stock')
+
+
+def _encode(version, full, items):
+    columns = {
+        'id': [it.id for it in items],
+        'name': [it.name for it in items],
+        'category': [it.category for it in items],
+        'price': [it.selling_price for it in items],
+        'cost': [it.cost_price for it in items],
+        'stock': [it.qty_at_hand for it in items],
+    }
+    return json.dumps({'version': version, 'full': full, 'fields': SYNC_FIELDS,
+                       'columns': columns}, separators=(',', ':')).encode()
+
+
+def changes_since(since):
+    """Columnar JSON of products changed after version ``since``.
+
+    Returns None when the caller must take the full :meth:`payload`
+    instead: products were deleted since then (deletes bump
+    ``reset_version`` rather than leaving a tombstone), or ``since`` is
+    not a version this database has issued.
+    """
+    version, reset_version = _read_version()
+    if since < reset_version or since > version:
+        return None
+    if since == version:
+        return _encode(version, False, [])
+    # rows stamped after `version` may slip in; the client refetches them next time
+    rows = db.session.execute(
+        _item_select().where(_product_t.c.catalog_version > since)
+    ).all()
+    return _encode(version, False, [_row_to_item(r) for r in rows])
+
+
+def invalidate():
+    """Drop this worker's snapshot; the next read reloads in full."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def _bump(connection, reset=False):
+    """Increment the catalog version on ``connection`` and return the new value."""
+    values = {'version': _version_t.c.version + 1}
+    if reset:
+        values['reset_version'] = _version_t.c.version + 1
+    res = connection.execute(update(_version_t).where(_version_t.c.id == 1).values(**values))
+    if res.rowcount == 0:
+        connection.execute(insert(_version_t).values(id=1, version=1,
+                                                     reset_version=1 if reset else 0))
+        return 1
+    return connection.execute(
+        select(_version_t.c.version).where(_version_t.c.id == 1)
+    ).scalar_one()
+
+
+def stamp(reset=False, session=None):
+    """Have the current transaction publish catalog changes once it commits.
+
+    Returns :data:`PENDING`, the value to write to changed rows'
+    ``catalog_version``. Pass ``reset=True`` when products were deleted.
+    """
+    session = session or db.session
+    session.info[_PUBLISH] = session.info.get(_PUBLISH, False) or reset
+    return PENDING
+
+
+def publish(reset=False):
+    """Stamp every pending product with a new catalog version; returns it.
+
+    Runs in its own short transaction. Pending rows another transaction is
+    still writing are skipped (SKIP LOCKED); that writer publishes them
+    when it commits.
+    """
+    with db.engine.begin() as conn:
+        version = _bump(conn, reset)
+        pending = (select(_product_t.c.id)
+                   .where(_product_t.c.catalog_version == PENDING)
+                   .with_for_update(skip_locked=True)
+                   .scalar_subquery())
+        conn.execute(update(_product_t).where(_product_t.c.id.in_(pending))
+                     .values(catalog_version=version))
+    return version
+
+
+def touch(product_ids=None, reset=False):
+    """Mark products changed by bulk SQL that bypasses the ORM flush hook.
+
+    Pass ``reset=True`` after bulk deletes so workers reload in full.
+    Runs on the current transaction; the change is published when the
+    caller commits.
+    """
+    pending = stamp(reset=reset)
+    if product_ids:
+        db.session.execute(update(_product_t)
+                           .where(_product_t.c.id.in_(list(product_ids)))
+                           .values(catalog_version=pending))
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_product_changes(session, flush_context, instances):
+    changed = [o for o in session.new if isinstance(o, Product)]
+    changed += [o for o in session.dirty
+                if isinstance(o, Product) and session.is_modified(o, include_collections=False)]
+    deleted = any(isinstance(o, Product) for o in session.deleted)
+    if not changed and not deleted:
+        return
+    pending = stamp(reset=deleted, session=session)
+    for p in changed:
+        p.catalog_version = pending
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_changes(session):
+    if _PUBLISH in session.info:
+        session.info[_COMMITTED] = session.info.pop(_PUBLISH)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _publish_changes(session, transaction):
+    # runs once the session has handed its connection back to the pool, so
+    # publishing never holds two connections at once
+    if transaction.parent is not None or _COMMITTED not in session.info:
+        return
+    reset = session.info.pop(_COMMITTED)
+    try:
+        publish(reset=reset)
+    except SQLAlchemyError:
+        # the caller's work is already committed; its rows stay pending and
+        # go out with the next publish
+        logger.warning('catalog publish failed; changes stay pending', exc_info=True)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_changes(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_PUBLISH, None)
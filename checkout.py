@@ -0,0 +1,170 @@
+"""Basket checkout: many sale lines in one request and one transaction.
+
+All products in the basket are fetched with a single query, every line is
+checked for stock and below-cost pricing before anything is written, and
+the ``Sale`` rows, rollup/shift counters and audit entries are committed
+together. A basket either goes through completely or not at all.
+
+Lines may carry the till's idempotency ``key`` (see sale_sync.py), so a
+basket whose response was lost can be replayed, here or through the
+offline sync, without recording it twice.
+"""
+from datetime import date
+
+from flask import current_app
+from flask_login import current_user
+
+import audit
+import sale_sync
+import sales_rollup
+import shift_state
+import stock
+from models import db, Product, Sale
+
+MAX_LINES = 100
+
+
+class CheckoutError(ValueError):
+    """Basket rejected; ``errors`` lists ``{'line': n, 'error': msg}`` items."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(e['error'] for e in errors))
+        self.errors = errors
+
+
+def _parse_lines(raw_lines):
+    if not isinstance(raw_lines, list) or not raw_lines:
+        raise CheckoutError([{'line': None, 'error': 'Basket is empty.'}])
+    if len(raw_lines) > MAX_LINES:
+        raise CheckoutError([{'line': None, 'error': f'At most {MAX_LINES} lines per checkout.'}])
+
+    lines, errors = [], []
+    for n, raw in enumerate(raw_lines, 1):
+        try:
+            product_id = int(raw['product_id'])
+            qty = int(raw['quantity'])
+            price = raw.get('unit_price')
+            price = float(price) if price not in (None, '') else None
+            key = raw.get('key') or None
+        except (KeyError, TypeError, ValueError, AttributeError):
+            errors.append({'line': n, 'error': 'Invalid product, quantity or price.'})
+            continue
+        if key is not None and not sale_sync.valid_key(key):
+            errors.append({'line': n, 'error': 'Invalid sale key.'})
+        if qty < 1:
+            errors.append({'line': n, 'error': 'Quantity must be at least 1.'})
+        elif price is not None and price < 0.01:
+            errors.append({'line': n, 'error': 'Price must be at least 0.01.'})
+        else:
+            lines.append((n, product_id, qty, price, key))
+    if errors:
+        raise CheckoutError(errors)
+    return lines
+
+
+def _parse_date(value):
+    if not value:
+        return date.today()
+    try:
+        sale_date = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise CheckoutError([{'line': None, 'error': 'Invalid sale date.'}])
+    if sale_date > date.today():
+        raise CheckoutError([{'line': None, 'error': 'Sale date cannot be in the future.'}])
+    return sale_date
+
+
+def checkout(raw_lines, sale_date=None):
+    """Record every line of a basket for ``current_user``.
+
+    Raises :class:`CheckoutError` (nothing written, apart from audit entries
+    for blocked below-cost attempts) or returns a summary dict.
+    """
+    cur = current_app.config['CURRENCY_SYMBOL']
+    lines = _parse_lines(raw_lines)
+    sale_date = _parse_date(sale_date)
+    keys = [key for *_, key in lines if key]
+    if len(set(keys)) != len(keys):
+        raise CheckoutError([{'line': None, 'error': 'Duplicate sale key in basket.'}])
+    if sale_sync.recorded(keys):
+        raise CheckoutError([{'line': None, 'error': 'This basket was already recorded.'}])
+
+    ids = {pid for _, pid, _, _, _ in lines}
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(ids))}
+
+    errors, blocked, overrides = [], [], []
+    wanted = {}
+    for n, pid, qty, price, _ in lines:
+        product = products.get(pid)
+        if product is None:
+            errors.append({'line': n, 'error': 'Product not found!'})
+            continue
+        wanted[pid] = wanted.get(pid, 0) + qty
+        effective = price if price else float(product.selling_price or 0)
+        if effective < float(product.cost_price or 0):
+            detail = (f"{qty} × {product.name} at {cur}{effective:.2f} "
+                      f"(< cost {cur}{product.cost_price:.2f})")
+            audit_fields = dict(product_id=pid, amount=effective)
+            if current_user.role != 'manager':
+                blocked.append((f"Attempted {detail}", audit_fields))
+                errors.append({'line': n, 'error': f'{product.name}: price below cost is not allowed. '
+                                                   'Please ask a manager.'})
+            else:
+                overrides.append((f"Manager approved {detail} (basket)", audit_fields))
+    # stock is checked against the basket total per product
+    for pid, qty in wanted.items():
+        product = products[pid]
+        if product.qty_at_hand < qty:
+            errors.append({'line': None, 'error': f'Not enough stock of {product.name} '
+                                                  f'({product.qty_at_hand} left, basket has {qty}).'})
+
+    if errors:
+        if blocked:
+            for details, fields in blocked:
+                audit.record('below_cost_attempt_blocked', details, **fields)
+            db.session.commit()
+        raise CheckoutError(errors)
+
+    shift = shift_state.current().shift
+    sales = []
+    for n, pid, qty, price, key in lines:
+        product = products[pid]
+        sale = Sale(product_id=pid, product=product, qty_sold=qty, date=sale_date, unit_price=price,
+                    cashier_id=current_user.id, shift_id=shift.id if shift else None, client_key=key)
+        sales.append(sale)
+
+    # the check above gives friendly messages; the conditional decrement is authoritative
+    try:
+        stock.take_many([(s.product_id, s.qty_sold, s) for s in sales])
+    except stock.OutOfStock as e:
+        name = products[e.product_id].name
+        db.session.rollback()
+        raise CheckoutError([{'line': None, 'error': f'Not enough stock of {name} '
+                                                     f'({e.available} left, basket has {e.requested}).'}])
+
+    for details, fields in overrides:
+        audit.record('below_cost_override', details, **fields)
+    db.session.add_all(sales)
+    sales_rollup.add_sales(sales)
+    shift_state.add_sales(sales, products)
+    db.session.flush()
+
+    # alternate prices are queued audit entries: prepare now, record after the commit
+    alt_prices = [
+        (f"{s.qty_sold} × {s.product.name} at {cur}{s.unit_price:.2f} "
+         f"(list {cur}{s.product.selling_price:.2f})",
+         dict(product_id=s.product_id, sale_id=s.id, amount=s.unit_price))
+        for s in sales if s.unit_price and s.unit_price != float(s.product.selling_price or 0)
+    ]
+
+    # summarise before commit expires the rows
+    summary = {
+        'sale_ids': [s.id for s in sales],
+        'lines': len(sales),
+        'total_qty': sum(s.qty_sold for s in sales),
+        'total': round(sum(shift_state.sale_revenue(s) for s in sales), 2),
+    }
+    db.session.commit()
+    for details, fields in alt_prices:
+        audit.record('sale_alt_price', details, **fields)
+    return summary
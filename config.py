@@ -33,4 +33,50 @@ class Config:
     ERROR_REPORT_SMS_TO = os.getenv("ERROR_REPORT_SMS_TO", "")
     # Login rate limits (configurable via env)
     LOGIN_RATE_LIMIT = os.getenv("LOGIN_RATE_LIMIT", "50 per 15 minutes")  # per-username
-    LOGIN_IP_LIMIT = os.getenv("LOGIN_IP_LIMIT", "200 per 15 minutes")      # per-IP safety net
\ No newline at end of file
+    LOGIN_IP_LIMIT = os.getenv("LOGIN_IP_LIMIT", "200 per 15 minutes")      # per-IP safety net
+
+    # --- Background jobs (jobs.py) ---------------------------------------
+    # 'thread' runs jobs in a small pool inside each web worker; 'external'
+    # only queues them for a separate `flask run-jobs` process.
+    JOB_RUNNER = os.getenv("JOB_RUNNER", "thread")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_ARTIFACT_DIR = os.getenv("JOB_ARTIFACT_DIR", os.path.join(basedir, "job_artifacts"))
+    JOB_RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS", "24"))
+    # Uploads/confirms above these sizes are queued instead of run in-request
+    BACKGROUND_PREVIEW_BYTES = int(os.getenv("BACKGROUND_PREVIEW_BYTES", str(256 * 1024)))
+    BACKGROUND_CONFIRM_ROWS = int(os.getenv("BACKGROUND_CONFIRM_ROWS", "2000"))
+
+    # --- PDF rendering (pdf_reports.py) -----------------------------------
+    # Renderer processes per worker, each capped in memory and recycled
+    PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+    PDF_MEMORY_MB = int(os.getenv("PDF_MEMORY_MB", "768"))
+    PDF_TASKS_PER_CHILD = int(os.getenv("PDF_TASKS_PER_CHILD", "20"))
+    PDF_TIMEOUT_SECONDS = int(os.getenv("PDF_TIMEOUT_SECONDS", "120"))
+    PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(JOB_ARTIFACT_DIR, "pdf_cache"))
+    PDF_CACHE_HOURS = int(os.getenv("PDF_CACHE_HOURS", "168"))
+
+    # --- SQL profiler (query_profiler.py) --------------------------------
+    SQL_PROFILER = os.getenv("SQL_PROFILER", "1") not in ("0", "false", "False")
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+    N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))   # same statement per request
+    PROFILER_FLUSH_SECONDS = int(os.getenv("PROFILER_FLUSH_SECONDS", "60"))
+    PROFILER_RETENTION_DAYS = int(os.getenv("PROFILER_RETENTION_DAYS", "7"))
+
+    # --- Audit log (audit.py) ----------------------------------------------
+    # Non-security entries are queued per worker and bulk-inserted on this
+    # interval or once AUDIT_BATCH_SIZE are waiting; the queue is capped.
+    AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "5"))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "10000"))
+    # 429 / server-error entries older than AUDIT_NOISE_DAYS are folded into
+    # daily counters every AUDIT_COMPACT_HOURS (0 = only `flask compact-audit-log`)
+    AUDIT_NOISE_DAYS = int(os.getenv("AUDIT_NOISE_DAYS", "14"))
+    AUDIT_COMPACT_HOURS = float(os.getenv("AUDIT_COMPACT_HOURS", "24"))
+
+    # --- Startup ---------------------------------------------------------
+    # auto: skip db.create_all() when the DB is already at the migration head;
+    # always / never force it on or off.
+    SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "auto")
+    # Workers re-read alembic_version this often and reload schema_caps.py
+    # when `flask db upgrade` has moved it (0 = only at startup)
+    SCHEMA_CAPS_RECHECK_SECONDS = float(os.getenv("SCHEMA_CAPS_RECHECK_SECONDS", "60"))
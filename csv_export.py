@@ -0,0 +1,103 @@
+"""Streaming CSV exports for backups and report downloads.
+
+Rows come straight from the database with ``yield_per`` (a server-side
+cursor on PostgreSQL) and are encoded a batch at a time, so memory stays
+flat however much history there is. The same row generators feed the
+HTTP response and the background job that writes the file to disk.
+"""
+import csv
+from io import StringIO
+
+from flask import Response, stream_with_context
+from sqlalchemy import func, select
+
+import sales_rollup
+from models import db, Product, Sale
+
+YIELD_PER = 1000        # rows fetched from the cursor at a time
+FLUSH_EVERY = 500       # rows encoded per chunk of the response
+
+INVENTORY_COLUMNS = ['id', 'name', 'category', 'expiry_date', 'cost_price', 'selling_price',
+                     'initial_qty', 'qty_at_hand', 'safety_stock']
+SALES_COLUMNS = ['id', 'product_id', 'product_name', 'date', 'qty_sold', 'unit_price']
+
+
+def _stream(stmt):
+    return db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def inventory_rows():
+    return _stream(
+        select(Product.id, Product.name, Product.category, Product.expiry_date,
+               Product.cost_price, Product.selling_price, Product.initial_qty,
+               Product.qty_at_hand, Product.safety_stock)
+        .order_by(Product.name)
+    )
+
+
+def sales_rows():
+    # unit_price falls back to the product's list price, as on the sales page
+    return _stream(
+        select(Sale.id, Sale.product_id, Product.name, Sale.date, Sale.qty_sold,
+               func.coalesce(Sale.unit_price, Product.selling_price))
+        .join(Product, Product.id == Sale.product_id)
+        .order_by(Sale.date.desc(), Sale.id.desc())
+    )
+
+
+def backup(kind):
+    """(header, rows) for the settings page backups; ``kind`` is inventory|sales."""
+    if kind == 'inventory':
+        return INVENTORY_COLUMNS, inventory_rows()
+    return SALES_COLUMNS, sales_rows()
+
+
+def sales_summary(start, end, breakdown):
+    """(header, rows) for the sales-summary CSV, matching the on-screen table."""
+    if breakdown == 'category':
+        return ['category', 'rev'], sales_rollup.by_category_query(start, end).yield_per(YIELD_PER)
+    if breakdown == 'product':
+        return ['name', 'qty', 'rev'], sales_rollup.by_product_query(start, end).yield_per(YIELD_PER)
+    rows = sales_rollup.daily_range_query(start, end).yield_per(YIELD_PER)
+    return (['bucket', 'qty', 'rev', 'cost', 'gp'],
+            ((r.bucket, r.qty, float(r.rev), float(r.cost), float(r.rev) - float(r.cost))
+             for r in rows))
+
+
+def iter_csv(header, rows):
+    """Yield the CSV encoded in chunks of ``FLUSH_EVERY`` rows."""
+    buf = StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(header)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % FLUSH_EVERY == 0:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def csv_response(filename, header, rows):
+    """Streamed ``text/csv`` attachment."""
+    return Response(
+        stream_with_context(iter_csv(header, rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+def write_csv(path, header, rows):
+    """Write the CSV to ``path`` chunk by chunk; returns the number of data rows."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    with open(path, 'wb') as fh:
+        for chunk in iter_csv(header, counted()):
+            fh.write(chunk)
+    return count
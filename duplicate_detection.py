@@ -0,0 +1,157 @@
+"""Fuzzy duplicate-name detection for new products.
+
+Candidates are preselected with an inverted index over name tokens and
+character trigrams, then scored in bulk by RapidFuzz, so a lookup touches
+only the handful of products that share something with the query instead
+of the whole catalog. The index is rebuilt lazily whenever product names
+in the catalog cache change.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import NamedTuple
+
+from rapidfuzz import fuzz, process
+
+import catalog_cache
+
+SIMILARITY_CUTOFF = 85          # token_set_ratio above which names look like duplicates
+MIN_TRIGRAM_OVERLAP = 0.4       # share of query trigrams a typo-variant must hit
+MAX_POSTING_SHARE = 0.05        # tokens/trigrams in more products than this are too common to block on
+MAX_POSTING_FLOOR = 50
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+
+class Match(NamedTuple):
+    id: int
+    name: str
+    score: float
+
+
+def _normalize(name):
+    return (name or '').strip().lower()
+
+
+def _tokens(norm):
+    return set(_TOKEN_RE.findall(norm))
+
+
+def _trigrams(norm):
+    grams = set()
+    for tok in _tokens(norm):
+        padded = f' {tok} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class DuplicateIndex:
+    """Token/trigram blocking index over (id, name) pairs."""
+
+    def __init__(self, items):
+        self.ids = []
+        self.names = []
+        self.norm = []
+        self._by_token = defaultdict(list)
+        self._by_gram = defaultdict(list)
+        for pos, (pid, name) in enumerate(items):
+            norm = _normalize(name)
+            self.ids.append(pid)
+            self.names.append(name)
+            self.norm.append(norm)
+            for tok in _tokens(norm):
+                self._by_token[tok].append(pos)
+            for gram in _trigrams(norm):
+                self._by_gram[gram].append(pos)
+        self._max_posting = max(MAX_POSTING_FLOOR, int(len(self.ids) * MAX_POSTING_SHARE))
+
+    def candidates(self, name):
+        """Positions of indexed names sharing a token or enough trigrams with ``name``."""
+        norm = _normalize(name)
+        cap = self._max_posting
+        found = set()
+        for tok in _tokens(norm):
+            posting = self._by_token.get(tok, ())
+            if len(posting) <= cap:
+                found.update(posting)
+        grams = _trigrams(norm)
+        if grams:
+            need = max(2, int(len(grams) * MIN_TRIGRAM_OVERLAP))
+            postings = (self._by_gram.get(gram, ()) for gram in grams)
+            hits = Counter(chain.from_iterable(p for p in postings if len(p) <= cap))
+            found.update(pos for pos, n in hits.items() if n >= need)
+        return sorted(found)
+
+    def similar(self, name, limit=5, cutoff=SIMILARITY_CUTOFF):
+        """Top ``limit`` indexed names scoring above ``cutoff``, best first."""
+        cand = self.candidates(name)
+        if not cand:
+            return []
+        hits = process.extract(
+            _normalize(name),
+            {pos: self.norm[pos] for pos in cand},
+            scorer=fuzz.token_set_ratio,
+            score_cutoff=cutoff,
+            limit=limit,
+        )
+        # score_cutoff keeps ties; a name must score strictly above the cutoff
+        return [Match(self.ids[pos], self.names[pos], score) for _, score, pos in hits if score > cutoff]
+
+    def similar_bulk(self, names, limit=5, cutoff=SIMILARITY_CUTOFF, chunk_size=500):
+        """``similar`` for many names at once.
+
+        Each chunk of queries is scored against the union of its candidates
+        in a single ``cdist`` call, keeping the score matrix bounded.
+        """
+        out = []
+        for start in range(0, len(names), chunk_size):
+            chunk = [_normalize(n) for n in names[start:start + chunk_size]]
+            cand_union = sorted(set().union(*(self.candidates(n) for n in chunk)))
+            if not cand_union:
+                out.extend([] for _ in chunk)
+                continue
+            scores = process.cdist(
+                chunk,
+                [self.norm[pos] for pos in cand_union],
+                scorer=fuzz.token_set_ratio,
+                score_cutoff=cutoff,
+                workers=-1,
+            )
+            for row in scores:
+                cols = [c for c in row.argsort()[::-1][:limit] if row[c] > cutoff]
+                out.append([Match(self.ids[cand_union[c]], self.names[cand_union[c]], float(row[c]))
+                            for c in cols])
+        return out
+
+
+_lock = threading.Lock()
+_cached = (None, None, None)    # (catalog version, name -> id map, DuplicateIndex)
+
+
+def get_index():
+    """Index over the current catalog, rebuilt only when product names change.
+
+    Stock and price edits bump the catalog version too, so the name map is
+    compared before paying for a rebuild.
+    """
+    global _cached
+    snap = catalog_cache.get_catalog()
+    version, by_name, index = _cached
+    if version == snap.version:
+        return index
+    with _lock:
+        version, by_name, index = _cached
+        if version != snap.version:
+            if index is None or by_name != snap.by_name:
+                index = DuplicateIndex((it.id, it.name) for it in snap.sorted_items())
+            _cached = (snap.version, snap.by_name, index)
+        return index
+
+
+def find_similar(name, limit=5, cutoff=SIMILARITY_CUTOFF):
+    return get_index().similar(name, limit=limit, cutoff=cutoff)
+
+
+def find_similar_bulk(names, limit=5, cutoff=SIMILARITY_CUTOFF):
+    return get_index().similar_bulk(list(names), limit=limit, cutoff=cutoff)
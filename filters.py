@@ -0,0 +1,29 @@
+"""Query-string parsing shared by the filtered report pages.
+
+Each report's ``from_args`` parses its args with :func:`parse_date` /
+:func:`parse_int` and turns any ``ValueError`` into :class:`BadFilter`,
+which the routes answer with a 400.
+"""
+from datetime import date
+
+
+class BadFilter(ValueError):
+    pass
+
+
+def parse_date(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'invalid date {value!r}')
+
+
+def parse_int(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'invalid number {value!r}')
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, IntegerField, FloatField, DateField, SelectField, SubmitField, BooleanField, PasswordField
+from wtforms import StringField, IntegerField, FloatField, DateField, SelectField, SubmitField, BooleanField, PasswordField, HiddenField
 from wtforms.validators import DataRequired, NumberRange,  ValidationError, Optional
 from datetime import date
 from models import Product
@@ -24,6 +24,7 @@ class RecordSaleForm(FlaskForm):
     quantity = IntegerField('Quantity sold', validators=[NumberRange(min=1)])
     unit_price = FloatField('Alternate price (optional)', validators=[Optional(), NumberRange(min=0.01)])
     sale_date = DateField('Sale date', format='%Y-%m-%d', default=date.today, validators=[DataRequired()])
+    client_key = HiddenField()        # set per page load by the till, so a resubmit records once
     submit = SubmitField('Record Sale')
     
     # Add custom validation for product existence
@@ -52,6 +53,7 @@ class EditProductForm(FlaskForm):
     expiry_date = DateField('Expiry', format='%Y-%m-%d')
     cost_price = FloatField('Cost', validators=[NumberRange(min=0.01)])
     selling_price = FloatField('Selling', validators=[NumberRange(min=0.01)])
+    barcodes = StringField('Barcodes (comma-separated)')
     submit = SubmitField('Save')
 
 class LoginForm(FlaskForm):
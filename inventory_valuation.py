@@ -0,0 +1,228 @@
+"""Inventory valuation report: SQL totals and keyset-paged rows.
+
+Totals are one aggregate query grouped by category, and a page is a plain
+column select ordered on ``(sort column, id)`` that continues from an
+opaque cursor, as in sales_history.py. No ``Product`` objects are loaded,
+so the report costs the same for fifty products or fifty thousand.
+
+With an ``as_of`` date the same queries value the stock held at the end of
+that day: quantities come from stock_ledger.stock_on (month-end snapshot
+plus the movements since, joined in as a subquery) and prices from the
+first snapshot on or after the day, falling back to current prices
+(snapshots are taken by ``flask snapshot-stock``, never by the report). A
+day covered by such a snapshot is closed – neither its stock nor its
+prices can change any more – so its category totals are computed once per
+worker and kept, until a product is deleted (the catalog's
+``reset_version`` moves, see catalog_cache.py). Products deleted since are
+not included.
+"""
+import base64
+import json
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import and_, func, select, tuple_
+
+import catalog_cache
+import stock_ledger
+from filters import BadFilter, parse_date, parse_int
+from models import db, Product, StockSnapshot
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+CLOSED_CACHE_SIZE = 256         # closed days whose category totals are kept
+
+SORTS = ('name', 'category', 'qty', 'cost_value', 'sell_value')
+
+_closed = {}                    # (as_of, price snapshot day, catalog reset_version) -> category totals
+_closed_lock = threading.Lock()
+
+
+@dataclass
+class _View:
+    """Column expressions for stock and prices, now or at the end of a past day."""
+    qty: object
+    cost_price: object
+    selling_price: object
+    joins: tuple = ()
+    as_of: Optional[date] = None
+    closed_on: Optional[date] = None    # price snapshot day when the day is closed
+
+    def select(self, *columns):
+        stmt = select(*columns).select_from(Product)
+        for target, onclause in self.joins:
+            stmt = stmt.outerjoin(target, onclause)
+        return stmt
+
+    def sort_key(self, sort):
+        return {
+            'name': func.lower(Product.name),
+            'category': func.coalesce(Product.category, ''),
+            'qty': self.qty,
+            'cost_value': self.qty * self.cost_price,
+            'sell_value': self.qty * self.selling_price,
+        }[sort]
+
+
+def view_for(as_of=None):
+    """Stock and price columns for the end of ``as_of`` (None: current stock)."""
+    if as_of is None or as_of >= date.today():
+        return _View(Product.qty_at_hand, Product.cost_price, Product.selling_price)
+    # read only: snapshots come from `flask snapshot-stock`; until the one
+    # closing this month exists, the day is valued at current prices
+    close_day = db.session.execute(
+        select(func.min(StockSnapshot.day)).where(StockSnapshot.day >= as_of)
+    ).scalar()
+    joins = []
+    cost, sell = Product.cost_price, Product.selling_price
+    if close_day is not None:
+        ps = StockSnapshot.__table__.alias('price_snapshot')
+        joins.append((ps, and_(ps.c.product_id == Product.id, ps.c.day == close_day)))
+        cost = func.coalesce(ps.c.cost_price, Product.cost_price)
+        sell = func.coalesce(ps.c.selling_price, Product.selling_price)
+    if close_day == as_of:
+        qty = func.coalesce(ps.c.qty, 0)                # a snapshot day: no ledger needed
+    else:
+        sub, qty = stock_ledger.stock_on(as_of)
+        if sub is not None:
+            joins.append((sub, sub.c.product_id == Product.id))
+    return _View(qty, cost, sell, tuple(joins), as_of=as_of, closed_on=close_day)
+
+
+@dataclass
+class ReportFilter:
+    category: Optional[str] = None
+    as_of: Optional[date] = None
+    sort: str = 'name'
+    order: str = 'asc'
+    limit: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args):
+        try:
+            limit = parse_int(args.get('limit')) or DEFAULT_PAGE_SIZE
+            as_of = parse_date(args.get('as_of'))
+        except ValueError as e:
+            raise BadFilter(str(e))
+        if as_of is not None and as_of >= date.today():
+            as_of = None                                # today is the live stock
+        sort = args.get('sort') or 'name'
+        if sort not in SORTS:
+            raise BadFilter(f'unknown sort {sort!r}')
+        order = (args.get('order') or ('asc' if sort in ('name', 'category') else 'desc')).lower()
+        if order not in ('asc', 'desc'):
+            raise BadFilter(f'unknown order {order!r}')
+        return cls(category=args.get('category') or None, as_of=as_of, sort=sort, order=order,
+                   limit=max(1, min(limit, MAX_PAGE_SIZE)))
+
+    def as_args(self):
+        """Query-string args that reproduce this filter (for pager links)."""
+        args = {'sort': self.sort, 'order': self.order}
+        if self.category:
+            args['category'] = self.category
+        if self.as_of:
+            args['as_of'] = self.as_of.isoformat()
+        if self.limit != DEFAULT_PAGE_SIZE:
+            args['limit'] = self.limit
+        return args
+
+
+def encode_cursor(value, product_id):
+    raw = json.dumps([value, product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value, product_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return value, int(product_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise BadFilter('invalid cursor')
+
+
+def _category_totals(view):
+    stmt = view.select(
+        Product.category,
+        func.count(Product.id),
+        func.coalesce(func.sum(view.qty), 0),
+        func.coalesce(func.sum(view.qty * view.cost_price), 0.0),
+        func.coalesce(func.sum(view.qty * view.selling_price), 0.0),
+    ).group_by(Product.category).order_by(func.coalesce(Product.category, ''))
+    return [{'category': category, 'products': products, 'units': int(units),
+             'cost': float(cost), 'sell': float(sell)}
+            for category, products, units, cost, sell in db.session.execute(stmt)]
+
+
+def by_category(view=None):
+    """Per-category ``{'category', 'products', 'units', 'cost', 'sell'}``, one grouped query."""
+    view = view or view_for()
+    if view.closed_on is None:
+        return _category_totals(view)
+    key = (view.as_of, view.closed_on, catalog_cache.get_catalog().reset_version)
+    with _closed_lock:
+        cached = _closed.get(key)
+    if cached is None:
+        cached = _category_totals(view)
+        with _closed_lock:
+            if len(_closed) >= CLOSED_CACHE_SIZE:
+                _closed.pop(next(iter(_closed)))
+            _closed[key] = cached
+    return cached
+
+
+def totals(category=None, view=None):
+    """``{'products', 'units', 'cost', 'sell'}`` for the whole stock (or one category)."""
+    rows = by_category(view)
+    if category:
+        rows = [r for r in rows if r['category'] == category]
+    return {
+        'products': sum(r['products'] for r in rows),
+        'units': sum(r['units'] for r in rows),
+        'cost': sum(r['cost'] for r in rows),
+        'sell': sum(r['sell'] for r in rows),
+    }
+
+
+def page(filters, cursor=None, view=None):
+    """Return ``(rows, next_cursor)``; rows have id, name, category, qty and values."""
+    view = view or view_for(filters.as_of)
+    key = view.sort_key(filters.sort)
+    stmt = view.select(Product.id, Product.name, Product.category,
+                       view.qty.label('qty_at_hand'),
+                       view.cost_price.label('cost_price'),
+                       view.selling_price.label('selling_price'),
+                       (view.qty * view.cost_price).label('cost_value'),
+                       (view.qty * view.selling_price).label('sell_value'),
+                       key.label('sort_key'))
+    if filters.category:
+        stmt = stmt.where(Product.category == filters.category)
+    if cursor:
+        after = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(key, Product.id) > after if filters.order == 'asc'
+                          else tuple_(key, Product.id) < after)
+    if filters.order == 'asc':
+        stmt = stmt.order_by(key.asc(), Product.id.asc())
+    else:
+        stmt = stmt.order_by(key.desc(), Product.id.desc())
+
+    rows = db.session.execute(stmt.limit(filters.limit + 1)).all()
+    next_cursor = None
+    if len(rows) > filters.limit:
+        rows = rows[:filters.limit]
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].id)
+    return rows, next_cursor
+
+
+def row_payload(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'category': row.category,
+        'qty_at_hand': row.qty_at_hand,
+        'cost_price': row.cost_price,
+        'selling_price': row.selling_price,
+        'cost_value': round(row.cost_value or 0.0, 2),
+        'sell_value': round(row.sell_value or 0.0, 2),
+    }
@@ -0,0 +1,253 @@
+"""Background jobs for slow batch uploads and exports.
+
+Long operations are recorded in the ``job`` table and run off the request
+thread, either in a small per-worker thread pool (``JOB_RUNNER=thread``)
+or by a separate ``flask run-jobs`` process (``JOB_RUNNER=external``).
+The browser polls ``/jobs/<id>`` for progress and fetches any produced
+file from ``/jobs/<id>/download``.
+
+Modules register work with :func:`handler`; a handler receives a
+:class:`JobContext` and the JSON params it was submitted with and returns
+a JSON-serialisable result.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify, send_file, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+
+from models import db, Job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+_handlers = {}                  # kind -> (run, render)
+_executor = None
+_executor_lock = threading.Lock()
+
+STALE_AFTER = timedelta(hours=2)     # running jobs older than this died with their worker
+PURGE_EVERY = 15 * 60                # seconds between purges by a runner
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def handler(kind, render=None):
+    """Register ``fn(ctx, params)`` for ``kind``.
+
+    ``render(job, result)`` may return HTML that the status endpoint sends
+    once the job is done (e.g. the batch preview table).
+    """
+    def deco(fn):
+        _handlers[kind] = (fn, render)
+        return fn
+    return deco
+
+
+def artifact_dir():
+    return current_app.config['JOB_ARTIFACT_DIR']
+
+
+class JobContext:
+    """Handed to a running handler for progress and artifact bookkeeping."""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.user_id = job.created_by
+        self._last_report = 0.0
+
+    def progress(self, done, total, message=None):
+        # throttle writes; always record the final step
+        now = time.monotonic()
+        if done < total and now - self._last_report < 0.5:
+            return
+        self._last_report = now
+        values = {'progress_done': done, 'progress_total': total}
+        if message is not None:
+            values['message'] = message[:200]
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+
+    def artifact(self, filename, mimetype):
+        """Return the path the handler should write its downloadable file to."""
+        os.makedirs(artifact_dir(), exist_ok=True)
+        path = os.path.join(artifact_dir(), f'{self.job_id}_{secure_filename(filename)}')
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(
+            artifact_path=path, artifact_name=filename, artifact_mimetype=mimetype))
+        return path
+
+
+def spool_upload(file_storage):
+    """Save an uploaded file for a job to read later; returns its path."""
+    folder = os.path.join(artifact_dir(), 'uploads')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{uuid.uuid4().hex}_{secure_filename(file_storage.filename)}')
+    file_storage.save(path)
+    return path
+
+
+def submit(kind, params, user_id=None):
+    """Queue a job and, in thread mode, start it. Returns the Job row."""
+    if kind not in _handlers:
+        raise KeyError(f'no job handler for {kind!r}')
+    job = Job(id=uuid.uuid4().hex, kind=kind, status='queued',
+              params=json.dumps(params, default=str), created_by=user_id)
+    db.session.add(job)
+    db.session.commit()
+    if current_app.config.get('JOB_RUNNER', 'thread') == 'thread':
+        _pool().submit(run_job, current_app._get_current_object(), job.id)
+    return job
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config.get('JOB_WORKERS', 2),
+                                           thread_name_prefix='job')
+        return _executor
+
+
+def run_job(app, job_id):
+    """Claim and run one queued job. Returns False if another runner took it."""
+    with app.app_context():
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return False
+
+        job = db.session.get(Job, job_id)
+        run, _ = _handlers[job.kind]
+        try:
+            result = run(JobContext(job), json.loads(job.params or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Job %s (%s) failed', job_id, job.kind)
+            values = {'status': 'failed', 'error': str(e)[:2000]}
+        else:
+            values = {'status': 'done',
+                      'result': json.dumps(result, default=str) if result is not None else None}
+        values['finished_at'] = datetime.utcnow()
+        db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+        db.session.commit()
+        _purge_if_due(app)
+        return True
+
+
+def run_pending(app, once=False, poll_seconds=2.0):
+    """Worker loop for ``flask run-jobs``: run queued jobs oldest first."""
+    while True:
+        with app.app_context():
+            ids = [j for (j,) in db.session.query(Job.id)
+                   .filter(Job.status == 'queued')
+                   .order_by(Job.created_at)
+                   .limit(20)]
+        for job_id in ids:
+            run_job(app, job_id)
+        if once:
+            return
+        if not ids:
+            with app.app_context():
+                _purge_if_due(app)
+            time.sleep(poll_seconds)
+
+
+def _purge_if_due(app):
+    """Run :func:`purge_expired` from a job runner at most every ``PURGE_EVERY`` seconds."""
+    global _last_purge
+    with _purge_lock:
+        now = time.monotonic()
+        if _last_purge and now - _last_purge < PURGE_EVERY:
+            return
+        _last_purge = now
+    try:
+        purge_expired()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception('Job purge failed')
+
+
+def purge_expired():
+    """Delete finished jobs and files past retention; fail jobs orphaned by a dead worker.
+
+    Called by the job runners (the thread pool after a job, ``flask
+    run-jobs`` when idle), never on the request path.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(hours=current_app.config.get('JOB_RETENTION_HOURS', 24))
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.started_at < now - STALE_AFTER)
+        .values(status='failed', error='worker stopped before the job finished', finished_at=now)
+    )
+    # queued / running jobs are never purged, however old: their upload is still needed
+    old = Job.query.filter(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff).all()
+    for job in old:
+        params = json.loads(job.params or '{}')
+        for path in (job.artifact_path, params.get('upload_path')):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        db.session.delete(job)
+    db.session.commit()
+
+
+def status_payload(job):
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'done': job.progress_done,
+        'total': job.progress_total,
+        'message': job.message,
+        'status_url': url_for('jobs.job_status', job_id=job.id),
+    }
+    if job.status == 'failed':
+        data['error'] = job.error
+    if job.status == 'done':
+        result = json.loads(job.result) if job.result else None
+        data['result'] = result
+        _, render = _handlers.get(job.kind, (None, None))
+        if render is not None:
+            data['html'] = render(job, result)
+        if job.artifact_path:
+            data['download_url'] = url_for('jobs.job_download', job_id=job.id)
+    return data
+
+
+def _visible_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    if current_user.role != 'manager' and job.created_by != current_user.id:
+        abort(403)
+    return job
+
+
+@jobs_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    return jsonify(status_payload(_visible_job(job_id)))
+
+
+@jobs_bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = _visible_job(job_id)
+    if job.status != 'done' or not job.artifact_path or not os.path.exists(job.artifact_path):
+        abort(404)
+    return send_file(job.artifact_path,
+                     mimetype=job.artifact_mimetype,
+                     as_attachment=True,
+                     download_name=job.artifact_name)
@@ -0,0 +1,53 @@
+"""Add stock_movement ledger and stock_snapshot tables
+
+Revision ID: a1b2c3d4e5f6
+Revises: f0a1b2c3d4e5
+Create Date: 2025-10-15 11:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a1b2c3d4e5f6'
+down_revision = 'f0a1b2c3d4e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'stock_movement' not in tables:
+        op.create_table(
+            'stock_movement',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('delta', sa.Integer(), nullable=False),
+            sa.Column('qty_after', sa.Integer(), nullable=False),
+            sa.Column('reason', sa.String(length=20), nullable=False),
+            sa.Column('ref_id', sa.Integer(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_stock_movement_product_timestamp', 'stock_movement',
+                        ['product_id', 'timestamp', 'id'], unique=False)
+        op.create_index('ix_stock_movement_timestamp_id', 'stock_movement', ['timestamp', 'id'], unique=False)
+    if 'stock_snapshot' not in tables:
+        op.create_table(
+            'stock_snapshot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('qty', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_stock_snapshot_day_product', 'stock_snapshot', ['day', 'product_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_stock_snapshot_day_product', table_name='stock_snapshot')
+    op.drop_table('stock_snapshot')
+    op.drop_index('ix_stock_movement_timestamp_id', table_name='stock_movement')
+    op.drop_index('ix_stock_movement_product_timestamp', table_name='stock_movement')
+    op.drop_table('stock_movement')
@@ -0,0 +1,55 @@
+"""Add query_stat and slow_query tables for the SQL profiler
+
+Revision ID: a5b6c7d8e9f0
+Revises: f4a5b6c7d8e9
+Create Date: 2025-10-08 11:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a5b6c7d8e9f0'
+down_revision = 'f4a5b6c7d8e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    tables = set(sa.inspect(bind).get_table_names())
+    if 'query_stat' not in tables:
+        op.create_table(
+            'query_stat',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('endpoint', sa.String(length=120), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('requests', sa.Integer(), nullable=False),
+            sa.Column('queries', sa.Integer(), nullable=False),
+            sa.Column('max_queries', sa.Integer(), nullable=False),
+            sa.Column('sql_ms', sa.Float(), nullable=False),
+            sa.Column('request_ms', sa.Float(), nullable=False),
+            sa.Column('max_request_ms', sa.Float(), nullable=False),
+            sa.Column('n_plus_one', sa.Integer(), nullable=False),
+            sa.Column('slow_queries', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_query_stat_key', 'query_stat', ['bucket', 'endpoint'], unique=True)
+    if 'slow_query' not in tables:
+        op.create_table(
+            'slow_query',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('timestamp', sa.DateTime(), nullable=False),
+            sa.Column('endpoint', sa.String(length=120), nullable=True),
+            sa.Column('duration_ms', sa.Float(), nullable=False),
+            sa.Column('statement', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_slow_query_timestamp', 'slow_query', ['timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_slow_query_timestamp', table_name='slow_query')
+    op.drop_table('slow_query')
+    op.drop_index('ix_query_stat_key', table_name='query_stat')
+    op.drop_table('query_stat')
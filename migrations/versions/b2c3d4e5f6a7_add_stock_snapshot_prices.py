@@ -0,0 +1,30 @@
+"""Add cost_price and selling_price to stock_snapshot
+
+Revision ID: b2c3d4e5f6a7
+Revises: a1b2c3d4e5f6
+Create Date: 2025-10-16 10:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b2c3d4e5f6a7'
+down_revision = 'a1b2c3d4e5f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('stock_snapshot')}
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        if 'cost_price' not in columns:
+            batch_op.add_column(sa.Column('cost_price', sa.Float(), nullable=True))
+        if 'selling_price' not in columns:
+            batch_op.add_column(sa.Column('selling_price', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('stock_snapshot', schema=None) as batch_op:
+        batch_op.drop_column('selling_price')
+        batch_op.drop_column('cost_price')
@@ -0,0 +1,71 @@
+"""Add running sales counters on shift and sale.shift_id
+
+Revision ID: b6c7d8e9f0a1
+Revises: a5b6c7d8e9f0
+Create Date: 2025-10-09 16:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b6c7d8e9f0a1'
+down_revision = 'a5b6c7d8e9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    shift_cols = [c['name'] for c in insp.get_columns('shift')]
+    if 'sales_qty' not in shift_cols:
+        with op.batch_alter_table('shift', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sales_qty', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.add_column(sa.Column('sales_rev', sa.Float(), nullable=False, server_default='0'))
+
+    sale_cols = [c['name'] for c in insp.get_columns('sale')]
+    if 'shift_id' not in sale_cols:
+        with op.batch_alter_table('sale', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('shift_id', sa.Integer(), nullable=True))
+            batch_op.create_index('ix_sale_shift_id', ['shift_id'], unique=False)
+            batch_op.create_foreign_key('fk_sale_shift_id', 'shift', ['shift_id'], ['id'])
+
+    # Attach each open shift's sales so far (same cashier, on or after the
+    # day it opened; the latest one if a cashier has several open) and seed
+    # its counters from them.
+    op.execute("""
+        UPDATE sale SET shift_id = (
+            SELECT MAX(s.id) FROM shift s
+            WHERE s.closed_at IS NULL
+              AND s.cashier_id = sale.cashier_id
+              AND sale.date >= DATE(s.opened_at)
+        )
+        WHERE shift_id IS NULL
+          AND EXISTS (
+            SELECT 1 FROM shift s
+            WHERE s.closed_at IS NULL
+              AND s.cashier_id = sale.cashier_id
+              AND sale.date >= DATE(s.opened_at)
+          )
+    """)
+    op.execute("""
+        UPDATE shift SET
+            sales_qty = COALESCE((SELECT SUM(sale.qty_sold) FROM sale
+                                  WHERE sale.shift_id = shift.id), 0),
+            sales_rev = COALESCE((SELECT SUM(sale.qty_sold * COALESCE(sale.unit_price, product.selling_price))
+                                  FROM sale JOIN product ON product.id = sale.product_id
+                                  WHERE sale.shift_id = shift.id), 0)
+        WHERE closed_at IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_sale_shift_id', type_='foreignkey')
+        batch_op.drop_index('ix_sale_shift_id')
+        batch_op.drop_column('shift_id')
+    with op.batch_alter_table('shift', schema=None) as batch_op:
+        batch_op.drop_column('sales_rev')
+        batch_op.drop_column('sales_qty')
@@ -0,0 +1,59 @@
+"""Add daily_sales_rollup table and backfill it from sale
+
+Revision ID: c1d2e3f4a5b6
+Revises: b9c8d7a6e5f4
+Create Date: 2025-10-02 09:12:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c1d2e3f4a5b6'
+down_revision = 'b9c8d7a6e5f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    # db.create_all() at app start may already have created the table
+    if 'daily_sales_rollup' not in set(insp.get_table_names()):
+        op.create_table(
+            'daily_sales_rollup',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('cashier_id', sa.Integer(), nullable=True),
+            sa.Column('qty_sold', sa.Integer(), nullable=False),
+            sa.Column('list_qty', sa.Integer(), nullable=False),
+            sa.Column('alt_revenue', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['product.id'], name='fk_daily_sales_rollup_product_id'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_daily_sales_rollup_key', 'daily_sales_rollup',
+                        ['date', 'product_id', 'cashier_id'], unique=True)
+        op.create_index('ix_daily_sales_rollup_product_id', 'daily_sales_rollup',
+                        ['product_id'], unique=False)
+
+    # Backfill from existing sales (same as `flask rebuild-sales-rollup`)
+    op.execute('DELETE FROM daily_sales_rollup')
+    op.execute(
+        """
+        INSERT INTO daily_sales_rollup
+            (date, product_id, cashier_id, qty_sold, list_qty, alt_revenue)
+        SELECT date, product_id, cashier_id,
+               SUM(qty_sold),
+               SUM(CASE WHEN unit_price IS NULL THEN qty_sold ELSE 0 END),
+               COALESCE(SUM(qty_sold * unit_price), 0.0)
+        FROM sale
+        GROUP BY date, product_id, cashier_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_index('ix_daily_sales_rollup_product_id', table_name='daily_sales_rollup')
+    op.drop_index('ix_daily_sales_rollup_key', table_name='daily_sales_rollup')
+    op.drop_table('daily_sales_rollup')
@@ -0,0 +1,29 @@
+"""Add sale.revenue, the amount counted towards the shift totals
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6a7
+Create Date: 2025-10-17 09:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c3d4e5f6a7b8'
+down_revision = 'b2c3d4e5f6a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'revenue' not in [c['name'] for c in sa.inspect(op.get_bind()).get_columns('sale')]:
+        with op.batch_alter_table('sale', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('revenue', sa.Float(), nullable=True))
+    # alternate-price sales are known exactly; list-price ones keep using the list price
+    op.execute('UPDATE sale SET revenue = qty_sold * unit_price '
+               'WHERE revenue IS NULL AND unit_price IS NOT NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.drop_column('revenue')
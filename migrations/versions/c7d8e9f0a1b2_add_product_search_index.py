@@ -0,0 +1,64 @@
+"""Add product search index (FTS5 on SQLite, pg_trgm on PostgreSQL)
+
+Revision ID: c7d8e9f0a1b2
+Revises: b6c7d8e9f0a1
+Create Date: 2025-10-11 10:15:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c7d8e9f0a1b2'
+down_revision = 'b6c7d8e9f0a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        if 'product_fts' in sa.inspect(bind).get_table_names():
+            return
+        # external-content FTS5 table; triggers keep it in step with product
+        op.execute("""
+            CREATE VIRTUAL TABLE product_fts USING fts5(
+                name, category, content='product', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')
+        """)
+        op.execute("""
+            CREATE TRIGGER product_fts_ai AFTER INSERT ON product BEGIN
+                INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER product_fts_ad AFTER DELETE ON product BEGIN
+                INSERT INTO product_fts(product_fts, rowid, name, category)
+                VALUES ('delete', old.id, old.name, old.category);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER product_fts_au AFTER UPDATE OF name, category ON product BEGIN
+                INSERT INTO product_fts(product_fts, rowid, name, category)
+                VALUES ('delete', old.id, old.name, old.category);
+                INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+            END
+        """)
+        op.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product "
+                   "USING gin (lower(name) gin_trgm_ops)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_product_category_trgm ON product "
+                   "USING gin (lower(coalesce(category, '')) gin_trgm_ops)")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('product_fts_ai', 'product_fts_ad', 'product_fts_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS product_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_product_category_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_product_name_trgm")
@@ -0,0 +1,44 @@
+"""Add catalog_version counter and product.catalog_version stamp
+
+Revision ID: d2e3f4a5b6c7
+Revises: c1d2e3f4a5b6
+Create Date: 2025-10-03 10:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd2e3f4a5b6c7'
+down_revision = 'c1d2e3f4a5b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if 'catalog_version' not in set(insp.get_table_names()):
+        op.create_table(
+            'catalog_version',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('reset_version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    op.execute('DELETE FROM catalog_version')
+    op.execute('INSERT INTO catalog_version (id, version, reset_version) VALUES (1, 1, 1)')
+
+    cols = [c['name'] for c in insp.get_columns('product')]
+    if 'catalog_version' not in cols:
+        with op.batch_alter_table('product', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('catalog_version', sa.Integer(), nullable=False,
+                                          server_default='0'))
+            batch_op.create_index('ix_product_catalog_version', ['catalog_version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_catalog_version')
+        batch_op.drop_column('catalog_version')
+    op.drop_table('catalog_version')
@@ -0,0 +1,57 @@
+"""Key daily_sales_rollup on coalesce(cashier_id, 0)
+
+NULLs never conflict in a unique index, so cashier-less sales could get
+several buckets for the same day and product. Merge those, then rebuild
+the key index on coalesce(cashier_id, 0) so upserts can target it.
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2025-10-20 10:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd4e5f6a7b8c9'
+down_revision = 'c3d4e5f6a7b8'
+branch_labels = None
+depends_on = None
+
+_SAME_BUCKET = ('d.date = daily_sales_rollup.date '
+                'AND d.product_id = daily_sales_rollup.product_id '
+                'AND d.cashier_id IS NULL')
+
+
+def upgrade():
+    # fold duplicate cashier-less buckets into the oldest one
+    op.execute(
+        f"""
+        UPDATE daily_sales_rollup SET
+            qty_sold = (SELECT SUM(d.qty_sold) FROM daily_sales_rollup d WHERE {_SAME_BUCKET}),
+            list_qty = (SELECT SUM(d.list_qty) FROM daily_sales_rollup d WHERE {_SAME_BUCKET}),
+            alt_revenue = (SELECT SUM(d.alt_revenue) FROM daily_sales_rollup d WHERE {_SAME_BUCKET})
+        WHERE cashier_id IS NULL
+          AND id = (SELECT MIN(d.id) FROM daily_sales_rollup d WHERE {_SAME_BUCKET})
+          AND (SELECT COUNT(*) FROM daily_sales_rollup d WHERE {_SAME_BUCKET}) > 1
+        """
+    )
+    op.execute(
+        f"""
+        DELETE FROM daily_sales_rollup
+        WHERE cashier_id IS NULL
+          AND id > (SELECT MIN(d.id) FROM daily_sales_rollup d WHERE {_SAME_BUCKET})
+        """
+    )
+
+    indexes = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('daily_sales_rollup')}
+    if 'ix_daily_sales_rollup_key' in indexes:
+        op.drop_index('ix_daily_sales_rollup_key', table_name='daily_sales_rollup')
+    op.create_index('ix_daily_sales_rollup_key', 'daily_sales_rollup',
+                    ['date', 'product_id', sa.text('coalesce(cashier_id, 0)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_daily_sales_rollup_key', table_name='daily_sales_rollup')
+    op.create_index('ix_daily_sales_rollup_key', 'daily_sales_rollup',
+                    ['date', 'product_id', 'cashier_id'], unique=True)
@@ -0,0 +1,37 @@
+"""Add product_barcode table
+
+Revision ID: d8e9f0a1b2c3
+Revises: c7d8e9f0a1b2
+Create Date: 2025-10-11 15:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd8e9f0a1b2c3'
+down_revision = 'c7d8e9f0a1b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if 'product_barcode' not in insp.get_table_names():
+        op.create_table(
+            'product_barcode',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('code', sa.String(length=64), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_product_barcode_code', 'product_barcode', ['code'], unique=True)
+        op.create_index('ix_product_barcode_product_id', 'product_barcode', ['product_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_barcode_product_id', table_name='product_barcode')
+    op.drop_index('ix_product_barcode_code', table_name='product_barcode')
+    op.drop_table('product_barcode')
@@ -0,0 +1,66 @@
+"""Structured audit log columns, filter indexes and audit_counter
+
+Revision ID: e9f0a1b2c3d4
+Revises: d8e9f0a1b2c3
+Create Date: 2025-10-12 10:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e9f0a1b2c3d4'
+down_revision = 'd8e9f0a1b2c3'
+branch_labels = None
+depends_on = None
+
+LOG_INDEXES = [
+    ('ix_log_entry_timestamp_id', ['timestamp', 'id']),
+    ('ix_log_entry_action_timestamp', ['action', 'timestamp', 'id']),
+    ('ix_log_entry_user_timestamp', ['user', 'timestamp', 'id']),
+    ('ix_log_entry_product_timestamp', ['product_id', 'timestamp', 'id']),
+    ('ix_log_entry_sale_id', ['sale_id']),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    cols = [c['name'] for c in insp.get_columns('log_entry')]
+    if 'product_id' not in cols:
+        with op.batch_alter_table('log_entry', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('product_id', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('sale_id', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('amount', sa.Float(), nullable=True))
+
+    existing = {ix['name'] for ix in insp.get_indexes('log_entry')}
+    for name, columns in LOG_INDEXES:
+        if name not in existing:
+            op.create_index(name, 'log_entry', columns, unique=False)
+    # (timestamp, id) serves everything the single-column index did
+    if 'ix_logentry_timestamp' in existing:
+        op.drop_index('ix_logentry_timestamp', table_name='log_entry')
+
+    if 'audit_counter' not in insp.get_table_names():
+        op.create_table(
+            'audit_counter',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('action', sa.String(length=120), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_audit_counter_day_action', 'audit_counter', ['day', 'action'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_audit_counter_day_action', table_name='audit_counter')
+    op.drop_table('audit_counter')
+    op.create_index('ix_logentry_timestamp', 'log_entry', ['timestamp'], unique=False)
+    for name, _ in reversed(LOG_INDEXES):
+        op.drop_index(name, table_name='log_entry')
+    with op.batch_alter_table('log_entry', schema=None) as batch_op:
+        batch_op.drop_column('amount')
+        batch_op.drop_column('sale_id')
+        batch_op.drop_column('product_id')
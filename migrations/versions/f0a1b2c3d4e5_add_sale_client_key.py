@@ -0,0 +1,31 @@
+"""Add sale.client_key idempotency key with a unique index
+
+Revision ID: f0a1b2c3d4e5
+Revises: e9f0a1b2c3d4
+Create Date: 2025-10-14 09:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f0a1b2c3d4e5'
+down_revision = 'e9f0a1b2c3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    if 'client_key' not in [c['name'] for c in insp.get_columns('sale')]:
+        with op.batch_alter_table('sale', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('client_key', sa.String(length=64), nullable=True))
+    if 'ix_sale_client_key' not in {ix['name'] for ix in insp.get_indexes('sale')}:
+        # NULLs (sales rung up online) don't collide in a unique index
+        op.create_index('ix_sale_client_key', 'sale', ['client_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_sale_client_key', table_name='sale')
+    with op.batch_alter_table('sale', schema=None) as batch_op:
+        batch_op.drop_column('client_key')
@@ -0,0 +1,25 @@
+"""Add (date, id) index on sale for keyset-paginated sales history
+
+Revision ID: f4a5b6c7d8e9
+Revises: e3f4a5b6c7d8
+Create Date: 2025-10-07 14:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f4a5b6c7d8e9'
+down_revision = 'e3f4a5b6c7d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    if 'ix_sale_date_id' not in {ix['name'] for ix in insp.get_indexes('sale')}:
+        op.create_index('ix_sale_date_id', 'sale', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sale_date_id', table_name='sale')
@@ -16,6 +16,8 @@ class Product(db.Model):
     initial_qty = db.Column(db.Integer, nullable=False)
     qty_at_hand = db.Column(db.Integer, nullable=False)
     safety_stock  = db.Column(db.Integer, nullable=False, default=5)
+    # catalog version at which this row last changed; catalog_cache.PENDING until published
+    catalog_version = db.Column(db.Integer, nullable=False, default=0, index=True)
 
     __table_args__ = (
         Index(
@@ -25,6 +27,21 @@ class Product(db.Model):
         ),
     )
 
+class ProductBarcode(db.Model):
+    """A scannable code (EAN/UPC/SKU) for a product; a product may have several."""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'),
+                           nullable=False, index=True)
+    code = db.Column(db.String(64), nullable=False)      # normalised, see barcodes.normalize()
+
+    product = db.relationship('Product', backref=db.backref(
+        'codes', lazy=True, cascade='all, delete-orphan', order_by='ProductBarcode.id'))
+
+    __table_args__ = (
+        Index('ix_product_barcode_code', 'code', unique=True),     # /scan/<code> lookup
+    )
+
+
 class Sale(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -32,10 +49,44 @@ class Sale(db.Model):
     qty_sold = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float)
     cashier_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    shift_id = db.Column(db.Integer, db.ForeignKey('shift.id'), index=True)   # shift it was rung up in
+    client_key = db.Column(db.String(64))          # till-generated idempotency key (sale_sync.py)
+    revenue = db.Column(db.Float)                  # charged when counted in its shift (shift_state.py)
 
     product = db.relationship('Product', backref=db.backref('sales', lazy=True))
     cashier = db.relationship('User', backref=db.backref('sales', lazy=True))
 
+    __table_args__ = (
+        Index('ix_sale_date_id', 'date', 'id'),     # keyset paging in sales_history.py
+        Index('ix_sale_client_key', 'client_key', unique=True),   # a queued sale is recorded once
+    )
+
+
+class DailySalesRollup(db.Model):
+    """Per-day sales totals keyed by (date, product_id, cashier_id).
+
+    The unique key treats a missing cashier as 0, so sales without one
+    still land in a single bucket per day and product.
+
+    Units sold at list price are kept apart from alternate-price revenue so
+    reports can still value them at the product's current selling price,
+    exactly like the raw ``sale`` aggregates did.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    cashier_id = db.Column(db.Integer)
+    qty_sold = db.Column(db.Integer, nullable=False, default=0)
+    list_qty = db.Column(db.Integer, nullable=False, default=0)       # units sold at list price
+    alt_revenue = db.Column(db.Float, nullable=False, default=0.0)    # revenue from alternate-price units
+
+    product = db.relationship('Product')
+
+    __table_args__ = (
+        Index('ix_daily_sales_rollup_key', date, product_id, func.coalesce(cashier_id, 0), unique=True),
+        Index('ix_daily_sales_rollup_product_id', 'product_id'),
+    )
+
 
 class User(UserMixin, db.Model):
     id       = db.Column(db.Integer, primary_key=True)
@@ -66,12 +117,141 @@ class Shift(db.Model):
     closed_at = db.Column(db.DateTime)
     total_qty = db.Column(db.Integer)
     total_rev = db.Column(db.Float)
+    # running totals kept current by shift_state.add_sale / remove_sale
+    sales_qty = db.Column(db.Integer, nullable=False, default=0)
+    sales_rev = db.Column(db.Float, nullable=False, default=0.0)
     cashier = db.relationship('User')
 
 
+class CatalogVersion(db.Model):
+    """Single-row counter bumped whenever product changes are published.
+
+    Workers compare it with their cached version to decide whether to
+    refresh; ``reset_version`` marks deletions that need a full reload.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    reset_version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """Background job queued by a web request and run by jobs.py."""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued|running|done|failed
+    params = db.Column(db.Text)               # JSON
+    result = db.Column(db.Text)               # JSON
+    error = db.Column(db.Text)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(200))
+    artifact_path = db.Column(db.String(400))
+    artifact_name = db.Column(db.String(200))
+    artifact_mimetype = db.Column(db.String(120))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class QueryStat(db.Model):
+    """Per-endpoint SQL totals for one hour, flushed by query_profiler.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(120), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)         # start of the hour (UTC)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    queries = db.Column(db.Integer, nullable=False, default=0)
+    max_queries = db.Column(db.Integer, nullable=False, default=0)
+    sql_ms = db.Column(db.Float, nullable=False, default=0.0)
+    request_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_request_ms = db.Column(db.Float, nullable=False, default=0.0)
+    n_plus_one = db.Column(db.Integer, nullable=False, default=0)   # requests with repeated statements
+    slow_queries = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_query_stat_key', 'bucket', 'endpoint', unique=True),
+    )
+
+
+class SlowQuery(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    endpoint = db.Column(db.String(120))
+    duration_ms = db.Column(db.Float, nullable=False)
+    statement = db.Column(db.Text, nullable=False)
+
+
 class LogEntry(db.Model):
+    """One audit-trail entry; written through audit.py.
+
+    ``product_id`` / ``sale_id`` are plain integers rather than foreign keys
+    so entries outlive the rows they describe (voids, resets).
+    """
     id = db.Column(db.Integer, primary_key=True)
     user = db.Column(db.String(64))
-    action = db.Column(db.String(120))
+    action = db.Column(db.String(120))          # one of audit.ACTIONS
     details = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    product_id = db.Column(db.Integer)
+    sale_id = db.Column(db.Integer, index=True)
+    amount = db.Column(db.Float)                # price charged / value involved, when there is one
+
+    __table_args__ = (
+        # keyset paging on (timestamp, id), optionally narrowed by one filter (audit_history.py)
+        Index('ix_log_entry_timestamp_id', 'timestamp', 'id'),
+        Index('ix_log_entry_action_timestamp', 'action', 'timestamp', 'id'),
+        Index('ix_log_entry_user_timestamp', 'user', 'timestamp', 'id'),
+        Index('ix_log_entry_product_timestamp', 'product_id', 'timestamp', 'id'),
+    )
+
+
+class AuditCounter(db.Model):
+    """Daily counts of audit noise (429s, server errors) compacted out of log_entry."""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    action = db.Column(db.String(120), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_audit_counter_day_action', 'day', 'action', unique=True),
+    )
+
+class StockMovement(db.Model):
+    """Append-only ledger of every change to ``Product.qty_at_hand``; written by stock.py.
+
+    ``qty_after`` is the product's stock once the movement applied, so the
+    quantity at any moment is the ``qty_after`` of the last movement before
+    it. ``product_id`` / ``ref_id`` (sale id for sale movements) are plain
+    integers, as in ``LogEntry``, so the ledger outlives voided sales.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    qty_after = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)     # one of stock.REASONS
+    ref_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_stock_movement_product_timestamp', 'product_id', 'timestamp', 'id'),
+        Index('ix_stock_movement_timestamp_id', 'timestamp', 'id'),
+    )
+
+
+class StockSnapshot(db.Model):
+    """Closing stock per product at the end of ``day`` (month ends; stock_ledger.py).
+
+    The prices are those in force when the snapshot was taken; NULL for
+    snapshots taken before they were recorded.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    qty = db.Column(db.Integer, nullable=False)
+    cost_price = db.Column(db.Float)
+    selling_price = db.Column(db.Float)
+
+    __table_args__ = (
+        Index('ix_stock_snapshot_day_product', 'day', 'product_id', unique=True),
+    )
@@ -0,0 +1,143 @@
+"""PDF rendering off the web workers, with an on-disk cache.
+
+WeasyPrint is slow and memory-hungry, so HTML is turned into PDF in a
+separate process pool (``PDF_WORKERS`` processes per web/job worker, each
+capped at ``PDF_MEMORY_MB`` of address space and replaced after
+``PDF_TASKS_PER_CHILD`` renders). Callers reach it from a background job
+(see jobs.py), never from a request thread.
+
+Finished files are kept in ``PDF_CACHE_DIR`` under a key derived from
+what the PDF shows – report, range, breakdown and a digest of the rows –
+so asking again for an unchanged report is a file download, and any
+change to the underlying figures yields a new key. Files older than
+``PDF_CACHE_HOURS`` are pruned.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource                 # POSIX only; no memory cap elsewhere
+except ImportError:
+    resource = None
+
+from flask import current_app
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfError(RuntimeError):
+    pass
+
+
+def cache_key(*parts):
+    """Stable key for the report identified by ``parts`` (JSON-serialisable)."""
+    raw = json.dumps(parts, default=str, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def cache_dir():
+    return current_app.config['PDF_CACHE_DIR']
+
+
+def cache_path(key):
+    return os.path.join(cache_dir(), f'{key}.pdf')
+
+
+def cached(key):
+    """Path of the cached PDF for ``key``, or None."""
+    path = cache_path(key)
+    return path if os.path.exists(path) else None
+
+
+def render(html, key):
+    """Render ``html`` into the cache under ``key`` and return the file path.
+
+    Blocks until the renderer process finishes; raises :class:`PdfError` on
+    failure, timeout or when the renderer dies (e.g. hits the memory cap).
+    """
+    path = cached(key)
+    if path:
+        return path
+    os.makedirs(cache_dir(), exist_ok=True)
+    _prune()
+    path = cache_path(key)
+    pool = _get_pool()
+    future = pool.submit(_render_file, html, path)
+    try:
+        future.result(timeout=current_app.config.get('PDF_TIMEOUT_SECONDS', 120))
+    except FutureTimeout:
+        _discard_pool(pool, kill=True)
+        raise PdfError('PDF rendering timed out')
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise PdfError('PDF renderer stopped unexpectedly (report too large for PDF_MEMORY_MB?)')
+    except MemoryError:
+        raise PdfError('PDF renderer ran out of memory; try a shorter range')
+    return path
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            cfg = current_app.config
+            # spawn, not fork: the parent is a multi-threaded web worker
+            _pool = ProcessPoolExecutor(
+                max_workers=cfg.get('PDF_WORKERS', 1),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_limit_memory,
+                initargs=(cfg.get('PDF_MEMORY_MB', 768),),
+                max_tasks_per_child=cfg.get('PDF_TASKS_PER_CHILD', 20),
+            )
+        return _pool
+
+
+def _discard_pool(pool, kill=False):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if kill:
+        # a renderer stuck past the timeout would otherwise hold its slot forever
+        for proc in list((getattr(pool, '_processes', None) or {}).values()):
+            proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _prune():
+    max_age = current_app.config.get('PDF_CACHE_HOURS', 168) * 3600
+    cutoff = time.time() - max_age
+    for entry in os.scandir(cache_dir()):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# ── runs in the renderer processes ───────────────────────────────────
+def _limit_memory(megabytes):
+    if resource is not None and megabytes:
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _render_file(html, path):
+    try:
+        import weasyprint           # deferred: only the renderer processes load it
+    except ImportError:
+        raise PdfError('PDF export needs WeasyPrint (pip install WeasyPrint)')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        weasyprint.HTML(string=html).write_pdf(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,250 @@
+"""Indexed product search for the Select2 box and the products list.
+
+Backends, picked once per process from what the database has installed:
+
+* **SQLite** – an FTS5 table ``product_fts`` (external content on
+  ``product``, kept in sync by triggers, so ORM, bulk and upsert writes are
+  all covered). Each query word becomes a prefix match; a word that starts
+  no indexed term is treated as a typo and widened to its closest terms
+  from the catalog vocabulary (RapidFuzz). Whole-name prefixes come first
+  (from the plain ``lower(name)`` index), then name matches, then
+  category matches.
+* **PostgreSQL** – ``pg_trgm`` GIN indexes on ``lower(name)`` and
+  ``lower(category)``. Substring matches (``LIKE '%term%'``, index-backed)
+  plus word-similarity (``term <% name``) for typos, ranked by prefix and
+  similarity.
+* anything else, or before the migration has run – the in-process catalog
+  snapshot scan that search used before.
+
+The schema objects are created by migration ``c7d8e9f0a1b2`` or by
+:func:`install` when ``create_all`` builds a fresh database.
+"""
+import bisect
+import logging
+import re
+import threading
+
+from rapidfuzz import fuzz, process
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import catalog_cache
+from models import db, Product
+
+logger = logging.getLogger(__name__)
+
+TYPO_CUTOFF = 75            # fuzz.ratio a vocabulary term needs to stand in for a misspelt word
+TYPO_ALTERNATIVES = 3
+MIN_TYPO_LENGTH = 3
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+           name, category, content='product', content_rowid='id',
+           tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+           INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+           INSERT INTO product_fts(product_fts, rowid, name, category)
+           VALUES ('delete', old.id, old.name, old.category);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, category ON product BEGIN
+           INSERT INTO product_fts(product_fts, rowid, name, category)
+           VALUES ('delete', old.id, old.name, old.category);
+           INSERT INTO product_fts(rowid, name, category) VALUES (new.id, new.name, new.category);
+       END""",
+    "INSERT INTO product_fts(product_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_product_category_trgm ON product "
+    "USING gin (lower(coalesce(category, '')) gin_trgm_ops)",
+]
+
+_lock = threading.Lock()
+_backend = None
+_vocab = (None, [])          # (catalog version, sorted distinct words)
+
+
+def install(engine):
+    """Create the search index for ``engine``'s dialect if it is missing.
+
+    Returns False when the database refuses (e.g. no rights to create the
+    ``pg_trgm`` extension); search then keeps using the catalog scan.
+    """
+    global _backend
+    ddl = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(engine.dialect.name)
+    if not ddl:
+        return False
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == 'sqlite' and conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'product_fts'")).first():
+                return True
+            for stmt in ddl:
+                conn.execute(text(stmt))
+    except SQLAlchemyError:
+        logger.warning('product search index not installed; using catalog scan', exc_info=True)
+        return False
+    finally:
+        _backend = None
+    return True
+
+
+def rebuild():
+    """Re-index every product (after restoring a dump taken without triggers)."""
+    kind = backend()
+    if kind == 'fts5':
+        db.session.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+    elif kind == 'trgm':
+        db.session.execute(text('REINDEX INDEX ix_product_name_trgm'))
+        db.session.execute(text('REINDEX INDEX ix_product_category_trgm'))
+    return kind
+
+
+def backend():
+    """'fts5', 'trgm' or 'catalog' – whichever index this database has."""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = _detect()
+    return _backend
+
+
+def _detect():
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == 'sqlite':
+            found = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")).first()
+            return 'fts5' if found else 'catalog'
+        if dialect == 'postgresql':
+            found = conn.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_product_name_trgm'")).first()
+            return 'trgm' if found else 'catalog'
+    return 'catalog'
+
+
+def _words(term):
+    return _WORD_RE.findall((term or '').lower())
+
+
+def _vocabulary():
+    """Distinct lowercase words of product names and categories, sorted.
+
+    Numbers are left out: sizes and codes are not worth typo-correcting.
+    """
+    global _vocab
+    snap = catalog_cache.get_catalog()
+    version, words = _vocab
+    if version != snap.version:
+        found = set()
+        for it in snap.items.values():
+            found.update(_words(it.name))
+            found.update(_words(it.category))
+        words = sorted(w for w in found if not w.isdigit())
+        _vocab = (snap.version, words)
+    return words
+
+
+def _has_prefix(words, word):
+    i = bisect.bisect_left(words, word)
+    return i < len(words) and words[i].startswith(word)
+
+
+def _fts_query(term):
+    """FTS5 MATCH expression: every word as a prefix, misspelt words widened."""
+    words = _words(term)
+    if not words:
+        return None
+    vocab = None
+    parts = []
+    for w in words:
+        options = [f'"{w}"*']
+        if len(w) >= MIN_TYPO_LENGTH and not w.isdigit():
+            vocab = vocab if vocab is not None else _vocabulary()
+            if not _has_prefix(vocab, w):
+                options += [f'"{alt}"' for alt, _, _ in process.extract(
+                    w, vocab, scorer=fuzz.ratio, score_cutoff=TYPO_CUTOFF, limit=TYPO_ALTERNATIVES)]
+        parts.append(options[0] if len(options) == 1 else f"({' OR '.join(options)})")
+    return ' AND '.join(parts)
+
+
+def _like_escape(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_search(term, in_stock, limit):
+    """Ranked ids in up to three cheap stages, stopping once ``limit`` is met.
+
+    1. names starting with the whole term (range scan on ``ix_product_name_ci``);
+    2. FTS matches in the name column;
+    3. FTS matches anywhere (i.e. by category).
+
+    Ranking by stage rather than bm25 keeps broad prefixes such as "co" from
+    scoring thousands of rows on every keystroke.
+    """
+    query = _fts_query(term)
+    stock = 'AND p.qty_at_hand > 0' if in_stock else ''
+    ids = db.session.execute(text(f"""
+        SELECT p.id FROM product p
+        WHERE lower(p.name) >= :lo AND lower(p.name) < :hi {stock}
+        ORDER BY lower(p.name) LIMIT :limit"""),
+        {'lo': term, 'hi': term + '\uffff', 'limit': limit}).scalars().all()
+    for match in (f'name : ({query})', query):
+        if len(ids) >= limit or query is None:
+            break
+        found = ','.join(str(i) for i in ids) or '0'
+        ids += db.session.execute(text(f"""
+            SELECT p.id FROM product_fts JOIN product p ON p.id = product_fts.rowid
+            WHERE product_fts MATCH :q {stock} AND p.id NOT IN ({found})
+            ORDER BY p.name LIMIT :limit"""),
+            {'q': match, 'limit': limit - len(ids)}).scalars().all()
+    return ids
+
+
+def search(term='', in_stock=True, limit=20):
+    """Best matches for ``term`` as catalog items, best first."""
+    term = (term or '').strip().lower()
+    snap = catalog_cache.get_catalog()
+    kind = backend()
+    if not term or kind == 'catalog':
+        return snap.search(term, in_stock=in_stock, limit=limit)
+
+    if kind == 'fts5':
+        ids = _fts_search(term, in_stock, limit)
+    else:
+        esc = _like_escape(term)
+        ids = db.session.execute(text(f"""
+            SELECT id FROM product
+            WHERE (lower(name) LIKE :contains ESCAPE '\\'
+                   OR lower(coalesce(category, '')) LIKE :contains ESCAPE '\\'
+                   OR :term <% lower(name))
+              {'AND qty_at_hand > 0' if in_stock else ''}
+            ORDER BY lower(name) LIKE :prefix ESCAPE '\\' DESC,
+                     word_similarity(:term, lower(name)) DESC, name
+            LIMIT :limit"""),
+            {'term': term, 'contains': f'%{esc}%', 'prefix': f'{esc}%', 'limit': limit}).scalars().all()
+    return [it for it in (snap.get(pid) for pid in ids) if it is not None]
+
+
+def filter_clause(term):
+    """WHERE clause restricting a ``Product`` query to rows matching ``term``."""
+    term = (term or '').strip().lower()
+    kind = backend()
+    if kind == 'fts5':
+        query = _fts_query(term)
+        if query is not None:
+            return Product.id.in_(
+                select(text('rowid')).select_from(text('product_fts'))
+                .where(text('product_fts MATCH :q').bindparams(q=query)))
+    if kind == 'trgm':
+        contains = f'%{_like_escape(term)}%'
+        return or_(func.lower(Product.name).like(contains, escape='\\'),
+                   func.lower(func.coalesce(Product.category, '')).like(contains, escape='\\'))
+    return Product.name.ilike(f'%{term}%')
@@ -0,0 +1,274 @@
+"""Per-request SQL profiling and slow-query log.
+
+Engine-level ``before_cursor_execute`` / ``after_cursor_execute`` hooks
+count and time every statement issued while a request is handled. When
+the request ends:
+
+* statements slower than ``SLOW_QUERY_MS`` are written to the
+  ``storetrack.sql`` logger as one JSON object per line;
+* statements repeated ``N_PLUS_ONE_THRESHOLD`` or more times in the same
+  request are logged as a likely N+1 pattern;
+* per-endpoint totals are added to an in-process buffer that a daemon
+  thread flushes to ``query_stat`` / ``slow_query`` every
+  ``PROFILER_FLUSH_SECONDS``, so the manager page sees every worker.
+
+Each response also carries a ``Server-Timing`` header with the query
+count and database time.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import case, delete, event, func, insert, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from models import db, QueryStat, SlowQuery
+
+logger = logging.getLogger('storetrack.sql')
+
+MAX_PENDING_SLOW = 500          # slow statements kept between flushes
+STATEMENT_CHARS = 2000
+
+_lock = threading.Lock()
+_pending = {}                   # (bucket, endpoint) -> totals since the last flush
+_pending_slow = []              # SlowQuery rows since the last flush
+_flusher_pid = None
+
+
+class RequestProfile:
+    __slots__ = ('started', 'count', 'ms', 'statements', 'slow', 'slow_ms')
+
+    def __init__(self, slow_ms):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.ms = 0.0
+        self.statements = Counter()
+        self.slow = []
+        self.slow_ms = slow_ms
+
+
+def init_app(app):
+    if not app.config.get('SQL_PROFILER', True):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+# ── engine hooks ─────────────────────────────────────────────────────
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'sql_profile' in g:
+        context._profiler_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_start', None)
+    if started is None or not has_request_context():
+        return
+    prof = g.get('sql_profile')
+    if prof is None:
+        return
+    elapsed = (time.perf_counter() - started) * 1000
+    prof.count += 1
+    prof.ms += elapsed
+    prof.statements[statement] += 1
+    if elapsed >= prof.slow_ms:
+        prof.slow.append((elapsed, statement))
+
+
+# ── request lifecycle ────────────────────────────────────────────────
+def _start_request():
+    if request.endpoint == 'static':
+        return
+    g.sql_profile = RequestProfile(current_app.config.get('SLOW_QUERY_MS', 200))
+
+
+def _finish_request(response):
+    prof = g.pop('sql_profile', None)
+    if prof is None:
+        return response
+    request_ms = (time.perf_counter() - prof.started) * 1000
+    endpoint = request.endpoint or 'unknown'
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 10)
+    repeats = [(n, stmt) for stmt, n in prof.statements.items() if n >= threshold]
+    if repeats:
+        logger.warning(json.dumps({
+            'event': 'n_plus_one',
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'queries': prof.count,
+            'repeats': [{'count': n, 'statement': stmt[:300]} for n, stmt in sorted(repeats, reverse=True)],
+        }))
+    for ms, stmt in prof.slow:
+        logger.warning(json.dumps({
+            'event': 'slow_query',
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'duration_ms': round(ms, 1),
+            'statement': stmt[:STATEMENT_CHARS],
+        }))
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={prof.ms:.1f};desc="{prof.count} queries", app;dur={request_ms:.1f}')
+    _record(endpoint, prof, request_ms, bool(repeats))
+    _ensure_flusher(current_app._get_current_object())
+    return response
+
+
+def _record(endpoint, prof, request_ms, n_plus_one):
+    bucket = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    with _lock:
+        t = _pending.get((bucket, endpoint))
+        if t is None:
+            t = _pending[(bucket, endpoint)] = dict(
+                requests=0, queries=0, max_queries=0, sql_ms=0.0, request_ms=0.0,
+                max_request_ms=0.0, n_plus_one=0, slow_queries=0)
+        t['requests'] += 1
+        t['queries'] += prof.count
+        t['max_queries'] = max(t['max_queries'], prof.count)
+        t['sql_ms'] += prof.ms
+        t['request_ms'] += request_ms
+        t['max_request_ms'] = max(t['max_request_ms'], request_ms)
+        t['n_plus_one'] += int(n_plus_one)
+        t['slow_queries'] += len(prof.slow)
+        room = MAX_PENDING_SLOW - len(_pending_slow)
+        now = datetime.utcnow()
+        _pending_slow.extend(
+            dict(timestamp=now, endpoint=endpoint, duration_ms=round(ms, 1),
+                 statement=stmt[:STATEMENT_CHARS])
+            for ms, stmt in prof.slow[:max(room, 0)])
+
+
+# ── persistence ──────────────────────────────────────────────────────
+def _ensure_flusher(app):
+    """Start this worker's flush thread (once per process, after any fork)."""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    interval = app.config.get('PROFILER_FLUSH_SECONDS', 60)
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    flush()
+            except Exception:
+                logger.exception('query profiler flush failed')
+
+    threading.Thread(target=loop, name='query-profiler', daemon=True).start()
+
+
+def _greatest(col, value):
+    return case((col < value, value), else_=col)
+
+
+def flush():
+    """Write buffered totals and slow statements; prune rows past retention."""
+    global _pending, _pending_slow
+    with _lock:
+        pending, _pending = _pending, {}
+        slow, _pending_slow = _pending_slow, []
+    # the profiler's own writes are not part of the request being measured
+    prof = g.pop('sql_profile', None) if has_request_context() else None
+    try:
+        _write(pending, slow)
+    finally:
+        if prof is not None:
+            g.sql_profile = prof
+
+
+def _write(pending, slow):
+    for (bucket, endpoint), t in pending.items():
+        stmt = (
+            update(QueryStat)
+            .where(QueryStat.bucket == bucket, QueryStat.endpoint == endpoint)
+            .values(
+                requests=QueryStat.requests + t['requests'],
+                queries=QueryStat.queries + t['queries'],
+                max_queries=_greatest(QueryStat.max_queries, t['max_queries']),
+                sql_ms=QueryStat.sql_ms + t['sql_ms'],
+                request_ms=QueryStat.request_ms + t['request_ms'],
+                max_request_ms=_greatest(QueryStat.max_request_ms, t['max_request_ms']),
+                n_plus_one=QueryStat.n_plus_one + t['n_plus_one'],
+                slow_queries=QueryStat.slow_queries + t['slow_queries'],
+            )
+        )
+        with db.engine.begin() as conn:
+            if conn.execute(stmt).rowcount:
+                continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(QueryStat.__table__).values(bucket=bucket, endpoint=endpoint, **t))
+        except IntegrityError:
+            # another worker created the bucket first
+            with db.engine.begin() as conn:
+                conn.execute(stmt)
+
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config.get('PROFILER_RETENTION_DAYS', 7))
+    with db.engine.begin() as conn:
+        if slow:
+            conn.execute(insert(SlowQuery.__table__), slow)
+        conn.execute(delete(QueryStat.__table__).where(QueryStat.bucket < cutoff))
+        conn.execute(delete(SlowQuery.__table__).where(SlowQuery.timestamp < cutoff))
+
+
+# ── reporting ────────────────────────────────────────────────────────
+REPORT_ORDERS = {
+    'sql_ms': 'total database time',
+    'avg_queries': 'queries per request',
+    'avg_request_ms': 'average response time',
+    'n_plus_one': 'N+1 requests',
+}
+
+
+def endpoint_summary(since, order='sql_ms', limit=50):
+    """Per-endpoint totals since ``since``, worst first by ``order``."""
+    requests_ = func.sum(QueryStat.requests)
+    cols = dict(
+        requests=requests_,
+        queries=func.sum(QueryStat.queries),
+        max_queries=func.max(QueryStat.max_queries),
+        sql_ms=func.sum(QueryStat.sql_ms),
+        request_ms=func.sum(QueryStat.request_ms),
+        max_request_ms=func.max(QueryStat.max_request_ms),
+        n_plus_one=func.sum(QueryStat.n_plus_one),
+        slow_queries=func.sum(QueryStat.slow_queries),
+    )
+    sort = {
+        'sql_ms': cols['sql_ms'],
+        'avg_queries': cols['queries'] * 1.0 / requests_,
+        'avg_request_ms': cols['request_ms'] / requests_,
+        'n_plus_one': cols['n_plus_one'],
+    }.get(order, cols['sql_ms'])
+    return (
+        db.session.query(QueryStat.endpoint, *(c.label(k) for k, c in cols.items()))
+        .filter(QueryStat.bucket >= since.replace(minute=0, second=0, microsecond=0))
+        .group_by(QueryStat.endpoint)
+        .order_by(sort.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def recent_slow(since, limit=50):
+    return (SlowQuery.query
+            .filter(SlowQuery.timestamp >= since)
+            .order_by(SlowQuery.duration_ms.desc())
+            .limit(limit)
+            .all())
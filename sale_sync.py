@@ -0,0 +1,183 @@
+"""Bulk sync of sales the till queued while offline (static/sale_queue.js).
+
+Every queued sale carries a key generated in the browser and stored in
+``sale.client_key`` under a unique index, so sending a batch again – after
+a timeout, from a second tab, or twice in a row – records each sale once.
+A batch is applied in one transaction, but unlike a basket checkout the
+lines are independent: each gets its own result (``recorded``,
+``duplicate`` or ``rejected`` with a reason) and a rejected line does not
+hold back the others. A line may carry the ``user_id`` of the cashier who
+queued it; lines queued by anyone but the logged-in user are refused, so
+they never land in another cashier's shift.
+"""
+import re
+from datetime import date
+
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+import audit
+import sales_rollup
+import shift_state
+import stock
+from models import db, Product, Sale
+
+MAX_LINES = 200
+_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class SyncError(ValueError):
+    """The batch as a whole is malformed; nothing was applied."""
+
+
+def valid_key(key):
+    return isinstance(key, str) and bool(_KEY_RE.match(key))
+
+
+def recorded(keys):
+    """``{client_key: sale_id}`` for those of ``keys`` already recorded."""
+    keys = {k for k in keys if valid_key(k)}
+    if not keys:
+        return {}
+    return dict(db.session.query(Sale.client_key, Sale.id).filter(Sale.client_key.in_(keys)))
+
+
+def _parse_line(raw):
+    """Return ``(product_id, qty, price, sale_date)`` or raise ValueError."""
+    if not isinstance(raw, dict):
+        raise ValueError('Invalid sale.')
+    try:
+        product_id = int(raw['product_id'])
+        qty = int(raw['quantity'])
+        price = raw.get('unit_price')
+        price = float(price) if price not in (None, '') else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid product, quantity or price.')
+    if qty < 1:
+        raise ValueError('Quantity must be at least 1.')
+    if price is not None and price < 0.01:
+        raise ValueError('Price must be at least 0.01.')
+    try:
+        sale_date = date.fromisoformat(raw['sale_date']) if raw.get('sale_date') else date.today()
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sale date.')
+    if sale_date > date.today():
+        raise ValueError('Sale date cannot be in the future.')
+    return product_id, qty, price, sale_date
+
+
+def sync(raw_sales):
+    """Record queued sales for ``current_user``; returns a summary dict.
+
+    Raises :class:`SyncError` only for a malformed batch. A concurrent sync
+    of the same keys surfaces as a unique-index violation at flush; the
+    batch is then retried once, when those keys read back as duplicates.
+    """
+    if not isinstance(raw_sales, list) or not raw_sales:
+        raise SyncError('No sales to sync.')
+    if len(raw_sales) > MAX_LINES:
+        raise SyncError(f'At most {MAX_LINES} sales per sync.')
+    try:
+        return _apply(raw_sales)
+    except IntegrityError:
+        db.session.rollback()
+        return _apply(raw_sales)
+
+
+def _apply(raw_sales):
+    cur = current_app.config['CURRENCY_SYMBOL']
+    results = []
+    pending = []                                  # (result, product_id, qty, price, sale_date)
+    keys = [raw.get('key') if isinstance(raw, dict) else None for raw in raw_sales]
+    existing = recorded(keys)
+    first = {}                                    # key -> result of its first line in this batch
+    repeats = []
+    for raw, key in zip(raw_sales, keys):
+        result = {'key': key}
+        results.append(result)
+        if not valid_key(key):
+            result.update(status='rejected', error='Missing or invalid sale key.')
+            continue
+        if key in existing:
+            result.update(status='duplicate', sale_id=existing[key])
+            continue
+        if key in first:
+            repeats.append(result)
+            continue
+        first[key] = result
+        if raw.get('user_id') is not None and raw['user_id'] != current_user.id:
+            result.update(status='rejected', error='Queued by another user; sign in as them to send it.')
+            continue
+        try:
+            line = _parse_line(raw)
+        except ValueError as e:
+            result.update(status='rejected', error=str(e))
+            continue
+        pending.append((result, *line))
+
+    products = {p.id: p for p in Product.query.filter(Product.id.in_({l[1] for l in pending}))}
+    accepted = []
+    for result, pid, qty, price, sale_date in pending:
+        product = products.get(pid)
+        if product is None:
+            result.update(status='rejected', error='Product not found!')
+            continue
+        effective = price if price else float(product.selling_price or 0)
+        if effective < float(product.cost_price or 0):
+            detail = (f"{qty} × {product.name} at {cur}{effective:.2f} "
+                      f"(< cost {cur}{product.cost_price:.2f}, offline sale)")
+            if current_user.role != 'manager':
+                audit.record('below_cost_attempt_blocked', f"Attempted {detail}",
+                             product_id=pid, amount=effective)
+                result.update(status='rejected',
+                              error=f'{product.name}: price below cost is not allowed. Please ask a manager.')
+                continue
+            audit.record('below_cost_override', f"Manager approved {detail}",
+                         product_id=pid, amount=effective)
+        accepted.append((result, product, qty, price, sale_date))
+
+    shift = shift_state.current().shift
+    candidates = [Sale(product_id=product.id, qty_sold=qty, date=sale_date, unit_price=price,
+                       cashier_id=current_user.id, shift_id=shift.id if shift else None,
+                       client_key=result['key'])
+                  for result, product, qty, price, sale_date in accepted]
+    taken = stock.take_each([(s.product_id, s.qty_sold, s) for s in candidates]) if accepted else []
+    sales = []
+    for (result, product, qty, _, _), sale, outcome in zip(accepted, candidates, taken):
+        if isinstance(outcome, stock.OutOfStock):
+            result.update(status='rejected', error=f'Not enough stock of {product.name} '
+                                                   f'({outcome.available} left, sale has {qty}).')
+            continue
+        sale.product = product          # only now: the relationship would cascade it into the session
+        sales.append((result, sale))
+
+    new_sales = [s for _, s in sales]
+    if new_sales:
+        db.session.add_all(new_sales)
+        sales_rollup.add_sales(new_sales)
+        shift_state.add_sales(new_sales, products)
+        db.session.flush()
+    for result, sale in sales:
+        result.update(status='recorded', sale_id=sale.id)
+    alt_prices = [
+        (f"{s.qty_sold} × {s.product.name} at {cur}{s.unit_price:.2f} "
+         f"(list {cur}{s.product.selling_price:.2f}, offline sale)",
+         dict(product_id=s.product_id, sale_id=s.id, amount=s.unit_price))
+        for s in new_sales if s.unit_price and s.unit_price != float(s.product.selling_price or 0)
+    ]
+    db.session.commit()
+    for details, fields in alt_prices:
+        audit.record('sale_alt_price', details, **fields)
+
+    for result in repeats:
+        original = first[result['key']]
+        if original['status'] == 'recorded':
+            result.update(status='duplicate', sale_id=original['sale_id'])
+        else:
+            result.update(status=original['status'], error=original.get('error'))
+
+    counts = {'recorded': 0, 'duplicate': 0, 'rejected': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return {'results': results, **counts}
@@ -0,0 +1,125 @@
+"""Filtered, keyset-paginated browsing of the ``sale`` table.
+
+Pages are ordered on ``(date, id)`` and continue from an opaque cursor
+holding the last row's key, so page N costs the same as page 1 and the
+date filter is a plain range on ``sale.date`` that the
+``ix_sale_date_id`` index can serve.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+
+from filters import BadFilter, parse_date, parse_int
+from models import db, Sale, Product, User
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+@dataclass
+class SalesFilter:
+    start: date
+    end: date
+    cashier_id: Optional[int] = None
+    product_id: Optional[int] = None
+    category: Optional[str] = None
+    order: str = 'desc'               # asc|desc on (date, id)
+    limit: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args, default_day=None, default_order='desc'):
+        """Build from query-string args; ``?date=`` selects a single day."""
+        try:
+            day = parse_date(args.get('date')) or default_day or date.today()
+            start = parse_date(args.get('start')) or day
+            end = parse_date(args.get('end')) or max(day, start)
+            cashier_id = parse_int(args.get('cashier_id'))
+            product_id = parse_int(args.get('product_id'))
+            limit = parse_int(args.get('limit')) or DEFAULT_PAGE_SIZE
+        except ValueError as e:
+            raise BadFilter(str(e))
+        if start > end:
+            start, end = end, start
+        order = (args.get('order') or default_order).lower()
+        if order not in ('asc', 'desc'):
+            order = default_order
+        return cls(start=start, end=end, cashier_id=cashier_id, product_id=product_id,
+                   category=(args.get('category') or None), order=order,
+                   limit=max(1, min(limit, MAX_PAGE_SIZE)))
+
+    def as_args(self):
+        """Query-string args that reproduce this filter (for pager links)."""
+        args = {'start': self.start.isoformat(), 'end': self.end.isoformat(), 'order': self.order}
+        if self.cashier_id is not None:
+            args['cashier_id'] = self.cashier_id
+        if self.product_id is not None:
+            args['product_id'] = self.product_id
+        if self.category:
+            args['category'] = self.category
+        if self.limit != DEFAULT_PAGE_SIZE:
+            args['limit'] = self.limit
+        return args
+
+
+def encode_cursor(sale_date, sale_id):
+    raw = f'{sale_date.isoformat()}|{sale_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, sale_id = raw.split('|')
+        return date.fromisoformat(day), int(sale_id)
+    except (ValueError, UnicodeDecodeError):
+        raise BadFilter('invalid cursor')
+
+
+def page(filters, cursor=None):
+    """Return ``(rows, next_cursor)``; rows are ``(Sale, product name, cashier name)``."""
+    stmt = (
+        select(Sale, Product.name, User.username)
+        .join(Product, Product.id == Sale.product_id)
+        .outerjoin(User, User.id == Sale.cashier_id)
+        .where(Sale.date >= filters.start, Sale.date <= filters.end)
+    )
+    if filters.cashier_id is not None:
+        stmt = stmt.where(Sale.cashier_id == filters.cashier_id)
+    if filters.product_id is not None:
+        stmt = stmt.where(Sale.product_id == filters.product_id)
+    if filters.category:
+        stmt = stmt.where(Product.category == filters.category)
+
+    key = tuple_(Sale.date, Sale.id)
+    if cursor:
+        after = decode_cursor(cursor)
+        stmt = stmt.where(key > after if filters.order == 'asc' else key < after)
+    if filters.order == 'asc':
+        stmt = stmt.order_by(Sale.date.asc(), Sale.id.asc())
+    else:
+        stmt = stmt.order_by(Sale.date.desc(), Sale.id.desc())
+
+    rows = db.session.execute(stmt.limit(filters.limit + 1)).all()
+    next_cursor = None
+    if len(rows) > filters.limit:
+        rows = rows[:filters.limit]
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.date, last.id)
+    return rows, next_cursor
+
+
+def row_payload(row):
+    sale, product_name, cashier = row
+    return {
+        'id': sale.id,
+        'date': sale.date.isoformat(),
+        'product_id': sale.product_id,
+        'product_name': product_name,
+        'qty_sold': sale.qty_sold,
+        'unit_price': sale.unit_price,
+        'cashier_id': sale.cashier_id,
+        'cashier': cashier,
+    }
@@ -0,0 +1,285 @@
+"""Daily sales rollup maintenance and report queries.
+
+``record_sale``, ``edit_sale`` and ``void_sale`` call :func:`apply_sale_delta`
+inside their own transaction so the rollup never drifts from ``sale``.
+Reports read the (much smaller) rollup table instead of scanning raw sales.
+"""
+from datetime import date
+
+from sqlalchemy import bindparam, func, update, delete, insert, select, case, literal, literal_column
+
+from models import db, Sale, Product, DailySalesRollup
+
+_rollup_t = DailySalesRollup.__table__
+
+
+def _key_filter(sale_date, product_id, cashier_id):
+    cashier_cond = (DailySalesRollup.cashier_id.is_(None) if cashier_id is None
+                    else DailySalesRollup.cashier_id == cashier_id)
+    return (DailySalesRollup.date == sale_date,
+            DailySalesRollup.product_id == product_id,
+            cashier_cond)
+
+
+def _upsert_statement():
+    """INSERT .. ON CONFLICT adding onto an existing bucket, or None.
+
+    The conflict target is the unique ``ix_daily_sales_rollup_key`` index,
+    which keys on ``coalesce(cashier_id, 0)`` so cashier-less sales share
+    one bucket too. Backends without ON CONFLICT get None.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    t = _rollup_t
+    stmt = dialect_insert(t)
+    return stmt.on_conflict_do_update(
+        index_elements=[t.c.date, t.c.product_id, func.coalesce(t.c.cashier_id, literal_column('0'))],
+        set_=dict(qty_sold=t.c.qty_sold + stmt.excluded.qty_sold,
+                  list_qty=t.c.list_qty + stmt.excluded.list_qty,
+                  alt_revenue=t.c.alt_revenue + stmt.excluded.alt_revenue),
+    )
+
+
+def apply_sale_delta(sale_date, product_id, cashier_id, qty, unit_price=None):
+    """Add ``qty`` units (negative to reverse) to the rollup bucket.
+
+    Only stages the change on the current session; the caller commits.
+    """
+    if not qty:
+        return
+    list_qty = qty if unit_price is None else 0
+    alt_rev = 0.0 if unit_price is None else float(unit_price) * qty
+    key = _key_filter(sale_date, product_id, cashier_id)
+
+    upsert = _upsert_statement()
+    if upsert is not None:
+        # one statement, so two first-of-day sales can't both try to insert
+        db.session.execute(upsert, dict(date=sale_date, product_id=product_id,
+                                        cashier_id=cashier_id, qty_sold=qty,
+                                        list_qty=list_qty, alt_revenue=alt_rev))
+    else:
+        res = db.session.execute(
+            update(DailySalesRollup)
+            .where(*key)
+            .values(qty_sold=DailySalesRollup.qty_sold + qty,
+                    list_qty=DailySalesRollup.list_qty + list_qty,
+                    alt_revenue=DailySalesRollup.alt_revenue + alt_rev)
+            .execution_options(synchronize_session=False)
+        )
+        if res.rowcount == 0:
+            db.session.execute(insert(_rollup_t).values(
+                date=sale_date, product_id=product_id, cashier_id=cashier_id,
+                qty_sold=qty, list_qty=list_qty, alt_revenue=alt_rev))
+    if qty < 0:
+        # drop emptied buckets so voided history does not pin the product row
+        db.session.execute(
+            delete(DailySalesRollup)
+            .where(*key)
+            .where(DailySalesRollup.qty_sold <= 0)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def add_sale(sale):
+    apply_sale_delta(sale.date, sale.product_id, sale.cashier_id, sale.qty_sold, sale.unit_price)
+
+
+def add_sales(sales):
+    """:func:`add_sale` for a batch (basket checkout).
+
+    Lines are merged per bucket first, then written with one upsert
+    (or, on backends without ON CONFLICT, one SELECT for the existing
+    buckets plus an UPDATE and an INSERT statement).
+    """
+    buckets = {}
+    for sale in sales:
+        key = (sale.date, sale.product_id, sale.cashier_id)
+        qty, list_qty, alt_rev = buckets.get(key, (0, 0, 0.0))
+        if sale.unit_price is None:
+            list_qty += sale.qty_sold
+        else:
+            alt_rev += float(sale.unit_price) * sale.qty_sold
+        buckets[key] = (qty + sale.qty_sold, list_qty, alt_rev)
+    if not buckets:
+        return
+
+    upsert = _upsert_statement()
+    if upsert is not None:
+        db.session.execute(upsert, [
+            dict(date=k[0], product_id=k[1], cashier_id=k[2],
+                 qty_sold=qty, list_qty=list_qty, alt_revenue=alt_rev)
+            for k, (qty, list_qty, alt_rev) in buckets.items()
+        ])
+        return
+
+    dates = {k[0] for k in buckets}
+    products = {k[1] for k in buckets}
+    existing = {
+        (r.date, r.product_id, r.cashier_id): r.id
+        for r in db.session.execute(
+            select(DailySalesRollup.id, DailySalesRollup.date,
+                   DailySalesRollup.product_id, DailySalesRollup.cashier_id)
+            .where(DailySalesRollup.date.in_(dates), DailySalesRollup.product_id.in_(products))
+        )
+    }
+    updates, inserts = [], []
+    for key, (qty, list_qty, alt_rev) in buckets.items():
+        if key in existing:
+            updates.append(dict(id=existing[key], qty_sold=qty, list_qty=list_qty, alt_revenue=alt_rev))
+        else:
+            inserts.append(dict(date=key[0], product_id=key[1], cashier_id=key[2],
+                                qty_sold=qty, list_qty=list_qty, alt_revenue=alt_rev))
+    if updates:
+        t = _rollup_t
+        db.session.execute(
+            t.update()
+            .where(t.c.id == bindparam('_id'))
+            .values(qty_sold=t.c.qty_sold + bindparam('_qty'),
+                    list_qty=t.c.list_qty + bindparam('_list_qty'),
+                    alt_revenue=t.c.alt_revenue + bindparam('_alt_rev')),
+            [dict(_id=u['id'], _qty=u['qty_sold'], _list_qty=u['list_qty'], _alt_rev=u['alt_revenue'])
+             for u in updates],
+        )
+    if inserts:
+        db.session.execute(insert(_rollup_t), inserts)
+
+
+def remove_sale(sale):
+    apply_sale_delta(sale.date, sale.product_id, sale.cashier_id, -sale.qty_sold, sale.unit_price)
+
+
+def rebuild(start: date = None, end: date = None):
+    """Recompute rollup rows from ``sale`` for [start, end] (all history if omitted).
+
+    Returns the number of rollup rows written. Caller commits.
+    """
+    bounds = []
+    if start is not None:
+        bounds.append(Sale.date >= start)
+    if end is not None:
+        bounds.append(Sale.date <= end)
+    target = []
+    if start is not None:
+        target.append(DailySalesRollup.date >= start)
+    if end is not None:
+        target.append(DailySalesRollup.date <= end)
+
+    db.session.execute(delete(DailySalesRollup).where(*target)
+                       .execution_options(synchronize_session=False))
+
+    src = (
+        select(
+            Sale.date,
+            Sale.product_id,
+            Sale.cashier_id,
+            func.sum(Sale.qty_sold),
+            func.sum(case((Sale.unit_price.is_(None), Sale.qty_sold), else_=0)),
+            func.coalesce(func.sum(Sale.qty_sold * Sale.unit_price), literal(0.0)),
+        )
+        .where(*bounds)
+        .group_by(Sale.date, Sale.product_id, Sale.cashier_id)
+    )
+    res = db.session.execute(
+        insert(DailySalesRollup).from_select(
+            ['date', 'product_id', 'cashier_id', 'qty_sold', 'list_qty', 'alt_revenue'],
+            src,
+        )
+    )
+    return res.rowcount
+
+
+# ── report expressions ─────────────────────────────────────────────
+def revenue_expr():
+    """SUM of revenue, valuing list-price units at the current selling price."""
+    return func.sum(DailySalesRollup.alt_revenue
+                    + DailySalesRollup.list_qty * Product.selling_price)
+
+
+def cost_expr():
+    return func.sum(DailySalesRollup.qty_sold * Product.cost_price)
+
+
+def totals_for_day(day: date, cashier_id=None):
+    """Return (revenue, units) for one day, optionally for a single cashier."""
+    q = (
+        db.session.query(
+            func.coalesce(revenue_expr(), 0.0),
+            func.coalesce(func.sum(DailySalesRollup.qty_sold), 0),
+        )
+        .join(Product, Product.id == DailySalesRollup.product_id)
+        .filter(DailySalesRollup.date == day)
+    )
+    if cashier_id is not None:
+        q = q.filter(DailySalesRollup.cashier_id == cashier_id)
+    rev, units = q.first()
+    return float(rev or 0.0), int(units or 0)
+
+
+def daily_range_query(start: date, end: date):
+    """Query of (bucket, qty, rev, cost) per day in [start, end]."""
+    return (
+        db.session.query(
+            DailySalesRollup.date.label("bucket"),
+            func.sum(DailySalesRollup.qty_sold).label("qty"),
+            revenue_expr().label("rev"),
+            cost_expr().label("cost"),
+        )
+        .join(Product, Product.id == DailySalesRollup.product_id)
+        .filter(DailySalesRollup.date.between(start, end))
+        .group_by(DailySalesRollup.date)
+        .order_by(DailySalesRollup.date)
+    )
+
+
+def daily_range(start: date, end: date):
+    """Rows of (bucket, qty, rev, cost) per day in [start, end]."""
+    return daily_range_query(start, end).all()
+
+
+def by_category_query(start: date, end: date):
+    return (
+        db.session.query(Product.category, revenue_expr().label("rev"))
+        .join(Product, Product.id == DailySalesRollup.product_id)
+        .filter(DailySalesRollup.date.between(start, end))
+        .group_by(Product.category)
+    )
+
+
+def by_category(start: date, end: date):
+    return by_category_query(start, end).all()
+
+
+def by_product_query(start: date, end: date, limit=50):
+    rev = revenue_expr()
+    return (
+        db.session.query(
+            Product.name,
+            func.sum(DailySalesRollup.qty_sold).label("qty"),
+            rev.label("rev"),
+        )
+        .join(Product, Product.id == DailySalesRollup.product_id)
+        .filter(DailySalesRollup.date.between(start, end))
+        .group_by(Product.name)
+        .order_by(rev.desc())
+        .limit(limit)
+    )
+
+
+def by_product(start: date, end: date, limit=50):
+    return by_product_query(start, end, limit=limit).all()
+
+
+def top_sellers(limit=5):
+    return (
+        db.session.query(Product.name, func.sum(DailySalesRollup.qty_sold).label('units'))
+        .join(Product, Product.id == DailySalesRollup.product_id)
+        .group_by(Product.name)
+        .order_by(db.desc('units'))
+        .limit(limit)
+        .all()
+    )
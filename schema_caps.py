@@ -0,0 +1,81 @@
+"""What the connected schema supports, resolved once per worker.
+
+Code that has to cope with a database one migration behind the code (a
+rolling deploy runs old and new workers against whichever schema
+``flask db upgrade`` has reached) asks :func:`has_column` instead of
+reflecting the table on every request. Columns are reflected once, at
+startup, and keyed on the ``alembic_version`` revision; every
+``SCHEMA_CAPS_RECHECK_SECONDS`` one caller re-reads that single row and
+reflects again only when the revision moved, so an upgrade (or downgrade)
+reaches running workers without a restart and the lookup itself never
+touches the database.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+_lock = threading.Lock()
+_revision = None
+_columns = None            # {table: frozenset(column names)}
+_checked_at = 0.0
+
+
+def _read_revision(conn):
+    try:
+        return frozenset(r[0] for r in conn.execute(text('SELECT version_num FROM alembic_version')))
+    except SQLAlchemyError:
+        conn.rollback()
+        return frozenset()          # unstamped (create_all) database
+
+
+def refresh(engine=None):
+    """Re-read the revision and reflect every table's columns."""
+    global _revision, _columns, _checked_at
+    engine = engine or _engine()
+    with engine.connect() as conn:
+        revision = _read_revision(conn)
+        insp = inspect(conn)
+        columns = {t: frozenset(c['name'] for c in insp.get_columns(t))
+                   for t in insp.get_table_names()}
+    with _lock:
+        _revision, _columns, _checked_at = revision, columns, time.monotonic()
+    return columns
+
+
+def has_column(table, column):
+    """True when ``table.column`` exists in the connected database."""
+    columns = _current()
+    return column in columns.get(table, ())
+
+
+def revision():
+    _current()
+    return _revision
+
+
+def _current():
+    global _checked_at
+    if _columns is None:
+        return refresh()
+    interval = current_app.config.get('SCHEMA_CAPS_RECHECK_SECONDS', 60)
+    if interval and time.monotonic() - _checked_at >= interval and _lock.acquire(blocking=False):
+        # one thread re-checks; the rest carry on with what is known
+        try:
+            _checked_at = time.monotonic()
+            with _engine().connect() as conn:
+                moved = _read_revision(conn) != _revision
+        except SQLAlchemyError:
+            moved = False
+        finally:
+            _lock.release()
+        if moved:
+            current_app.logger.info('schema revision changed; reloading schema capabilities')
+            return refresh()
+    return _columns
+
+
+def _engine():
+    return current_app.extensions['sqlalchemy'].engine
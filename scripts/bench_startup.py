@@ -0,0 +1,83 @@
+"""
+Cold-boot benchmark: how long a fresh worker takes to import ``app`` and
+serve its first page.
+
+    python scripts/bench_startup.py                 # 5 runs against DATABASE_URL
+    python scripts/bench_startup.py --runs 10 --importtime
+
+Each run is a new interpreter, like a gunicorn worker after a deploy.
+Point DATABASE_URL at a migrated database to measure the normal path
+(SCHEMA_CHECK=auto skips create_all); set SCHEMA_CHECK=always to compare.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+client = app_module.app.test_client()
+resp = client.get('/login')
+t2 = time.perf_counter()
+import sys
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_request_ms': (t2 - t1) * 1000,
+                  'status': resp.status_code, 'pandas_loaded': 'pandas' in sys.modules}))
+"""
+
+
+def run_once(importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', CHILD]
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+    if proc.returncode or not lines:
+        sys.exit(f'benchmark child failed:\n{proc.stderr[-2000:]}')
+    return json.loads(lines[-1]), proc.stderr
+
+
+def top_imports(stderr, n=10):
+    rows = []
+    for line in stderr.splitlines():
+        m = re.match(r'import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)', line)
+        if m and len(m.group(2)) <= 3:          # top-level imports only
+            rows.append((int(m.group(1)), m.group(3)))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--runs', type=int, default=5)
+    ap.add_argument('--importtime', action='store_true', help='also list the slowest top-level imports')
+    args = ap.parse_args()
+
+    results = []
+    stderr = ''
+    for i in range(args.runs):
+        res, stderr = run_once(importtime=args.importtime and i == args.runs - 1)
+        results.append(res)
+
+    for key in ('import_ms', 'first_request_ms'):
+        vals = [r[key] for r in results]
+        print(f'{key:>18}: median {statistics.median(vals):7.1f}  '
+              f'min {min(vals):7.1f}  max {max(vals):7.1f}')
+    print(f'{"pandas at boot":>18}: {results[-1]["pandas_loaded"]}')
+    print(f'{"SCHEMA_CHECK":>18}: {os.getenv("SCHEMA_CHECK", "auto")}')
+
+    if args.importtime:
+        print('\nslowest top-level imports (cumulative ms):')
+        for us, name in top_imports(stderr):
+            print(f'  {us / 1000:8.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
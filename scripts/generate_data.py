@@ -0,0 +1,258 @@
+"""
+Fill a database with production-scale synthetic data: products, cashiers,
+shifts, sales spread over several years, and audit-log entries.
+
+    DATABASE_URL=sqlite:////tmp/load.db python scripts/generate_data.py
+    python scripts/generate_data.py --products 5000 --sales 2000000 --cashiers 12 --years 3
+    python scripts/generate_data.py --reset --sales 100000      # wipe sales/products/shifts/logs first
+
+Rows are written with bulk Core inserts in chunks, so millions of sales take
+minutes rather than hours. Afterwards the daily rollup is rebuilt, shift
+totals and ``initial_qty`` are made consistent with the generated sales, and
+the catalog cache is reset, so every page and report agrees with the data.
+
+Each generated product gets one barcode, ``2`` followed by its id padded to
+12 digits, which the load test's ``scan`` scenario relies on.
+
+Cashier accounts are ``cashier01``… with ``--password`` (default
+``loadtest123``); ``scripts/load_test.py`` logs in with the same names.
+Output is reproducible for a given ``--seed``.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, delete, func, insert, select, update  # noqa: E402
+
+from app import app  # noqa: E402
+from models import (db, Product, Sale, Shift, User, LogEntry, DailySalesRollup,  # noqa: E402
+                    PriceChange, ProductBarcode, StockMovement, StockSnapshot)
+import catalog_cache  # noqa: E402
+import sales_rollup  # noqa: E402
+
+CATEGORIES = {
+    'Drinks': ['Coke', 'Fanta', 'Sprite', 'Malta Guinness', 'Voltic Water', 'Club Beer', 'Alvaro', 'Kalyppo'],
+    'Food': ['Milo', 'Ideal Milk', 'Gino Tomato Paste', 'Indomie', 'Royal Aroma Rice', 'Frytol Oil', 'Sardines'],
+    'Toiletries': ['Key Soap', 'Pepsodent', 'Geisha Soap', 'Nivea Lotion', 'Always Pads', 'Rexona'],
+    'Household': ['Omo', 'Sunlight', 'Mosquito Coil', 'Tissue Roll', 'Matches', 'Candles'],
+    'Snacks': ['Digestive Biscuits', 'Pringles', 'Plantain Chips', 'Groundnuts', 'Chocolate Bar'],
+}
+SIZES = ['', '100g', '250g', '400g', '500ml', '1L', '1.5L', 'Pack of 6', 'Large', 'Small']
+LOG_ACTIONS = ['sale_alt_price', 'edit_sale_qty', 'void_sale', 'adjust_stock', 'below_cost_attempt_blocked',
+               'below_cost_override', 'shift-open', 'shift-close', 'http_429', 'server_error']
+PRODUCT_ACTIONS = {'sale_alt_price', 'edit_sale_qty', 'void_sale', 'adjust_stock',
+                   'below_cost_attempt_blocked', 'below_cost_override'}
+
+
+def barcode_for(product_id):
+    """Generated products get code ``2`` + 12-digit id (the in-store EAN range)."""
+    return f'2{product_id:012d}'
+
+
+def chunks(total, size):
+    done = 0
+    while done < total:
+        n = min(size, total - done)
+        yield n
+        done += n
+
+
+def progress(label, done, total, started):
+    rate = done / max(time.perf_counter() - started, 1e-6)
+    print(f'\r  {label}: {done:,}/{total:,} ({rate:,.0f}/s)', end='', flush=True)
+    if done >= total:
+        print()
+
+
+def reset_data():
+    print('Removing existing sales, rollup, shifts, logs, price changes, stock ledger, barcodes and products…')
+    for model in (Sale, DailySalesRollup, Shift, LogEntry, PriceChange, StockSnapshot, StockMovement,
+                  ProductBarcode, Product):
+        db.session.execute(delete(model))
+    catalog_cache.touch(reset=True)
+    db.session.commit()
+
+
+def ensure_cashiers(n, password):
+    names = [f'cashier{i:02d}' for i in range(1, n + 1)]
+    existing = {u.username: u.id for u in User.query.filter(User.username.in_(names))}
+    for name in names:
+        if name not in existing:
+            User.create(name, password, 'cashier')
+    return [u.id for u in User.query.filter(User.username.in_(names)).order_by(User.id)]
+
+
+def make_products(n, rng, batch):
+    print(f'Creating {n:,} products…')
+    offset = db.session.scalar(select(func.count(Product.id))) or 0
+    first_new_id = (db.session.scalar(select(func.max(Product.id))) or 0) + 1
+    started = time.perf_counter()
+    done = 0
+    for size in chunks(n, batch):
+        rows = []
+        for i in range(done, done + size):
+            category = rng.choice(list(CATEGORIES))
+            base = rng.choice(CATEGORIES[category])
+            label = rng.choice(SIZES)
+            cost = round(rng.uniform(0.5, 150), 2)
+            qty = rng.randint(0, 500)
+            rows.append(dict(
+                name=f'{base} {label} #{offset + i + 1}'.replace('  ', ' '),
+                category=category,
+                expiry_date=date.today() + timedelta(days=rng.randint(-30, 900)) if rng.random() < 0.6 else None,
+                cost_price=cost,
+                selling_price=round(cost * rng.uniform(1.05, 1.6), 2),
+                initial_qty=qty,
+                qty_at_hand=qty,
+                safety_stock=rng.choice([0, 5, 5, 10, 20]),
+            ))
+        db.session.execute(insert(Product.__table__), rows)
+        db.session.commit()
+        done += size
+        progress('products', done, n, started)
+    # one in-store EAN-13 style code per new product: barcode_for(product id)
+    new_ids = db.session.scalars(select(Product.id).where(Product.id >= first_new_id)).all()
+    for i in range(0, len(new_ids), batch):
+        db.session.execute(insert(ProductBarcode.__table__),
+                           [dict(product_id=pid, code=barcode_for(pid)) for pid in new_ids[i:i + batch]])
+    db.session.commit()
+    return [(r.id, r.selling_price, r.cost_price)
+            for r in db.session.execute(select(Product.id, Product.selling_price, Product.cost_price))]
+
+
+def make_shifts(cashiers, days, rng):
+    """One shift per cashier per working day (roughly 6 days in 7)."""
+    print('Creating shifts…')
+    rows = []
+    for day in days:
+        for cid in cashiers:
+            if rng.random() < 0.86:
+                opened = datetime.combine(day, dtime(7, 30)) + timedelta(minutes=rng.randint(0, 90))
+                rows.append(dict(cashier_id=cid, opened_at=opened,
+                                 closed_at=opened + timedelta(hours=rng.uniform(6, 10)),
+                                 sales_qty=0, sales_rev=0.0, total_qty=0, total_rev=0.0))
+    for i in range(0, len(rows), 5000):
+        db.session.execute(insert(Shift.__table__), rows[i:i + 5000])
+    db.session.commit()
+    shifts = {}
+    for s in db.session.execute(select(Shift.id, Shift.cashier_id, Shift.opened_at)
+                                .where(Shift.cashier_id.in_(cashiers))):
+        shifts.setdefault(s.opened_at.date(), []).append((s.id, s.cashier_id))
+    print(f'  shifts: {len(rows):,}')
+    return shifts
+
+
+def make_sales(n, products, shifts, rng, batch):
+    print(f'Creating {n:,} sales…')
+    days = sorted(shifts)
+    # busier recently: weight days linearly from 1 (oldest) to 3 (today)
+    weights = [1 + 2 * i / max(len(days) - 1, 1) for i in range(len(days))]
+    hot = products[:max(len(products) // 5, 1)]         # 20% of products make most sales
+    sold = {}
+    shift_totals = {}
+    started = time.perf_counter()
+    done = 0
+    for size in chunks(n, batch):
+        rows = []
+        for day in rng.choices(days, weights, k=size):
+            shift_id, cashier_id = rng.choice(shifts[day])
+            pid, price, cost = rng.choice(hot) if rng.random() < 0.8 else rng.choice(products)
+            qty = rng.choices((1, 2, 3, 4, 6, 12), (50, 20, 10, 8, 7, 5))[0]
+            unit_price = round(price * rng.uniform(0.9, 1.0), 2) if rng.random() < 0.05 else None
+            revenue = qty * (unit_price if unit_price is not None else price)
+            rows.append(dict(product_id=pid, date=day, qty_sold=qty, unit_price=unit_price,
+                             cashier_id=cashier_id, shift_id=shift_id, revenue=revenue))
+            sold[pid] = sold.get(pid, 0) + qty
+            tq, tr = shift_totals.get(shift_id, (0, 0.0))
+            shift_totals[shift_id] = (tq + qty, tr + revenue)
+        db.session.execute(insert(Sale.__table__), rows)
+        db.session.commit()
+        done += size
+        progress('sales', done, n, started)
+    return sold, shift_totals
+
+
+def make_logs(n, cashiers, products, rng, batch, years):
+    print(f'Creating {n:,} log entries…')
+    names = [u.username for u in User.query.filter(User.id.in_(cashiers))] + ['admin']
+    now = datetime.utcnow()
+    span = int(years * 365 * 86400)
+    started = time.perf_counter()
+    done = 0
+    for size in chunks(n, batch):
+        rows = []
+        for i in range(size):
+            action = rng.choice(LOG_ACTIONS)
+            row = dict(user=rng.choice(names), action=action, details=f'synthetic entry {done + i}',
+                       timestamp=now - timedelta(seconds=rng.randint(0, span)),
+                       product_id=None, amount=None)
+            if action in PRODUCT_ACTIONS:
+                pid, price, cost = rng.choice(products)
+                row.update(product_id=pid, amount=round(rng.uniform(cost * 0.8, price), 2))
+            elif action in ('http_429', 'server_error'):
+                row['user'] = 'anon'
+            rows.append(row)
+        db.session.execute(insert(LogEntry.__table__), rows)
+        db.session.commit()
+        done += size
+        progress('logs', done, n, started)
+
+
+def finish(sold, shift_totals, batch):
+    print('Updating initial stock and shift totals…')
+    p = Product.__table__
+    rows = [dict(_id=pid, _sold=qty) for pid, qty in sold.items()]
+    for i in range(0, len(rows), batch):
+        db.session.execute(update(p).where(p.c.id == bindparam('_id'))
+                           .values(initial_qty=p.c.initial_qty + bindparam('_sold')), rows[i:i + batch])
+    s = Shift.__table__
+    rows = [dict(_id=sid, _q=q, _r=round(r, 2)) for sid, (q, r) in shift_totals.items()]
+    for i in range(0, len(rows), batch):
+        db.session.execute(update(s).where(s.c.id == bindparam('_id'))
+                           .values(sales_qty=bindparam('_q'), sales_rev=bindparam('_r'),
+                                   total_qty=bindparam('_q'), total_rev=bindparam('_r')), rows[i:i + batch])
+    db.session.commit()
+    print('Rebuilding daily sales rollup…')
+    n = sales_rollup.rebuild()
+    catalog_cache.touch(reset=True)
+    db.session.commit()
+    print(f'  rollup rows: {n:,}')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--products', type=int, default=2000)
+    ap.add_argument('--sales', type=int, default=200_000)
+    ap.add_argument('--cashiers', type=int, default=8)
+    ap.add_argument('--years', type=float, default=2, help='history length, ending today')
+    ap.add_argument('--logs', type=int, default=50_000)
+    ap.add_argument('--password', default='loadtest123', help='password for generated cashiers')
+    ap.add_argument('--batch-size', type=int, default=10_000)
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--reset', action='store_true', help='delete existing products, sales, shifts and logs first')
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    with app.app_context():
+        print(f'Database: {db.engine.url.render_as_string(hide_password=True)}')
+        if args.reset:
+            reset_data()
+        cashiers = ensure_cashiers(args.cashiers, args.password)
+        products = make_products(args.products, rng, args.batch_size)
+        today = date.today()
+        days = [today - timedelta(days=d) for d in range(int(args.years * 365), -1, -1)]
+        shifts = make_shifts(cashiers, days, rng)
+        sold, shift_totals = make_sales(args.sales, products, shifts, rng, args.batch_size)
+        make_logs(args.logs, cashiers, products, rng, args.batch_size, args.years)
+        finish(sold, shift_totals, args.batch_size)
+    print(f'Done in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
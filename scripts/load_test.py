@@ -0,0 +1,288 @@
+"""
+End-to-end load test: concurrent logged-in clients drive the real routes of
+a running StoreTrack server and latency/throughput is reported per endpoint.
+
+    gunicorn -w 2 --threads 4 app:app &                  # or flask run
+    python scripts/load_test.py --clients 16 --duration 60
+    python scripts/load_test.py --base-url https://staging.example.com --managers 1 \\
+        --mix record_sale=40,search=40,dashboard=20
+
+Cashier clients log in as ``cashier01``… (see ``scripts/generate_data.py``)
+and run the cashier part of the mix; manager clients also hit the
+manager-only report and batch-preview endpoints. Scenarios:
+
+    record_sale     POST /record-sale            (one unit of a random product)
+    search          GET  /search-products?q=…    (Select2 autocomplete)
+    scan            GET  /scan/<code>             (barcode of a generated product)
+    dashboard       GET  /
+    sales_summary   GET  /reports/sales-summary  (random 1-90 day range)   manager
+    batch_preview   POST /batch-inventory/preview (small CSV upload)       manager
+
+Only the standard library is used. Redirects are not followed, so a sale is
+timed up to its 302. Any 4xx/5xx, or a redirect back to /login, counts as
+an error. ``--json`` writes the raw summary for comparing runs.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import date, timedelta
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SEARCH_TERMS = ['co', 'mi', 'in', 'so', 'om', 'fa', 'ri', 'ch', 'wa', 'pa', 'su', 'ke', 'ma', 'gr']
+DEFAULT_MIX = 'record_sale=30,search=30,scan=15,dashboard=15,sales_summary=7,batch_preview=3'
+MANAGER_ONLY = {'sales_summary', 'batch_preview'}
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser: a cookie jar, a CSRF token and a base URL."""
+
+    def __init__(self, base_url, timeout):
+        self.base = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+        self.csrf = None
+
+    def request(self, path, data=None, headers=None):
+        """Return (status, body, location); never raises for HTTP errors."""
+        req = urllib.request.Request(self.base + path, data=data, headers=headers or {})
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                return resp.status, resp.read(), resp.headers.get('Location')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers.get('Location')
+
+    def post_form(self, path, fields):
+        body = urllib.parse.urlencode(fields).encode()
+        return self.request(path, body, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def post_file(self, path, fields, file_field, filename, content):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for k, v in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                     f'filename="{filename}"\r\nContent-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return self.request(path, b''.join(parts), {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'X-CSRFToken': self.csrf or '',
+        })
+
+    def scrape_csrf(self, path):
+        status, body, _ = self.request(path)
+        m = CSRF_RE.search(body.decode(errors='replace'))
+        if status != 200 or not m:
+            raise RuntimeError(f'no CSRF token on {path} (HTTP {status})')
+        self.csrf = m.group(1)
+
+    def login(self, username, password):
+        self.scrape_csrf('/login')
+        status, _, location = self.post_form('/login', {
+            'csrf_token': self.csrf, 'username': username, 'password': password})
+        if status != 302 or 'login' in (location or ''):
+            raise RuntimeError(f'login failed for {username} (HTTP {status})')
+        self.scrape_csrf('/record-sale')
+
+
+# ── scenarios: each returns (status, location) ───────────────────────
+def sc_record_sale(c, ctx, rng):
+    status, _, loc = c.post_form('/record-sale', {
+        'csrf_token': c.csrf, 'product_id': rng.choice(ctx['product_ids']),
+        'quantity': 1, 'sale_date': date.today().isoformat(), 'unit_price': ''})
+    return status, loc
+
+
+def sc_search(c, ctx, rng):
+    term = rng.choice(SEARCH_TERMS)[:rng.randint(1, 2)]
+    status, _, loc = c.request(f'/search-products?q={term}&in_stock=true')
+    return status, loc
+
+
+def sc_scan(c, ctx, rng):
+    # generate_data.py gives product N the code 2 + N zero-padded to 12 digits
+    status, _, loc = c.request(f"/scan/2{rng.choice(ctx['product_ids']):012d}")
+    return status, loc
+
+
+def sc_dashboard(c, ctx, rng):
+    status, _, loc = c.request('/')
+    return status, loc
+
+
+def sc_sales_summary(c, ctx, rng):
+    end = date.today() - timedelta(days=rng.randint(0, 365))
+    start = end - timedelta(days=rng.randint(0, 89))
+    breakdown = rng.choice(['summary', 'category', 'product'])
+    status, _, loc = c.request(f'/reports/sales-summary?start={start}&end={end}&breakdown={breakdown}')
+    return status, loc
+
+
+def sc_batch_preview(c, ctx, rng):
+    lines = ['name,category,cost_price,selling_price,quantity,safety_stock,expiry_date']
+    for i in range(rng.randint(5, 50)):
+        cost = rng.uniform(1, 50)
+        lines.append(f'Load test item {rng.randint(1, 500)},Loadtest,{cost:.2f},{cost * 1.3:.2f},'
+                     f'{rng.randint(1, 48)},5,31/12/2030')
+    status, _, loc = c.post_file('/batch-inventory/preview', {'update_mode': 'add_stock'},
+                                 'spreadsheet_file', 'load.csv', '\n'.join(lines).encode())
+    return status, loc
+
+
+SCENARIOS = {
+    'record_sale': sc_record_sale,
+    'search': sc_search,
+    'scan': sc_scan,
+    'dashboard': sc_dashboard,
+    'sales_summary': sc_sales_summary,
+    'batch_preview': sc_batch_preview,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            sys.exit(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_client(n, args, ctx, mix, deadline, results, lock):
+    rng = random.Random(args.seed + n)
+    manager = n < args.managers
+    user, pw = ((args.manager_user, args.manager_password) if manager
+                else (f'cashier{n - args.managers + 1:02d}', args.cashier_password))
+    names = [k for k in mix if manager or k not in MANAGER_ONLY]
+    weights = [mix[k] for k in names]
+    if not names:
+        return
+    c = Client(args.base_url, args.timeout)
+    try:
+        c.login(user, pw)
+    except Exception as e:
+        with lock:
+            results['login_errors'].append(f'{user}: {e}')
+        return
+    local = []
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        t0 = time.perf_counter()
+        try:
+            status, loc = SCENARIOS[name](c, ctx, rng)
+            ok = status < 400 and not (loc and '/login' in loc)
+        except Exception:
+            ok = False
+        local.append((name, (time.perf_counter() - t0) * 1000, ok))
+        if args.think_ms:
+            time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+    with lock:
+        results['samples'].extend(local)
+
+
+def pct(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, round(p / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def summarise(samples, elapsed):
+    by_name = {}
+    for name, ms, ok in samples:
+        by_name.setdefault(name, []).append((ms, ok))
+    rows = {}
+    for name, vals in sorted(by_name.items()):
+        lat = sorted(ms for ms, _ in vals)
+        rows[name] = {
+            'requests': len(vals),
+            'errors': sum(1 for _, ok in vals if not ok),
+            'rps': len(vals) / elapsed,
+            'p50': pct(lat, 50), 'p95': pct(lat, 95), 'p99': pct(lat, 99),
+            'mean': statistics.fmean(lat), 'max': lat[-1],
+        }
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--base-url', default='http://127.0.0.1:5000')
+    ap.add_argument('--clients', type=int, default=8, help='concurrent virtual users')
+    ap.add_argument('--managers', type=int, default=1, help='how many of the clients log in as manager')
+    ap.add_argument('--duration', type=float, default=30, help='seconds to run')
+    ap.add_argument('--mix', default=DEFAULT_MIX, help='scenario weights, e.g. search=50,dashboard=50')
+    ap.add_argument('--think-ms', type=float, default=0, help='mean pause between a client\'s requests')
+    ap.add_argument('--manager-user', default=os.getenv('DEFAULT_ADMIN_USER', 'admin'))
+    ap.add_argument('--manager-password', default=os.getenv('DEFAULT_ADMIN_PASS', 'changeme123'))
+    ap.add_argument('--cashier-password', default='loadtest123')
+    ap.add_argument('--timeout', type=float, default=30)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--json', help='write the summary to this file')
+    args = ap.parse_args()
+    mix = parse_mix(args.mix)
+
+    # product ids for record_sale come from the app itself
+    probe = Client(args.base_url, args.timeout)
+    try:
+        probe.login(args.manager_user, args.manager_password)
+    except (OSError, RuntimeError) as e:
+        sys.exit(f'cannot log in to {args.base_url}: {e}')
+    ids = set()
+    for term in SEARCH_TERMS:
+        _, body, _ = probe.request(f'/search-products?q={term}&in_stock=true')
+        ids.update(item['id'] for item in json.loads(body).get('items', []))
+    if not ids and 'record_sale' in mix:
+        sys.exit('no in-stock products found; run scripts/generate_data.py first')
+    ctx = {'product_ids': sorted(ids)}
+
+    results = {'samples': [], 'login_errors': []}
+    lock = threading.Lock()
+    print(f'{args.clients} clients ({args.managers} manager) for {args.duration:.0f}s against {args.base_url}')
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=run_client, args=(n, args, ctx, mix, deadline, results, lock))
+               for n in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    rows = summarise(results['samples'], elapsed)
+    total = len(results['samples'])
+    errors = sum(r['errors'] for r in rows.values())
+    print(f'\n{"endpoint":<15}{"reqs":>8}{"errors":>8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}'
+          f'{"p99 ms":>9}{"max ms":>9}')
+    for name, r in rows.items():
+        print(f'{name:<15}{r["requests"]:>8}{r["errors"]:>8}{r["rps"]:>9.1f}{r["p50"]:>9.1f}'
+              f'{r["p95"]:>9.1f}{r["p99"]:>9.1f}{r["max"]:>9.1f}')
+    print(f'{"total":<15}{total:>8}{errors:>8}{total / elapsed:>9.1f}')
+    for err in results['login_errors']:
+        print(f'login error: {err}')
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'args': vars(args), 'elapsed_s': elapsed, 'endpoints': rows,
+                       'login_errors': results['login_errors']}, fh, indent=2)
+    sys.exit(1 if errors or results['login_errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for ``stock.py``: many threads sell and return the
+same few products at once, then the books are checked.
+
+    DATABASE_URL=sqlite:////tmp/stress.db python scripts/stress_stock.py
+    python scripts/stress_stock.py --threads 16 --ops 500 --products 3 --stock 200
+    python scripts/stress_stock.py --naive      # old read-modify-write, for comparison
+
+Demand is deliberately larger than supply. For every product the script
+checks that
+
+* stock never went negative (no overselling),
+* final stock == initial - units taken + units returned (no lost updates),
+
+and exits non-zero if either fails. It creates its own ``stress-*``
+products and deletes them afterwards; point it at a scratch database.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, Product  # noqa: E402
+import catalog_cache  # noqa: E402
+import stock  # noqa: E402
+
+MAX_RETRIES = 20
+
+
+def naive_take(pid, qty):
+    """What the routes used to do: read into Python, check, write back."""
+    p = db.session.get(Product, pid)
+    if p.qty_at_hand < qty:
+        raise stock.OutOfStock(pid, qty, p.qty_at_hand)
+    time.sleep(0)                       # let another thread in between read and write
+    p.qty_at_hand -= qty
+
+
+def naive_give_back(pid, qty):
+    p = db.session.get(Product, pid)
+    p.qty_at_hand += qty
+
+
+def worker(ids, ops, naive, barrier, totals, lock, seed):
+    rng = random.Random(seed)
+    take = naive_take if naive else stock.take
+    give_back = naive_give_back if naive else stock.give_back
+    taken, returned, refused, retries = Counter(), Counter(), 0, 0
+    with app.app_context():
+        barrier.wait()
+        for _ in range(ops):
+            pid = rng.choice(ids)
+            qty = rng.randint(1, 3)
+            selling = rng.random() < 0.85
+            for attempt in range(MAX_RETRIES):
+                try:
+                    if selling:
+                        take(pid, qty)
+                    else:
+                        give_back(pid, qty)
+                    db.session.commit()
+                except stock.OutOfStock:
+                    db.session.rollback()
+                    refused += 1
+                except OperationalError:        # SQLite "database is locked"
+                    db.session.rollback()
+                    retries += 1
+                    time.sleep(0.005 * (attempt + 1))
+                    continue
+                else:
+                    (taken if selling else returned)[pid] += qty
+                break
+        db.session.remove()
+    with lock:
+        totals['taken'].update(taken)
+        totals['returned'].update(returned)
+        totals['refused'] += refused
+        totals['retries'] += retries
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--threads', type=int, default=8)
+    ap.add_argument('--ops', type=int, default=300, help='operations per thread')
+    ap.add_argument('--products', type=int, default=2)
+    ap.add_argument('--stock', type=int, default=100, help='starting stock per product')
+    ap.add_argument('--naive', action='store_true', help='use read-modify-write instead of stock.py')
+    args = ap.parse_args()
+
+    with app.app_context():
+        products = [Product(name=f'stress-{os.getpid()}-{i}', category='stress', cost_price=1,
+                            selling_price=2, initial_qty=args.stock, qty_at_hand=args.stock)
+                    for i in range(args.products)]
+        db.session.add_all(products)
+        db.session.commit()
+        ids = [p.id for p in products]
+
+    barrier = threading.Barrier(args.threads)
+    lock = threading.Lock()
+    totals = {'taken': Counter(), 'returned': Counter(), 'refused': 0, 'retries': 0}
+    threads = [threading.Thread(target=worker,
+                                args=(ids, args.ops, args.naive, barrier, totals, lock, seed))
+               for seed in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ok = True
+    with app.app_context():
+        print(f'{"mode":>10}: {"naive read-modify-write" if args.naive else "stock.py conditional updates"}')
+        print(f'{"ops":>10}: {args.threads * args.ops} in {elapsed:.2f}s '
+              f'({args.threads * args.ops / elapsed:.0f}/s), refused {totals["refused"]}, '
+              f'lock retries {totals["retries"]}')
+        for pid in ids:
+            final = db.session.get(Product, pid).qty_at_hand
+            expected = args.stock - totals['taken'][pid] + totals['returned'][pid]
+            good = final == expected and final >= 0
+            ok &= good
+            print(f'  product {pid}: taken {totals["taken"][pid]:5d}  returned {totals["returned"][pid]:4d}  '
+                  f'final {final:4d}  expected {expected:4d}  {"OK" if good else "MISMATCH"}')
+        Product.query.filter(Product.id.in_(ids)).delete(synchronize_session=False)
+        catalog_cache.touch(reset=True)
+        db.session.commit()
+
+    print('PASS' if ok else 'FAIL: lost updates or oversold stock')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
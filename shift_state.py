@@ -0,0 +1,100 @@
+"""Open-shift lookup and running shift totals.
+
+The open shift for the logged-in user is resolved once per request and
+cached on ``g``, so the navbar badge, ``record_sale`` and the shift routes
+share one query. Running totals live on ``Shift.sales_qty`` /
+``Shift.sales_rev`` and are adjusted by :func:`add_sale` and
+:func:`remove_sale` inside the same transaction as the sale itself, the
+same way ``sales_rollup`` is maintained. The revenue counted is stored on
+``Sale.revenue``, so removing a sale takes out exactly what was added even
+if the product's list price has changed since.
+"""
+from typing import NamedTuple, Optional
+
+from flask import g, has_request_context
+from flask_login import current_user
+from sqlalchemy import update
+
+from models import db, Shift
+
+
+class ShiftState(NamedTuple):
+    shift: Optional[Shift]
+    qty: int
+    rev: float
+
+
+_NO_SHIFT = ShiftState(None, 0, 0.0)
+
+
+def current():
+    """ShiftState for the logged-in user's open shift (cached per request)."""
+    if not current_user.is_authenticated:
+        return _NO_SHIFT
+    state = g.get('shift_state')
+    if state is None:
+        shift = Shift.query.filter_by(cashier_id=current_user.id, closed_at=None).first()
+        state = ShiftState(shift, shift.sales_qty or 0, shift.sales_rev or 0.0) if shift else _NO_SHIFT
+        g.shift_state = state
+    return state
+
+
+def invalidate():
+    if has_request_context():
+        g.pop('shift_state', None)
+
+
+def _charge(sale, product):
+    """Price ``sale`` as it is now and store that on it; returns the revenue.
+
+    ``product`` is the sale's already-loaded ``Product``, passed in because
+    ``sale.product`` may not be loaded (or even set) before the flush.
+    """
+    price = sale.unit_price if sale.unit_price is not None else product.selling_price
+    sale.revenue = sale.qty_sold * float(price or 0.0)
+    return sale.revenue
+
+
+def sale_revenue(sale):
+    """Revenue charged for ``sale`` (at today's list price for sales older than ``Sale.revenue``)."""
+    if sale.revenue is not None:
+        return sale.revenue
+    price = sale.unit_price if sale.unit_price is not None else sale.product.selling_price
+    return sale.qty_sold * float(price or 0.0)
+
+
+def _apply(shift_id, qty, rev):
+    db.session.execute(
+        update(Shift)
+        .where(Shift.id == shift_id)
+        .values(sales_qty=Shift.sales_qty + qty, sales_rev=Shift.sales_rev + rev)
+    )
+    invalidate()
+
+
+def add_sale(sale, product):
+    """Count ``sale`` (as it is now) towards the shift it was recorded in."""
+    rev = _charge(sale, product)
+    if sale.shift_id is not None:
+        _apply(sale.shift_id, sale.qty_sold, rev)
+
+
+def add_sales(sales, products):
+    """:func:`add_sale` for a batch, with one UPDATE per shift.
+
+    ``products`` maps each sale's ``product_id`` to its loaded ``Product``.
+    """
+    totals = {}
+    for sale in sales:
+        rev = _charge(sale, products[sale.product_id])
+        if sale.shift_id is not None:
+            qty, total = totals.get(sale.shift_id, (0, 0.0))
+            totals[sale.shift_id] = (qty + sale.qty_sold, total + rev)
+    for shift_id, (qty, rev) in totals.items():
+        _apply(shift_id, qty, rev)
+
+
+def remove_sale(sale):
+    """Take ``sale`` back out of its shift's totals, at the revenue it was counted with."""
+    if sale.shift_id is not None:
+        _apply(sale.shift_id, -sale.qty_sold, -sale_revenue(sale))
@@ -0,0 +1,126 @@
+"""Process startup: build metadata and database bootstrap.
+
+Both run once when a worker imports ``app.py``, never per request.
+
+Build metadata comes from ``RENDER_GIT_COMMIT`` / ``GIT_COMMIT``, then
+from ``build_info.json`` (written at build time with
+``python startup.py``), and only as a last resort from a single
+``git rev-parse``.
+
+``db.create_all()`` is skipped when the database is already stamped at the
+migration head (``SCHEMA_CHECK=auto``), so a normal deploy's workers boot
+without a round of table inspection.
+"""
+import json
+import os
+import re
+import subprocess
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+BUILD_INFO_FILE = os.path.join(basedir, 'build_info.json')
+MIGRATIONS_DIR = os.path.join(basedir, 'migrations')
+
+
+# ── build metadata ───────────────────────────────────────────────────
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=basedir,
+                                       stderr=subprocess.DEVNULL, timeout=5).decode().strip()
+    except Exception:
+        return None
+
+
+def _file_commit():
+    try:
+        with open(BUILD_INFO_FILE) as fh:
+            return json.load(fh).get('commit')
+    except (OSError, ValueError):
+        return None
+
+
+def build_metadata():
+    """Template globals describing this build; call once at startup."""
+    sha = os.getenv('RENDER_GIT_COMMIT') or os.getenv('GIT_COMMIT') or _file_commit() or _git_commit()
+    env = os.getenv('APP_ENV', 'Development')
+    return {
+        'app_version': sha[:7] if sha else 'dev',
+        'app_env': env.title() if env else 'Development',
+    }
+
+
+def write_build_info(path=BUILD_INFO_FILE):
+    """Record the current commit so workers never need git at runtime."""
+    info = {
+        'commit': os.getenv('RENDER_GIT_COMMIT') or os.getenv('GIT_COMMIT') or _git_commit(),
+        'built_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+    }
+    with open(path, 'w') as fh:
+        json.dump(info, fh)
+    return info
+
+
+# ── database bootstrap ───────────────────────────────────────────────
+def migrations_at_head(db):
+    """True when ``alembic_version`` matches the newest migration script."""
+    try:
+        with db.engine.connect() as conn:
+            current = {r[0] for r in conn.execute(text('SELECT version_num FROM alembic_version'))}
+    except SQLAlchemyError:
+        return False
+    return bool(current) and current == migration_heads()
+
+
+_REVISION_RE = re.compile(r"^(down_revision|revision)\s*=\s*(.+)$", re.M)
+
+
+def migration_heads(versions_dir=os.path.join(MIGRATIONS_DIR, 'versions')):
+    """Head revision ids, read from the scripts' text.
+
+    Cheaper than loading every script through Alembic's ScriptDirectory,
+    which is what made the check slower than create_all() itself.
+    """
+    revisions, parents = set(), set()
+    for name in os.listdir(versions_dir):
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(versions_dir, name)) as fh:
+            for key, value in _REVISION_RE.findall(fh.read()):
+                ids = set(re.findall(r"['\"](\w+)['\"]", value))
+                (revisions if key == 'revision' else parents).update(ids)
+    return revisions - parents
+
+
+def init_database(app, db):
+    """Create missing tables unless migrations own the schema, load the
+    schema capabilities (schema_caps.py), publish catalog changes a stopped
+    worker left pending (catalog_cache.py), then seed a manager."""
+    from models import Product, User
+    import catalog_cache
+    import schema_caps
+
+    mode = app.config.get('SCHEMA_CHECK', 'auto')
+    if mode == 'always' or (mode == 'auto' and not migrations_at_head(db)):
+        import product_search
+        db.create_all()
+        product_search.install(db.engine)
+    schema_caps.refresh(db.engine)
+    if db.session.query(Product.id).filter(Product.catalog_version == catalog_cache.PENDING).first():
+        catalog_cache.publish()
+
+    if not User.query.filter_by(role='manager').first():
+        default_user = os.getenv('DEFAULT_ADMIN_USER', 'admin')
+        default_pass = os.getenv('DEFAULT_ADMIN_PASS', 'changeme123')
+
+        User.create(default_user, default_pass, 'manager')
+        app.logger.warning(
+            f'*** Created default manager '
+            f'username={default_user} password={default_pass} ***'
+        )
+
+
+if __name__ == '__main__':
+    print(json.dumps(write_build_info()))
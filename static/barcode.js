@@ -1 +1,42 @@
-// To enable camera barcode scanning later, integrate QuaggaJS here.
\ No newline at end of file
+// Barcode scanning for the till.
+//
+// USB/Bluetooth scanners behave like keyboards: they type the whole code
+// within a few milliseconds and finish with Enter. listenForScans() tells
+// those bursts apart from human typing and passes the code to a callback;
+// lookupBarcode() resolves a code through /scan/<code>.
+(function (window, document) {
+  const MAX_GAP_MS = 35;     // scanners send keys faster than any typist
+  const MIN_LENGTH = 4;
+
+  function listenForScans(onScan) {
+    let buffer = '';
+    let last = 0;
+    document.addEventListener('keydown', function (e) {
+      const now = Date.now();
+      if (now - last > MAX_GAP_MS) buffer = '';
+      last = now;
+      if (e.key === 'Enter') {
+        if (buffer.length >= MIN_LENGTH) {
+          e.preventDefault();
+          // the burst was also typed into whatever had focus; take it back out
+          const target = e.target;
+          if (target && typeof target.value === 'string' && target.value.endsWith(buffer)) {
+            target.value = target.value.slice(0, -buffer.length);
+          }
+          onScan(buffer);
+        }
+        buffer = '';
+      } else if (e.key.length === 1) {
+        buffer += e.key;
+      }
+    }, true);
+  }
+
+  function lookupBarcode(code) {
+    return fetch('/scan/' + encodeURIComponent(code.trim()), { headers: { Accept: 'application/json' } })
+      .then(r => r.json());
+  }
+
+  window.listenForScans = listenForScans;
+  window.lookupBarcode = lookupBarcode;
+})(window, document);
@@ -0,0 +1,95 @@
+// Browser-side copy of the product catalog for the till.
+//
+// /catalog-snapshot sends the catalog as columnar JSON tagged with the
+// server's catalog version; the copy is kept in localStorage and brought
+// up to date with ?since=<version>, which returns only changed products
+// (or a full snapshot when products were deleted). Searching, stock and
+// price/below-cost hints then run locally; only the sale goes to the server.
+(function (window) {
+  const STORAGE_KEY = 'storetrack-catalog';
+  const SYNC_EVERY_MS = 60000;
+
+  let version = null;
+  let byId = new Map();          // id -> {id, name, category, price, cost, stock}
+  let sorted = null;
+  let syncing = null;
+
+  function load() {
+    try {
+      const saved = JSON.parse(localStorage.getItem(STORAGE_KEY) || 'null');
+      if (saved && saved.columns) apply(saved, true);
+    } catch (e) { /* corrupt or unavailable storage: fetch afresh */ }
+  }
+
+  function save() {
+    const items = Array.from(byId.values());
+    const columns = { id: [], name: [], category: [], price: [], cost: [], stock: [] };
+    items.forEach(it => Object.keys(columns).forEach(k => columns[k].push(it[k])));
+    try {
+      localStorage.setItem(STORAGE_KEY, JSON.stringify({ version: version, full: true, columns: columns }));
+    } catch (e) { /* quota exceeded: keep the in-memory copy only */ }
+  }
+
+  function apply(data, full) {
+    if (full) byId = new Map();
+    const c = data.columns;
+    for (let i = 0; i < c.id.length; i++) {
+      byId.set(c.id[i], { id: c.id[i], name: c.name[i], category: c.category[i],
+                          price: c.price[i], cost: c.cost[i], stock: c.stock[i] });
+    }
+    version = data.version;
+    sorted = null;
+  }
+
+  function sync() {
+    if (syncing) return syncing;
+    const url = '/catalog-snapshot' + (version !== null ? '?since=' + version : '');
+    syncing = fetch(url, { headers: { Accept: 'application/json' }, cache: 'no-cache' })
+      .then(r => {
+        if (r.status === 304) return null;
+        if (!r.ok) throw new Error('catalog sync failed: ' + r.status);
+        return r.json();
+      })
+      .then(data => {
+        if (data && (data.full || data.version !== version || data.columns.id.length)) {
+          apply(data, data.full);
+          save();
+        }
+        return ready();
+      })
+      .finally(() => { syncing = null; });
+    return syncing;
+  }
+
+  function ready() { return version !== null; }
+
+  function get(id) { return byId.get(Number(id)) || null; }
+
+  // Name/category substring match; names starting with the term rank first.
+  function search(term, opts) {
+    opts = opts || {};
+    const inStock = opts.inStock !== false;
+    const limit = opts.limit || 20;
+    term = (term || '').trim().toLowerCase();
+    if (!sorted) sorted = Array.from(byId.values()).sort((a, b) => a.name.localeCompare(b.name));
+    const prefix = [], other = [];
+    for (const it of sorted) {
+      if (inStock && it.stock <= 0) continue;
+      const name = it.name.toLowerCase();
+      if (!term || name.startsWith(term)) prefix.push(it);
+      else if (name.includes(term) || (it.category || '').toLowerCase().includes(term)) other.push(it);
+      if (prefix.length >= limit) break;
+    }
+    return prefix.concat(other).slice(0, limit);
+  }
+
+  load();
+
+  window.TillCatalog = {
+    sync: sync, ready: ready, get: get, search: search,
+    startSync: function () {
+      sync().catch(() => {});
+      setInterval(() => sync().catch(() => {}), SYNC_EVERY_MS);
+    },
+  };
+})(window);
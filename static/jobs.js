@@ -0,0 +1,41 @@
+// Polling helpers for background jobs (see jobs.py).
+
+// Poll a job's status URL until it finishes. onProgress(status) is called on
+// every poll; resolves with the final status or rejects with an Error.
+function pollJob(job, onProgress, intervalMs) {
+  intervalMs = intervalMs || 1000;
+  return new Promise((resolve, reject) => {
+    const tick = () => {
+      fetch(job.status_url, { headers: { 'Accept': 'application/json' } })
+        .then(r => r.json())
+        .then(status => {
+          if (onProgress) onProgress(status);
+          if (status.status === 'done') resolve(status);
+          else if (status.status === 'failed') reject(new Error(status.error || 'Job failed'));
+          else setTimeout(tick, intervalMs);
+        })
+        .catch(reject);
+    };
+    tick();
+  });
+}
+
+function jobProgressText(status) {
+  if (status.total) return `${status.message || 'Working'}… ${status.done}/${status.total}`;
+  return (status.message || 'Queued') + '…';
+}
+
+// Start a background export from a link/button and download the file when
+// it is ready. A response that is already done (e.g. a cached PDF) downloads
+// straight away.
+function startDownloadJob(el, url) {
+  const label = el.innerHTML;
+  el.classList.add('disabled');
+  fetch(url, { headers: { 'Accept': 'application/json' } })
+    .then(r => { if (!r.ok) throw new Error(r.statusText); return r.json(); })
+    .then(job => job.status === 'done' ? job : pollJob(job, s => { el.textContent = jobProgressText(s); }))
+    .then(status => { window.location = status.download_url; })
+    .catch(err => { alert('Export failed: ' + err.message); })
+    .finally(() => { el.innerHTML = label; el.classList.remove('disabled'); });
+  return false;
+}
@@ -0,0 +1,143 @@
+// Offline sale queue for the till.
+//
+// Sales that cannot reach the server are kept in localStorage, each with a
+// key generated here, and sent in bursts to /record-sale/sync whenever the
+// browser is (back) online. The server stores the key with the sale under
+// a unique index, so resending a burst – after a timeout or from another
+// tab – never records a sale twice. Sales the server refuses (no stock,
+// below cost, ...) move to a "rejected" list for the cashier to deal with.
+// The browser may be shared by several cashiers, so every sale is stored
+// with the id of the user who queued it and only that user's session
+// sends it (the server refuses it from anyone else).
+// The page's CSRF token expires (an hour by default) while the till is
+// offline, so a POST refused for its token fetches a fresh one and is sent
+// once more (postJSON, also used by the basket checkout).
+(function (window) {
+  const QUEUE_KEY = 'storetrack-sale-queue';
+  const REJECTED_KEY = 'storetrack-sale-rejected';
+  const BATCH = 200;                 // sale_sync.MAX_LINES
+  const RETRY_MS = 30000;
+
+  let flushing = null;
+  let listeners = [];
+  let pageToken = () => '';
+  let token = null;
+  let userId = null;
+
+  function read(name) {
+    try { return JSON.parse(localStorage.getItem(name) || '[]'); } catch (e) { return []; }
+  }
+  function write(name, list) {
+    localStorage.setItem(name, JSON.stringify(list));
+    listeners.forEach(fn => fn(status()));
+  }
+
+  function newKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  function csrfToken() { return token || pageToken(); }
+
+  function refreshToken() {
+    return fetch('/csrf-token', { headers: { Accept: 'application/json' }, cache: 'no-store' })
+      .then(r => {
+        if (!r.ok) throw new Error('token refresh failed: ' + r.status);
+        return r.json();    // a login page instead of JSON throws: the session itself is gone
+      })
+      .then(data => {
+        token = data.csrf_token;
+        document.querySelectorAll('input[name="csrf_token"]').forEach(input => { input.value = token; });
+      });
+  }
+
+  function postJSON(url, body) {
+    const send = () => fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+      body: JSON.stringify(body),
+    });
+    return send().then(r => {
+      if (r.status !== 400) return r;
+      return r.clone().json().catch(() => ({}))
+        .then(data => (data.csrf_expired ? refreshToken().then(send) : r));
+    });
+  }
+
+  function mine(list) { return list.filter(s => s.user_id === userId); }
+
+  // sale: {product_id, quantity, unit_price, sale_date, label, key?}
+  function enqueue(sales) {
+    const queue = read(QUEUE_KEY);
+    sales.forEach(s => queue.push(Object.assign({ key: newKey(), queued_at: new Date().toISOString(),
+                                                  user_id: userId }, s)));
+    write(QUEUE_KEY, queue);
+    flush().catch(() => {});
+  }
+
+  function flush() {
+    if (flushing) return flushing;
+    const batch = mine(read(QUEUE_KEY)).slice(0, BATCH);
+    if (!batch.length || !navigator.onLine) return Promise.resolve(status());
+    flushing = postJSON('/record-sale/sync', {
+      sales: batch.map(s => ({ key: s.key, product_id: s.product_id, quantity: s.quantity,
+                               unit_price: s.unit_price, sale_date: s.sale_date, user_id: s.user_id })),
+    })
+      .then(r => {
+        if (!r.ok) throw new Error('sync failed: ' + r.status);
+        return r.json();    // a login page instead of JSON throws too; the queue is kept
+      })
+      .then(data => {
+        const done = new Set();
+        const rejected = read(REJECTED_KEY);
+        const byKey = new Map(batch.map(s => [s.key, s]));
+        data.results.forEach(res => {
+          done.add(res.key);
+          if (res.status === 'rejected' && byKey.has(res.key)) {
+            rejected.push(Object.assign({}, byKey.get(res.key), { error: res.error }));
+          }
+        });
+        write(REJECTED_KEY, rejected);
+        write(QUEUE_KEY, read(QUEUE_KEY).filter(s => !done.has(s.key)));
+        return data;
+      })
+      .finally(() => { flushing = null; });
+    return flushing.then(data => (mine(read(QUEUE_KEY)).length ? flush() : status()));
+  }
+
+  // Sales queued before they carried a user id can't be attributed: set them aside.
+  function setAsideUnowned() {
+    const queue = read(QUEUE_KEY);
+    const unowned = queue.filter(s => s.user_id === undefined);
+    if (!unowned.length) return;
+    write(REJECTED_KEY, read(REJECTED_KEY).concat(unowned.map(s => Object.assign({}, s, {
+      user_id: userId, error: 'Queued without a cashier; please check and re-enter it.' }))));
+    write(QUEUE_KEY, queue.filter(s => s.user_id !== undefined));
+  }
+
+  function status() {
+    return { pending: mine(read(QUEUE_KEY)), rejected: mine(read(REJECTED_KEY)) };
+  }
+
+  function dismissRejected() { write(REJECTED_KEY, read(REJECTED_KEY).filter(s => s.user_id !== userId)); }
+
+  window.SaleQueue = {
+    newKey: newKey,
+    enqueue: enqueue,
+    flush: flush,
+    status: status,
+    dismissRejected: dismissRejected,
+    postJSON: postJSON,
+    onChange: function (fn) { listeners.push(fn); fn(status()); },
+    start: function (currentUserId, getCsrfToken) {
+      userId = currentUserId;
+      pageToken = getCsrfToken;
+      setAsideUnowned();
+      window.addEventListener('online', () => flush().catch(() => {}));
+      flush().catch(() => {});
+      setInterval(() => flush().catch(() => {}), RETRY_MS);
+    },
+  };
+})(window);
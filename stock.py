@@ -0,0 +1,214 @@
+"""Stock mutations as conditional, atomic SQL updates.
+
+Every change to ``Product.qty_at_hand`` goes through this module instead of
+read-modify-write on the ORM object, so concurrent tills on different
+workers cannot lose updates or oversell::
+
+    UPDATE product SET qty_at_hand = qty_at_hand - :n
+     WHERE id = :id AND qty_at_hand >= :n
+
+A decrement that finds too little stock matches no row and raises
+:class:`OutOfStock`; the caller rolls back. That UPDATE holds the only
+lock a stock change takes: changed rows are marked pending for the catalog
+cache, which publishes them after commit (catalog_cache.py), and any
+``Product`` already loaded in the session is refreshed so templates see
+the new figure.
+
+Every change is also appended to the ``stock_movement`` ledger (delta,
+stock after, reason, reference, user). Movements are buffered on the
+session and inserted in one statement just before it commits, so a sale
+can be passed as ``ref`` before it has been flushed, and a rollback drops
+them with everything else. Bulk writers that bypass these helpers (see
+batch_apply.py) call :func:`record` themselves.
+
+Nothing here commits; changes ride on the caller's transaction.
+"""
+from datetime import datetime
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import catalog_cache
+from models import db, Product, StockMovement
+
+_product_t = Product.__table__
+_movement_t = StockMovement.__table__
+_PENDING = 'stock_movements'
+
+# reason -> label (movement reports)
+REASONS = {
+    'sale': 'Sale',
+    'sale_edit': 'Sale edited',
+    'void': 'Sale voided',
+    'restock': 'Restock',
+    'adjust': 'Manual adjustment',
+    'new_product': 'New product',
+    'batch_add': 'Batch upload (add)',
+    'batch_replace': 'Batch upload (replace)',
+}
+
+
+class OutOfStock(ValueError):
+    """Not enough stock for ``product_id``; ``available`` is the current count."""
+
+    def __init__(self, product_id, requested, available):
+        super().__init__(f'Not enough stock for product {product_id} '
+                         f'({available} left, {requested} requested).')
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+def _current_qty(product_id):
+    return db.session.execute(
+        _product_t.select().with_only_columns(_product_t.c.qty_at_hand)
+        .where(_product_t.c.id == product_id)
+    ).scalar()
+
+
+def _sync(product_id, qty, version, initial_qty=None):
+    """Mirror the new values onto a loaded ``Product`` without dirtying it."""
+    p = db.session.identity_map.get(db.session.identity_key(Product, product_id))
+    if p is not None:
+        set_committed_value(p, 'qty_at_hand', qty)
+        set_committed_value(p, 'catalog_version', version)
+        if initial_qty is not None:
+            set_committed_value(p, 'initial_qty', initial_qty)
+
+
+def _current_user_id():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+
+def record(product, delta, qty_after, reason, ref=None, user_id=None):
+    """Queue one ledger row for the current transaction.
+
+    ``product`` and ``ref`` may be ids or not-yet-flushed ORM objects; they
+    are resolved when the session commits.
+    """
+    db.session.info.setdefault(_PENDING, []).append({
+        'product': product, 'delta': delta, 'qty_after': qty_after, 'reason': reason,
+        'ref': ref, 'user_id': user_id if user_id is not None else _current_user_id(),
+        'timestamp': datetime.utcnow(),
+    })
+
+
+def opening(product, qty):
+    """Ledger entry for a product created with ``qty`` units already on hand."""
+    if qty:
+        record(product, qty, qty, 'new_product')
+
+
+def _apply(conn, version, product_id, delta, reason, ref=None, floor=0, restock=False):
+    values = {'qty_at_hand': _product_t.c.qty_at_hand + delta, 'catalog_version': version}
+    if restock:
+        values['initial_qty'] = _product_t.c.initial_qty + delta
+    stmt = update(_product_t).where(_product_t.c.id == product_id)
+    if floor is not None:
+        stmt = stmt.where(_product_t.c.qty_at_hand + delta >= floor)
+    row = conn.execute(stmt.values(**values)
+                       .returning(_product_t.c.qty_at_hand, _product_t.c.initial_qty)).first()
+    if row is None:
+        raise OutOfStock(product_id, -delta, _current_qty(product_id))
+    new_qty = row.qty_at_hand
+    _sync(product_id, new_qty, version, row.initial_qty if restock else None)
+    if reason is not None:
+        record(product_id, delta, new_qty, reason, ref)
+    return new_qty
+
+
+def adjust(product_id, delta, reason='adjust', ref=None):
+    """Add ``delta`` (negative to remove) unless stock would go below zero.
+
+    Returns the new quantity on hand.
+    """
+    conn = db.session.connection()
+    return _apply(conn, catalog_cache.stamp(), product_id, delta, reason, ref)
+
+
+def take(product_id, qty, reason='sale', ref=None):
+    """Remove ``qty`` units, or raise :class:`OutOfStock`."""
+    return adjust(product_id, -qty, reason, ref)
+
+
+def give_back(product_id, qty, reason='void', ref=None):
+    """Return ``qty`` units (void / reduced sale); never refused."""
+    conn = db.session.connection()
+    return _apply(conn, catalog_cache.stamp(), product_id, qty, reason, ref, floor=None)
+
+
+def restock(product_id, qty):
+    """Receive ``qty`` new units: raises both ``qty_at_hand`` and ``initial_qty``."""
+    conn = db.session.connection()
+    return _apply(conn, catalog_cache.stamp(), product_id, qty, 'restock', floor=None, restock=True)
+
+
+def take_many(lines, reason='sale'):
+    """Remove ``[(product_id, qty, ref), ...]`` all-or-nothing (basket checkout).
+
+    Each product is decremented once by its total, in id order so two
+    baskets sharing products lock them in the same order; the ledger still
+    gets one movement per line. On :class:`OutOfStock` earlier decrements
+    are still pending on the transaction; the caller must roll back.
+    """
+    wanted = {}
+    for pid, qty, _ in lines:
+        wanted[pid] = wanted.get(pid, 0) + qty
+    conn = db.session.connection()
+    version = catalog_cache.stamp()
+    new_qty = {pid: _apply(conn, version, pid, -qty, None) for pid, qty in sorted(wanted.items())}
+    running = {pid: qty + wanted[pid] for pid, qty in new_qty.items()}
+    for pid, qty, ref in lines:
+        running[pid] -= qty
+        record(pid, -qty, running[pid], reason, ref)
+    return new_qty
+
+
+def take_each(items, reason='sale'):
+    """Remove ``[(product_id, qty, ref), ...]`` item by item (offline sale sync).
+
+    Unlike :func:`take_many`, a shortfall refuses only that item: the result
+    list holds the new quantity for each item, or the :class:`OutOfStock`
+    that refused it (a refused decrement writes nothing, so the rest of the
+    transaction stays usable). Items are applied in product-id order so
+    concurrent writers lock rows alike; for one product, earlier items go first.
+    """
+    conn = db.session.connection()
+    version = catalog_cache.stamp()
+    results = [None] * len(items)
+    for i in sorted(range(len(items)), key=lambda i: (items[i][0], i)):
+        pid, qty, ref = items[i]
+        try:
+            results[i] = _apply(conn, version, pid, -qty, reason, ref)
+        except OutOfStock as e:
+            results[i] = e
+    return results
+
+
+def _id(value):
+    return getattr(value, 'id', value)
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_movements(session):
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    session.flush()                 # ids for products / sales passed as objects
+    session.connection().execute(insert(_movement_t), [
+        {'product_id': _id(m['product']), 'delta': m['delta'], 'qty_after': m['qty_after'],
+         'reason': m['reason'], 'ref_id': _id(m['ref']), 'user_id': m['user_id'],
+         'timestamp': m['timestamp']}
+        for m in pending
+    ])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_movements(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING, None)
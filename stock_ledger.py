@@ -0,0 +1,261 @@
+"""Stock history from the ``stock_movement`` ledger and month-end snapshots.
+
+"Stock on day X" for the whole catalog starts from the nearest stored
+snapshot and applies only the movements between it and X – one range scan
+on ``(timestamp, id)`` grouped by product – or, for recent days, walks back
+from today's ``qty_at_hand`` over the movements since X, whichever range is
+shorter. One product's stock at a moment is a single index seek: the
+``qty_after`` of its last movement before then.
+
+Snapshots hold every product's closing stock – and its cost and selling
+price, for valuation (inventory_valuation.py) – at each month end. They are
+taken for closed months by :func:`ensure_snapshots` (run by
+``flask snapshot-stock`` from cron; reports only read them) and never
+change afterwards. Products with no movements before the ledger existed simply
+carry their stock back unchanged.
+"""
+import base64
+import calendar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, delete, func, insert, literal, select, text, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
+
+import stock
+from filters import BadFilter, parse_date, parse_int
+from models import db, Product, StockMovement, StockSnapshot
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+_movement_t = StockMovement.__table__
+_snapshot_t = StockSnapshot.__table__
+_SNAPSHOT_LOCK_KEY = 0x53544B53        # 'STKS'; pg_advisory_xact_lock key for snapshot writers
+
+
+def _day_end(day):
+    """First instant after ``day`` (movement timestamps are naive UTC)."""
+    return datetime.combine(day + timedelta(days=1), datetime.min.time())
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def latest_snapshot(on_or_before, connection=None):
+    return (connection or db.session).execute(
+        select(func.max(_snapshot_t.c.day)).where(_snapshot_t.c.day <= on_or_before)
+    ).scalar()
+
+
+def stock_on(day, connection=None):
+    """``(subquery, qty)``: every product's stock at the end of ``day`` as SQL.
+
+    ``qty`` is a column expression over ``Product`` and ``subquery`` (None
+    for today), which the caller outer-joins on ``product_id`` – so a
+    report can select, sum or sort historical stock in the same statement
+    as the product columns. The snapshot to start from is looked up on
+    ``connection`` (default: the session).
+    """
+    today = date.today()
+    if day >= today:
+        return None, Product.qty_at_hand
+    snap_day = latest_snapshot(day, connection)
+    ts = _movement_t.c.timestamp
+    if snap_day is not None and (day - snap_day) <= (today - day):
+        parts = union_all(
+            select(_snapshot_t.c.product_id, _snapshot_t.c.qty.label('qty')).where(_snapshot_t.c.day == snap_day),
+            select(_movement_t.c.product_id, _movement_t.c.delta)
+            .where(ts >= _day_end(snap_day), ts < _day_end(day)),
+        ).subquery()
+        sub = (select(parts.c.product_id, func.sum(parts.c.qty).label('qty'))
+               .group_by(parts.c.product_id).subquery())
+        return sub, func.coalesce(sub.c.qty, 0)
+    sub = (select(_movement_t.c.product_id, func.sum(_movement_t.c.delta).label('qty'))
+           .where(ts >= _day_end(day)).group_by(_movement_t.c.product_id).subquery())
+    return sub, Product.qty_at_hand - func.coalesce(sub.c.qty, 0)
+
+
+def _select_stock(day, *columns, connection=None):
+    sub, qty = stock_on(day, connection)
+    stmt = select(*columns, qty).select_from(Product)
+    if sub is not None:
+        stmt = stmt.outerjoin(sub, sub.c.product_id == Product.id)
+    return stmt
+
+
+def quantities_on(day):
+    """``{product_id: qty}`` at the end of ``day`` for every current product."""
+    return dict(db.session.execute(_select_stock(day, Product.id)).all())
+
+
+def product_qty_at(product_id, moment):
+    """Stock of one product just before ``moment`` (a datetime)."""
+    last = db.session.execute(
+        select(_movement_t.c.qty_after)
+        .where(_movement_t.c.product_id == product_id, _movement_t.c.timestamp < moment)
+        .order_by(_movement_t.c.timestamp.desc(), _movement_t.c.id.desc()).limit(1)
+    ).scalar()
+    if last is not None:
+        return last
+    first = db.session.execute(
+        select(_movement_t.c.qty_after - _movement_t.c.delta)
+        .where(_movement_t.c.product_id == product_id)
+        .order_by(_movement_t.c.timestamp, _movement_t.c.id).limit(1)
+    ).scalar()
+    if first is not None:
+        return first                # stock it had before the ledger's first entry for it
+    return db.session.execute(select(Product.qty_at_hand).where(Product.id == product_id)).scalar()
+
+
+def _lock_snapshots(conn):
+    """Serialise snapshot writers across workers until ``conn`` commits.
+
+    PostgreSQL takes a transaction-level advisory lock; SQLite already
+    admits one writer at a time.
+    """
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _SNAPSHOT_LOCK_KEY})
+
+
+def take_snapshot(day, replace=True):
+    """Store every product's closing stock for ``day``; returns the rows written.
+
+    An existing snapshot for ``day`` is replaced, or with ``replace=False``
+    kept (0 is returned). Cost and selling prices are stored with it as
+    they stand when it is taken – the day after the month end when
+    ``flask snapshot-stock`` runs from cron – and valuation reports use
+    them for that period.
+
+    Runs in a transaction of its own on a separate connection, committed
+    before it returns; the caller's session is not touched.
+    """
+    try:
+        with db.engine.begin() as conn:
+            _lock_snapshots(conn)
+            exists = conn.execute(
+                select(_snapshot_t.c.id).where(_snapshot_t.c.day == day).limit(1)).first()
+            if exists and not replace:
+                return 0
+            conn.execute(delete(_snapshot_t).where(_snapshot_t.c.day == day))
+            stmt = _select_stock(day, literal(day, Date).label('day'), Product.id,
+                                 Product.cost_price, Product.selling_price, connection=conn)
+            return conn.execute(insert(_snapshot_t).from_select(
+                ['day', 'product_id', 'cost_price', 'selling_price', 'qty'], stmt)).rowcount
+    except IntegrityError:
+        return 0                    # another worker stored it first (backends without the lock)
+
+
+def ensure_snapshots(up_to=None):
+    """Take any missing month-end snapshots for closed months up to ``up_to``.
+
+    Starts at the month of the first ledger movement; returns the days taken.
+    Safe to run from several workers at once: a day another one is taking
+    is waited for and then left alone.
+    """
+    today = date.today()
+    up_to = min(up_to or today, today - timedelta(days=1))
+    first = db.session.execute(select(func.min(_movement_t.c.timestamp))).scalar()
+    if first is None:
+        return []
+    have = set(db.session.execute(select(_snapshot_t.c.day).distinct()).scalars())
+    taken = []
+    day = month_end(first.date())
+    while day <= up_to:
+        if day not in have and take_snapshot(day, replace=False):   # each builds on the one before it
+            taken.append(day)
+        day = month_end(day + timedelta(days=1))
+    return taken
+
+
+# ── movement report ──────────────────────────────────────────────────
+@dataclass
+class MovementFilter:
+    product_id: Optional[int] = None
+    reason: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    limit: int = DEFAULT_PAGE_SIZE
+
+    @classmethod
+    def from_args(cls, args):
+        try:
+            start = parse_date(args.get('start'))
+            end = parse_date(args.get('end'))
+            product_id = parse_int(args.get('product_id'))
+            limit = parse_int(args.get('limit')) or DEFAULT_PAGE_SIZE
+        except ValueError as e:
+            raise BadFilter(str(e))
+        if start and end and start > end:
+            start, end = end, start
+        reason = args.get('reason') or None
+        if reason is not None and reason not in stock.REASONS:
+            raise BadFilter(f'unknown reason {reason!r}')
+        return cls(product_id=product_id, reason=reason, start=start, end=end,
+                   limit=max(1, min(limit, MAX_PAGE_SIZE)))
+
+    def as_args(self):
+        """Query-string args that reproduce this filter (for pager links)."""
+        args = {}
+        for key in ('product_id', 'reason'):
+            value = getattr(self, key)
+            if value is not None:
+                args[key] = value
+        if self.start:
+            args['start'] = self.start.isoformat()
+        if self.end:
+            args['end'] = self.end.isoformat()
+        if self.limit != DEFAULT_PAGE_SIZE:
+            args['limit'] = self.limit
+        return args
+
+
+def encode_cursor(timestamp, movement_id):
+    raw = f'{timestamp.isoformat()}|{movement_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ts, movement_id = raw.split('|')
+        return datetime.fromisoformat(ts), int(movement_id)
+    except (ValueError, UnicodeDecodeError):
+        raise BadFilter('invalid cursor')
+
+
+def page(filters, cursor=None):
+    """Return ``(movements, next_cursor)``, oldest first."""
+    stmt = select(StockMovement)
+    if filters.product_id is not None:
+        stmt = stmt.where(StockMovement.product_id == filters.product_id)
+    if filters.reason is not None:
+        stmt = stmt.where(StockMovement.reason == filters.reason)
+    if filters.start:
+        stmt = stmt.where(StockMovement.timestamp >= datetime.combine(filters.start, datetime.min.time()))
+    if filters.end:
+        stmt = stmt.where(StockMovement.timestamp < _day_end(filters.end))
+    if cursor:
+        stmt = stmt.where(tuple_(StockMovement.timestamp, StockMovement.id) > decode_cursor(cursor))
+    stmt = stmt.order_by(StockMovement.timestamp, StockMovement.id)
+
+    rows = db.session.execute(stmt.limit(filters.limit + 1)).scalars().all()
+    next_cursor = None
+    if len(rows) > filters.limit:
+        rows = rows[:filters.limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+
+def balances(filters):
+    """Opening / closing stock of the filtered product over the report range."""
+    if filters.product_id is None:
+        return None
+    opening_at = datetime.combine(filters.start, datetime.min.time()) if filters.start else datetime.min
+    closing_at = _day_end(filters.end) if filters.end else datetime.max
+    return {
+        'opening': product_qty_at(filters.product_id, opening_at) if filters.start else None,
+        'closing': product_qty_at(filters.product_id, closing_at),
+    }